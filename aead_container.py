@@ -0,0 +1,351 @@
+"""
+加密镜像容器模块
+以二进制 AES-GCM 分帧格式代替整体 Fernet 令牌：文件头描述密钥派生参数和分帧大小，
+每帧独立加密和认证，可以边读边解密，也可以按序号随机读取单帧
+仍可读取旧版 Fernet 格式的 .enc.gz 文件（按文件开头自动识别）
+
+文件格式:
+    头部: [魔数 4字节 'AMGC'][版本 1字节][加密等级 1字节][盐 16字节][随机数前缀 4字节][分帧大小 4字节]
+    帧:   [长度 4字节，最高位表示最后一帧][密文 + 16字节认证标签]
+每帧的随机数为 前缀 + 8字节帧序号，附加认证数据为 头部 + 最后一帧标记，防止帧被重排、替换或截断
+
+用法:
+    python aead_container.py --bench [mirror_file.gz]
+"""
+
+import io
+import os
+import sys
+import time
+import gzip
+import json
+import base64
+import struct
+import argparse
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+MAGIC = b'AMGC'
+VERSION = 1
+HEADER = struct.Struct('>4sBB16s4sI')
+FRAME_LENGTH = struct.Struct('>I')
+FINAL_FLAG = 0x80000000
+TAG_SIZE = 16
+DEFAULT_FRAME_SIZE = 256 * 1024  # 每帧明文大小
+LEGACY_PREFIX = b'gAAAAA'  # Fernet 令牌（版本字节 0x80 的 base64）开头
+LEGACY_SALT = b'mouse_recorder_salt'  # 旧格式使用的固定盐值
+
+# 加密等级对应的 PBKDF2 迭代次数
+ITERATIONS = {
+    1: 100000,    # 基础加密
+    2: 200000,    # 中等加密
+    3: 400000     # 高强度加密
+}
+
+class ContainerError(Exception):
+    """容器格式或认证错误"""
+    pass
+
+def derive_key(password: str, level: int, salt: bytes) -> bytes:
+    """根据密码、加密等级和盐派生 32 字节密钥"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=ITERATIONS.get(level, ITERATIONS[1]),
+    )
+    return kdf.derive(password.encode())
+
+def is_container(data: bytes) -> bool:
+    """判断数据是否为分帧容器"""
+    return data[:len(MAGIC)] == MAGIC
+
+def is_legacy(data: bytes) -> bool:
+    """判断数据是否为旧版 Fernet 令牌"""
+    return data[:len(LEGACY_PREFIX)] == LEGACY_PREFIX
+
+class _Header:
+    """解析后的文件头"""
+    def __init__(self, raw: bytes):
+        magic, version, level, salt, nonce_prefix, frame_size = HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ContainerError("不是加密镜像容器")
+        if version != VERSION:
+            raise ContainerError(f"不支持的容器版本: {version}")
+        self.raw = raw
+        self.level = level
+        self.salt = salt
+        self.nonce_prefix = nonce_prefix
+        self.frame_size = frame_size
+
+    def nonce(self, index: int) -> bytes:
+        return self.nonce_prefix + index.to_bytes(8, 'big')
+
+    def aad(self, final: bool) -> bytes:
+        return self.raw + (b'\x01' if final else b'\x00')
+
+class AeadWriter:
+    """
+    分帧加密写入器
+    数据按分帧大小缓冲，满一帧即加密写出，close 时写出最后一帧
+    """
+    def __init__(self, fileobj: BinaryIO, password: str, level: int = 1,
+                 frame_size: int = DEFAULT_FRAME_SIZE, key: Optional[bytes] = None,
+                 salt: Optional[bytes] = None):
+        """
+        Args:
+            fileobj: 输出文件对象
+            password: 加密密码
+            level: 加密等级(1-3)，决定密钥派生迭代次数
+            frame_size: 每帧明文大小
+            key, salt: 已派生的密钥和对应的盐（批量加密时复用，避免重复派生）
+        """
+        if key is None:
+            salt = os.urandom(16)
+            key = derive_key(password, level, salt)
+        elif salt is None:
+            raise ValueError("提供密钥时必须同时提供派生该密钥的盐")
+        self.fileobj = fileobj
+        self.frame_size = frame_size
+        self.header = _Header(HEADER.pack(MAGIC, VERSION, level, salt, os.urandom(4), frame_size))
+        self.aead = AESGCM(key)
+        self.index = 0
+        self.buffer = bytearray()
+        self.closed = False
+        fileobj.write(self.header.raw)
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        while len(self.buffer) > self.frame_size:
+            # 保留至少一个字节到 close，保证最后一帧非空且带有结束标记
+            self._emit(bytes(self.buffer[:self.frame_size]), final=False)
+            del self.buffer[:self.frame_size]
+
+    def close(self) -> None:
+        if not self.closed:
+            self._emit(bytes(self.buffer), final=True)
+            self.buffer = bytearray()
+            self.closed = True
+
+    def _emit(self, plain: bytes, final: bool) -> None:
+        header = self.header
+        ciphertext = self.aead.encrypt(header.nonce(self.index), plain, header.aad(final))
+        self.fileobj.write(FRAME_LENGTH.pack(len(ciphertext) | (FINAL_FLAG if final else 0)))
+        self.fileobj.write(ciphertext)
+        self.index += 1
+
+    def __enter__(self) -> 'AeadWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+
+class _ByteStream:
+    """从数据块迭代器中按长度读取字节"""
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.buffer = bytearray()
+
+    def read(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+def iter_decrypt(chunks: Iterable[bytes], password: str) -> Iterator[bytes]:
+    """
+    流式解密分帧容器，每认证通过一帧就产出该帧明文
+
+    Args:
+        chunks: 密文数据块迭代器
+        password: 密码
+    """
+    stream = _ByteStream(chunks)
+    raw = stream.read(HEADER.size)
+    if len(raw) != HEADER.size:
+        raise ContainerError("文件头不完整")
+    header = _Header(raw)
+    aead = AESGCM(derive_key(password, header.level, header.salt))
+    index = 0
+    while True:
+        prefix = stream.read(FRAME_LENGTH.size)
+        if len(prefix) != FRAME_LENGTH.size:
+            raise ContainerError("文件被截断: 缺少最后一帧")
+        length = FRAME_LENGTH.unpack(prefix)[0]
+        final = bool(length & FINAL_FLAG)
+        length &= ~FINAL_FLAG
+        if length > header.frame_size + TAG_SIZE:
+            raise ContainerError(f"第 {index} 帧长度异常: {length}")
+        ciphertext = stream.read(length)
+        if len(ciphertext) != length:
+            raise ContainerError("文件被截断")
+        yield _open_frame(aead, header, index, ciphertext, final)
+        if final:
+            return
+        index += 1
+
+def _open_frame(aead: AESGCM, header: _Header, index: int, ciphertext: bytes, final: bool) -> bytes:
+    try:
+        return aead.decrypt(header.nonce(index), ciphertext, header.aad(final))
+    except Exception:
+        raise ContainerError(f"第 {index} 帧认证失败: 密码错误或数据被篡改")
+
+class AeadReader:
+    """
+    分帧容器随机读取器
+    除最后一帧外每帧长度固定，可直接定位并单独解密任意一帧
+    """
+    def __init__(self, fileobj: BinaryIO, password: str):
+        self.fileobj = fileobj
+        fileobj.seek(0)
+        self.header = _Header(fileobj.read(HEADER.size))
+        self.aead = AESGCM(derive_key(password, self.header.level, self.header.salt))
+        self.frame_stride = FRAME_LENGTH.size + self.header.frame_size + TAG_SIZE
+        size = fileobj.seek(0, os.SEEK_END)
+        self.frame_count = max(-(-(size - HEADER.size) // self.frame_stride), 0)
+
+    def read_frame(self, index: int) -> bytes:
+        """解密并认证第 index 帧"""
+        if not 0 <= index < self.frame_count:
+            raise IndexError(index)
+        self.fileobj.seek(HEADER.size + index * self.frame_stride)
+        length = FRAME_LENGTH.unpack(self.fileobj.read(FRAME_LENGTH.size))[0]
+        final = bool(length & FINAL_FLAG)
+        if final != (index == self.frame_count - 1):
+            raise ContainerError(f"第 {index} 帧结束标记与文件长度不一致")
+        ciphertext = self.fileobj.read(length & ~FINAL_FLAG)
+        return _open_frame(self.aead, self.header, index, ciphertext, final)
+
+def encrypt_bytes(data: bytes, password: str, level: int = 1, frame_size: int = DEFAULT_FRAME_SIZE) -> bytes:
+    """把数据加密为分帧容器"""
+    output = io.BytesIO()
+    with AeadWriter(output, password, level, frame_size) as writer:
+        writer.write(data)
+    return output.getvalue()
+
+def legacy_decrypt(data: bytes, password: str, level: int = 1) -> bytes:
+    """解密旧版 Fernet 令牌（固定盐，等级不记录在文件中）"""
+    key = base64.urlsafe_b64encode(derive_key(password, level, LEGACY_SALT))
+    return Fernet(key).decrypt(data)
+
+def legacy_encrypt(data: bytes, password: str, level: int = 1) -> bytes:
+    """生成旧版 Fernet 令牌（仅用于兼容测试和性能对比）"""
+    key = base64.urlsafe_b64encode(derive_key(password, level, LEGACY_SALT))
+    return Fernet(key).encrypt(data)
+
+def decrypt_bytes(data: bytes, password: str, level: int = 1) -> bytes:
+    """解密数据，自动识别分帧容器和旧版 Fernet 令牌"""
+    if is_container(data):
+        return b''.join(iter_decrypt([data], password))
+    if is_legacy(data):
+        return legacy_decrypt(data, password, level)
+    raise ContainerError("无法识别的加密格式")
+
+class Decryptor:
+    """
+    解密器
+    可作为 decrypt(data) 整体解密函数使用，也提供 stream(chunks) 供流式解码管道逐帧解密
+    """
+    def __init__(self, password: str, level: int = 1):
+        self.password = password
+        self.level = level  # 仅旧格式需要，新格式的等级记录在文件头中
+
+    def __call__(self, data: bytes) -> bytes:
+        return decrypt_bytes(data, self.password, self.level)
+
+    def stream(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        iterator = iter(chunks)
+        first = next(iterator, b'')
+        if is_container(first):
+            yield from iter_decrypt(_prepend(first, iterator), self.password)
+        else:
+            # 旧版 Fernet 令牌只能整体认证，需要先收集完整密文
+            yield legacy_decrypt(first + b''.join(iterator), self.password, self.level)
+
+def _prepend(first: bytes, rest: Iterator[bytes]) -> Iterator[bytes]:
+    yield first
+    yield from rest
+
+def _bench_payload(path: Optional[str]) -> Tuple[str, bytes]:
+    """读取基准测试数据，未指定文件时生成约 3MB 的模拟镜像"""
+    if path:
+        with open(path, 'rb') as f:
+            return path, f.read()
+    events = [
+        {'type': 'move', 'position': [i % 1920, (i * 7) % 1080], 'timestamp': i * 0.008, 'params': None}
+        for i in range(400000)
+    ]
+    data = json.dumps({'username': 'bench', 'events': events}, ensure_ascii=False).encode('utf-8')
+    return '模拟镜像', gzip.compress(data, compresslevel=6)
+
+def run_benchmark(path: Optional[str] = None, password: str = 'benchmark', level: int = 1, rounds: int = 3) -> None:
+    """对比 Fernet 与分帧 AES-GCM 的文件大小和吞吐量（不含密钥派生耗时）"""
+    name, payload = _bench_payload(path)
+    size_mb = len(payload) / 1024 / 1024
+    print(f"数据: {name}，{size_mb:.2f}MB，{rounds} 轮取最快")
+
+    start = time.perf_counter()
+    key = derive_key(password, level, LEGACY_SALT)
+    print(f"密钥派生 (等级 {level}): {(time.perf_counter() - start) * 1000:.0f}ms（两种格式相同，以下不计入）")
+
+    fernet = Fernet(base64.urlsafe_b64encode(key))
+    salt = LEGACY_SALT
+
+    def encrypt_aead() -> bytes:
+        output = io.BytesIO()
+        with AeadWriter(output, password, level, key=key, salt=salt) as writer:
+            writer.write(payload)
+        return output.getvalue()
+
+    def decrypt_aead(data: bytes) -> bytes:
+        header = _Header(data[:HEADER.size])
+        aead = AESGCM(key)
+        plain, offset, index = [], HEADER.size, 0
+        while offset < len(data):
+            length = FRAME_LENGTH.unpack_from(data, offset)[0]
+            final = bool(length & FINAL_FLAG)
+            length &= ~FINAL_FLAG
+            offset += FRAME_LENGTH.size
+            plain.append(_open_frame(aead, header, index, data[offset:offset + length], final))
+            offset += length
+            index += 1
+        return b''.join(plain)
+
+    cases = (
+        ('Fernet', lambda: fernet.encrypt(payload), fernet.decrypt),
+        ('AES-GCM 分帧', encrypt_aead, decrypt_aead),
+    )
+    for label, encrypt, decrypt in cases:
+        encrypt_time = decrypt_time = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            token = encrypt()
+            encrypt_time = min(encrypt_time, time.perf_counter() - start)
+            start = time.perf_counter()
+            plain = decrypt(token)
+            decrypt_time = min(decrypt_time, time.perf_counter() - start)
+        assert plain == payload
+        overhead = (len(token) / len(payload) - 1) * 100
+        print(
+            f"{label:<12} 大小 {len(token) / 1024 / 1024:7.2f}MB (+{overhead:.1f}%)  "
+            f"加密 {size_mb / encrypt_time:8.1f}MB/s  解密 {size_mb / decrypt_time:8.1f}MB/s"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='加密镜像容器工具')
+    parser.add_argument('--bench', nargs='?', const='', metavar='FILE', help='与 Fernet 格式进行性能对比')
+    parser.add_argument('--level', type=int, default=1, choices=(1, 2, 3), help='加密等级')
+    args = parser.parse_args()
+
+    if args.bench is None:
+        parser.print_help()
+        sys.exit(1)
+    run_benchmark(args.bench or None, level=args.level)
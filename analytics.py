@@ -0,0 +1,185 @@
+"""
+行为特征分析模块
+对每个记录文件的列式数组做向量化计算，提取速度、加速度、急动度分布、路径效率、
+停顿、点击频率和点击前停留时间等特征，并使用进程池批量处理整个目录
+"""
+
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+from record_loader import load_columns, iter_recording_files, MOVE, PRESS, SCROLL_UP, SCROLL_DOWN, IDLE
+from log_config import get_logger, setup_logging
+
+logger = get_logger('analytics')
+
+PAUSE_THRESHOLD = 0.5  # 视为停顿的最小事件间隔(秒)
+MIN_DT = 1e-3  # 计算速度时的最小时间差(秒)，避免除零
+
+def _distribution(prefix: str, values: np.ndarray) -> Dict[str, float]:
+    """计算分布统计量"""
+    if values.size == 0:
+        return {f'{prefix}_{name}': np.nan for name in ('mean', 'p50', 'p90', 'p99', 'max')}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        f'{prefix}_mean': float(values.mean()),
+        f'{prefix}_p50': float(p50),
+        f'{prefix}_p90': float(p90),
+        f'{prefix}_p99': float(p99),
+        f'{prefix}_max': float(values.max())
+    }
+
+def session_features(columns: Dict[str, Any], pause_threshold: float = PAUSE_THRESHOLD) -> Dict[str, float]:
+    """
+    计算单个会话的行为特征
+
+    Args:
+        columns: record_loader.to_columns 返回的列式数据
+        pause_threshold: 停顿判定阈值(秒)
+
+    Returns:
+        特征字典
+    """
+    # 空闲标记不是真实输入，不计入事件数，也不参与速度和停顿计算
+    keep = columns['code'] != IDLE
+    t, x, y, code = columns['t'][keep], columns['x'][keep], columns['y'][keep], columns['code'][keep]
+    count = t.size
+    duration = float(t[-1]) if count else 0.0
+    presses = code == PRESS
+
+    features = {
+        'event_count': count,
+        'duration': duration,
+        'move_count': int(np.count_nonzero(code == MOVE)),
+        'click_count': int(np.count_nonzero(presses)),
+        'scroll_count': int(np.count_nonzero((code == SCROLL_UP) | (code == SCROLL_DOWN))),
+        'click_rate_per_min': float(np.count_nonzero(presses) / duration * 60) if duration > 0 else 0.0,
+    }
+
+    # 速度、加速度、急动度
+    dt = np.diff(t)
+    dist = np.hypot(np.diff(x), np.diff(y))
+    valid = dt >= MIN_DT
+    speed = dist[valid] / dt[valid]
+    t_speed = t[1:][valid]
+    accel = np.diff(speed) / np.maximum(np.diff(t_speed), MIN_DT)
+    jerk = np.diff(accel) / np.maximum(np.diff(t_speed[1:]), MIN_DT)
+    features.update(_distribution('speed', speed))
+    features.update(_distribution('accel', np.abs(accel)))
+    features.update(_distribution('jerk', np.abs(jerk)))
+
+    # 路径效率：相邻点击之间直线距离与实际路径长度之比
+    path_length = float(dist.sum())
+    features['path_length'] = path_length
+    cumulative = np.concatenate(([0.0], np.cumsum(dist)))
+    anchors = np.flatnonzero(presses)
+    if count:
+        anchors = np.unique(np.concatenate(([0], anchors, [count - 1])))
+    if anchors.size >= 2:
+        travelled = np.diff(cumulative[anchors])
+        straight = np.hypot(np.diff(x[anchors]), np.diff(y[anchors]))
+        moved = travelled > 0
+        efficiency = straight[moved] / travelled[moved]
+        features['path_efficiency'] = float(efficiency.mean()) if efficiency.size else np.nan
+    else:
+        features['path_efficiency'] = np.nan
+
+    # 停顿
+    pauses = dt[dt >= pause_threshold]
+    features['pause_count'] = int(pauses.size)
+    features['pause_total'] = float(pauses.sum())
+    features.update(_distribution('pause', pauses))
+
+    # 点击前停留时间：点击时刻与之前最后一次位置变化的时间差
+    moved_times = t[1:][dist > 0]
+    press_times = t[presses]
+    if moved_times.size and press_times.size:
+        index = np.searchsorted(moved_times, press_times, side='right') - 1
+        has_move = index >= 0
+        dwell = press_times[has_move] - moved_times[index[has_move]]
+    else:
+        dwell = np.empty(0)
+    features.update(_distribution('dwell', dwell))
+
+    return features
+
+def analyze_file(path: str) -> Optional[Dict[str, Any]]:
+    """
+    分析单个文件（在工作进程中执行）
+
+    Returns:
+        特征行，失败返回 None
+    """
+    try:
+        columns = load_columns(path)
+        row = {
+            'file': path,
+            'username': columns.get('username'),
+            'start_time': (
+                datetime.fromtimestamp(columns['base_time']).isoformat()
+                if columns['base_time'] is not None else None
+            )
+        }
+        row.update(session_features(columns))
+        return row
+    except Exception as e:
+        logger.error(f"分析文件 {path} 时发生错误: {str(e)}")
+        return None
+
+def analyze_tree(root: str, workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    使用进程池分析目录下的所有记录文件
+
+    Args:
+        root: mouse_records/ 或 mouse_mirrors/ 目录
+        workers: 工作进程数，默认为CPU核数
+
+    Returns:
+        特征表（每个文件一行）
+    """
+    paths = [p for p in iter_recording_files(root) if not p.endswith('.enc.gz')]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(analyze_file, path) for path in paths]
+        for future in as_completed(futures):
+            row = future.result()
+            if row is not None:
+                rows.append(row)
+    rows.sort(key=lambda row: row['file'])
+    logger.info(f"已分析 {len(rows)}/{len(paths)} 个文件: {root}")
+    return rows
+
+def write_table(rows: List[Dict[str, Any]], output: str) -> None:
+    """将特征表写入CSV"""
+    if not rows:
+        logger.warning("没有特征数据可供写出")
+        return
+    fieldnames = list(rows[0].keys())
+    for row in rows[1:]:
+        fieldnames.extend(key for key in row if key not in fieldnames)
+    with open(output, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='批量提取鼠标行为特征')
+    parser.add_argument('roots', nargs='+', help='mouse_records/ 或 mouse_mirrors/ 目录')
+    parser.add_argument('-o', '--output', default='features.csv', help='输出CSV文件')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数')
+    args = parser.parse_args()
+
+    all_rows = []
+    for root in args.roots:
+        if not os.path.isdir(root):
+            print(f"目录不存在: {root}")
+            sys.exit(1)
+        all_rows.extend(analyze_tree(root, args.workers))
+
+    write_table(all_rows, args.output)
+    print(f"已写出 {len(all_rows)} 行特征到: {args.output}")
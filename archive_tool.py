@@ -0,0 +1,471 @@
+"""
+归档批量转码工具
+在进程池中并行执行 解码 -> 校验 -> 重新编码，用于批量迁移记录和镜像文件的压缩级别、
+编码格式或加密密码（密钥轮换）。输出先写临时文件再原子替换，处理结果写入日志文件，
+中断后重新运行会跳过已完成的文件，结束时输出汇总报告
+
+用法:
+    python archive_tool.py --compress-level 9
+    python archive_tool.py --codec aead --password 旧密码 --new-password 新密码 --encryption-level 2
+    python archive_tool.py --codec aead --password 密码 --source-encryption-level 1 --encryption-level 2
+    python archive_tool.py mouse_mirrors --verify-only -u 张三 --since 2024-01-01
+"""
+
+import io
+import os
+import sys
+import json
+import gzip
+import time
+import hashlib
+import argparse
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from aead_container import AeadWriter, Decryptor, is_container, is_legacy
+from record_loader import iter_recording_files, mirror_file_id
+from exporter import parse_filename
+from log_config import get_logger, setup_logging
+
+logger = get_logger('archive')
+
+CODECS = ('keep', 'gzip', 'aead')
+JOURNAL_FILE = 'archive_journal.jsonl'
+REPORT_DIR = 'logs'
+
+# ---- 工作进程 ----
+
+def content_digest(data: Dict[str, Any]) -> str:
+    """内容校验和：规范化 JSON 的 SHA-256，与压缩、加密方式无关"""
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def decode_archive(raw: bytes, path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """解码记录或镜像文件内容"""
+    if path.endswith('.json'):
+        return json.loads(raw.decode('utf-8'))
+    if path.endswith('.enc.gz'):
+        if not options.get('password'):
+            raise ValueError("加密文件需要提供 --password")
+        # 源文件等级只用于旧版 Fernet 格式，新格式的等级记录在文件头中
+        level = options.get('source_encryption_level') or options['encryption_level']
+        raw = Decryptor(options['password'], level)(raw)
+    return json.loads(gzip.decompress(raw).decode('utf-8'))
+
+def verify_data(data: Dict[str, Any]) -> int:
+    """
+    校验文件结构
+
+    Returns:
+        事件数
+    """
+    events = data.get('events')
+    if not isinstance(events, list):
+        raise ValueError("缺少事件列表")
+    if 'event_count' in data and data['event_count'] != len(events):
+        raise ValueError(f"事件数不一致: 声明 {data['event_count']}，实际 {len(events)}")
+    for index, event in enumerate(events):
+        if not isinstance(event, dict) or 'type' not in event or 'timestamp' not in event \
+                or len(event.get('position') or ()) != 2:
+            raise ValueError(f"第 {index} 个事件格式错误")
+    return len(events)
+
+def encode_archive(data: Dict[str, Any], path: str, encrypted: bool, options: Dict[str, Any]) -> bytes:
+    """按目标选项重新编码"""
+    if path.endswith('.json'):
+        if options.get('compact_records'):
+            return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+    # 与 MouseMirror.save_mirror 相同的序列化方式
+    payload = gzip.compress(
+        json.dumps(data, ensure_ascii=False).encode('utf-8'),
+        compresslevel=options['compress_level']
+    )
+    if not encrypted:
+        return payload
+    password = options.get('new_password') or options['password']
+    # 每个文件使用新的随机盐派生密钥：同一密钥下帧随机数只有 32 位随机前缀，跨文件复用密钥会导致 GCM 随机数碰撞
+    output = io.BytesIO()
+    with AeadWriter(output, password, options['encryption_level']) as writer:
+        writer.write(payload)
+    return output.getvalue()
+
+def _target_path(path: str, encrypted: bool, output_dir: Optional[str], root: str) -> str:
+    """生成输出路径（镜像加密状态改变时扩展名随之改变）"""
+    if path.endswith('.gz'):
+        base = path[:-len('.enc.gz')] if path.endswith('.enc.gz') else path[:-len('.gz')]
+        path = base + ('.enc.gz' if encrypted else '.gz')
+    if output_dir:
+        path = os.path.join(output_dir, os.path.relpath(path, root))
+    return path
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """写临时文件并刷新到磁盘后原子替换"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f'.{os.path.basename(path)}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def process_file(path: str, root: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    处理单个文件（在工作进程中执行）：解码、校验、重新编码、回读校验、原子写入
+
+    Returns:
+        处理结果
+    """
+    start = time.perf_counter()
+    result: Dict[str, Any] = {'path': path, 'target': path, 'status': 'failed'}
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        result['source_size'] = len(raw)
+        result['source_sha256'] = hashlib.sha256(raw).hexdigest()
+        if path.endswith('.enc.gz'):
+            result['source_format'] = 'aead' if is_container(raw) else 'fernet' if is_legacy(raw) else 'unknown'
+
+        data = decode_archive(raw, path, options)
+        result['events'] = verify_data(data)
+        digest = content_digest(data)
+        result['content_sha256'] = digest
+
+        if options['verify_only'] or (path.endswith('.json') and not options.get('compact_records')):
+            result.update(status='verified', target_size=len(raw), target_sha256=result['source_sha256'])
+            return result
+
+        codec = options['codec']
+        encrypted = path.endswith('.enc.gz') if codec == 'keep' else codec == 'aead'
+        if path.endswith('.json'):
+            encrypted = False
+        encoded = encode_archive(data, path, encrypted, options)
+
+        # 回读校验：新文件解码后的内容校验和必须与原文件一致
+        target = _target_path(path, encrypted, options.get('output_dir'), root)
+        verify_options = dict(
+            options,
+            password=options.get('new_password') or options.get('password'),
+            source_encryption_level=options['encryption_level']
+        )
+        if content_digest(decode_archive(encoded, target, verify_options)) != digest:
+            raise ValueError("重新编码后内容校验和不一致")
+
+        _write_atomic(target, encoded)
+        if target != path and not options.get('output_dir'):
+            os.remove(path)  # 扩展名改变时删除原文件
+        stat = os.stat(target)
+        result.update(
+            status='converted', target=target, target_size=len(encoded),
+            target_sha256=hashlib.sha256(encoded).hexdigest(),
+            target_mtime_ns=stat.st_mtime_ns, encrypted=encrypted
+        )
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        result['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+# ---- 主进程 ----
+
+def options_fingerprint(options: Dict[str, Any]) -> str:
+    """目标选项指纹，选项改变后日志中的记录不再视为已完成（密码只参与哈希）"""
+    relevant = {
+        key: options.get(key)
+        for key in ('codec', 'compress_level', 'encryption_level', 'compact_records', 'verify_only', 'output_dir')
+    }
+    relevant['new_password'] = hashlib.sha256((options.get('new_password') or '').encode()).hexdigest()
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode()).hexdigest()[:16]
+
+def load_journal(path: str, fingerprint: str) -> Dict[str, Dict[str, Any]]:
+    """
+    读取处理日志
+
+    Returns:
+        源文件 -> 最近一次成功处理的结果（含输出文件及其大小、修改时间）；
+        原地转换且扩展名改变时，输出文件同样映射到该结果，续传时不会被当作新的源文件
+    """
+    done: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # 中断时可能留下不完整的最后一行
+            if entry.get('fingerprint') == fingerprint and entry.get('status') in ('converted', 'verified'):
+                done[entry['path']] = entry
+    for entry in list(done.values()):
+        if entry['target'] != entry['path']:
+            done.setdefault(entry['target'], entry)
+    return done
+
+def _is_done(path: str, done: Dict[str, Dict[str, Any]]) -> bool:
+    """源文件在日志中，且对应的输出文件存在、大小和修改时间未变，视为已完成"""
+    entry = done.get(path)
+    if entry is None:
+        return False
+    try:
+        stat = os.stat(entry['target'])
+    except OSError:
+        return False
+    mtime_ns = entry.get('target_mtime_ns')
+    return stat.st_size == entry.get('target_size') and (mtime_ns is None or stat.st_mtime_ns == mtime_ns)
+
+def select_archives(
+    roots: Iterable[str],
+    users: Optional[Iterable[str]] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None
+) -> List[Tuple[str, str]]:
+    """
+    按用户和日期筛选记录和镜像文件（含加密镜像）
+
+    Returns:
+        (文件路径, 所属根目录) 列表
+    """
+    users = set(users) if users else None
+    selected = []
+    for root in roots:
+        for path in iter_recording_files(root):
+            username, day = parse_filename(path)
+            if users and username not in users:
+                continue
+            if (since or until) and day is None:
+                continue
+            if (since and day < since) or (until and day > until):
+                continue
+            selected.append((path, root))
+    return selected
+
+def _encrypted_users(files: List[Tuple[str, str]], options: Dict[str, Any]) -> Dict[str, List[str]]:
+    """按用户分组所选文件中处理后为加密镜像的文件"""
+    users: Dict[str, List[str]] = {}
+    for path, _ in files:
+        if path.endswith('.enc.gz') or (options['codec'] == 'aead' and path.endswith('.gz')):
+            username, _ = parse_filename(path)
+            users.setdefault(username, []).append(path)
+    return users
+
+def check_rotation(files: List[Tuple[str, str]], options: Dict[str, Any]) -> List[str]:
+    """
+    密钥轮换前检查：每个加密镜像的所属用户都必须是加密账号，且原密码（或续传时的新密码）能通过验证；
+    用户已登记密钥的每个文件都必须在所选文件中，否则修改账号密码后未重新加密的文件在应用中将无法回放
+
+    Returns:
+        问题列表，为空表示可以轮换
+    """
+    from auth_manager import auth_manager
+    problems = []
+    for username, paths in _encrypted_users(files, options).items():
+        if not username:
+            problems.append("存在无法识别所属用户的加密镜像")
+            continue
+        if not (auth_manager.verify_encryption_user(username, options.get('password') or '')
+                or auth_manager.verify_encryption_user(username, options['new_password'])):
+            problems.append(f"用户 {username} 的加密账号无法用 --password 或 --new-password 验证")
+        selected = {mirror_file_id(path) for path in paths}
+        missing = [file_id for file_id in auth_manager.list_encryption_keys(username) if file_id not in selected]
+        if missing:
+            problems.append(
+                f"用户 {username} 有 {len(missing)} 个已登记的加密镜像不在所选目录中（如 {missing[0]}），"
+                f"请指定包含全部镜像的目录"
+            )
+    return problems
+
+def rotate_keys(files: List[Tuple[str, str]], done: Dict[str, Dict[str, Any]], options: Dict[str, Any]) -> int:
+    """
+    根据处理日志完成密钥轮换：用户在所选根目录下的全部加密镜像都已用新密码重新加密后，
+    一次性修改该用户的账号密码并更新文件密钥（包括之前中断的运行中已完成的文件）
+
+    Args:
+        files: 本次选中的 (文件路径, 根目录) 列表
+        done: load_journal 读取的处理结果
+        options: 处理选项
+
+    Returns:
+        登记的新密钥数
+    """
+    from auth_manager import auth_manager
+    new_password = options['new_password']
+    rotated = 0
+    # 重新扫描根目录，只处理了部分文件的用户不修改密码
+    roots = sorted({root for _, root in files})
+    users = [username for username in _encrypted_users(files, options) if username]
+    for username, paths in _encrypted_users(select_archives(roots, users), options).items():
+        missing = [path for path in paths if not (path in done and done[path].get('encrypted'))]
+        if missing:
+            logger.warning(
+                f"用户 {username} 还有 {len(missing)} 个加密镜像未完成重新加密，"
+                f"暂不修改账号密码，请重新运行以续传"
+            )
+            continue
+        file_ids = sorted({mirror_file_id(done[path]['target']) for path in paths})
+        if auth_manager.verify_encryption_user(username, new_password):
+            # 上次运行已修改密码，只补登记密钥
+            changed = all(auth_manager.store_encryption_key(username, file_id, new_password) for file_id in file_ids)
+        else:
+            changed = auth_manager.change_password(username, options.get('password') or '', new_password, file_ids)
+        if changed:
+            rotated += len(file_ids)
+        else:
+            logger.error(f"无法为用户 {username} 修改密码并登记新密钥")
+    return rotated
+
+def run(
+    files: List[Tuple[str, str]],
+    options: Dict[str, Any],
+    workers: Optional[int] = None,
+    journal_path: str = JOURNAL_FILE,
+    progress: bool = True
+) -> Dict[str, Any]:
+    """
+    并行处理文件
+
+    Args:
+        files: (文件路径, 根目录) 列表
+        options: 处理选项
+        workers: 工作进程数，默认使用全部 CPU
+        journal_path: 处理日志路径，用于中断后续传
+        progress: 是否打印进度
+
+    Returns:
+        汇总报告
+    """
+    if options.get('new_password') and not options.get('verify_only') and not options.get('output_dir'):
+        problems = check_rotation(files, options)
+        if problems:
+            raise ValueError('无法进行密钥轮换: ' + '；'.join(problems))
+    fingerprint = options_fingerprint(options)
+    done = load_journal(journal_path, fingerprint)
+    pending = [(path, root) for path, root in files if not _is_done(path, done)]
+    skipped = len(files) - len(pending)
+    workers = workers or os.cpu_count() or 1
+
+    results: List[Dict[str, Any]] = []
+    start = time.perf_counter()
+    with open(journal_path, 'a', encoding='utf-8') as journal, ProcessPoolExecutor(max_workers=workers) as executor:
+        queue = iter(pending)
+        running = set()
+        # 限制在途任务数，避免一次提交全部文件占用大量内存
+        for path, root in queue:
+            running.add(executor.submit(process_file, path, root, options))
+            if len(running) >= workers * 4:
+                break
+        while running:
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                result['fingerprint'] = fingerprint
+                results.append(result)
+                journal.write(json.dumps(result, ensure_ascii=False) + '\n')
+                journal.flush()
+                if result['status'] == 'failed':
+                    logger.error(f"处理文件 {result['path']} 失败: {result.get('error')}")
+                if progress:
+                    print(f"[{len(results)}/{len(pending)}] {result['status']:<9} {result['target']}")
+                next_item = next(queue, None)
+                if next_item:
+                    running.add(executor.submit(process_file, next_item[0], next_item[1], options))
+
+    rotated = 0
+    if options.get('new_password') and not options.get('verify_only'):
+        if options.get('output_dir'):
+            logger.info("输出到其他目录时不修改账号密码，原目录中的镜像仍使用原密码")
+        else:
+            rotated = rotate_keys(files, load_journal(journal_path, fingerprint), options)
+    return build_report(results, skipped, rotated, time.perf_counter() - start, workers)
+
+def build_report(results: List[Dict[str, Any]], skipped: int, rotated: int, elapsed: float, workers: int) -> Dict[str, Any]:
+    """生成汇总报告"""
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    ok = [r for r in results if r['status'] != 'failed']
+    source_bytes = sum(r.get('source_size', 0) for r in ok)
+    target_bytes = sum(r.get('target_size', 0) for r in ok)
+    return {
+        'finished_at': datetime.now().isoformat(),
+        'workers': workers,
+        'files': len(results) + skipped,
+        'skipped': skipped,
+        'counts': counts,
+        'events': sum(r.get('events', 0) for r in ok),
+        'source_bytes': source_bytes,
+        'target_bytes': target_bytes,
+        'size_ratio': round(target_bytes / source_bytes, 4) if source_bytes else None,
+        'legacy_fernet': sum(1 for r in ok if r.get('source_format') == 'fernet'),
+        'keys_rotated': rotated,
+        'elapsed': round(elapsed, 3),
+        'throughput_mb_s': round(source_bytes / 1024 / 1024 / elapsed, 2) if elapsed else None,
+        'failures': [{'path': r['path'], 'error': r.get('error')} for r in results if r['status'] == 'failed']
+    }
+
+def write_report(report: Dict[str, Any], report_dir: str = REPORT_DIR) -> str:
+    """保存汇总报告"""
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"archive_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='批量转码、校验和密钥轮换')
+    parser.add_argument('roots', nargs='*', default=['mouse_records', 'mouse_mirrors'], help='搜索目录')
+    parser.add_argument('-u', '--user', action='append', help='按用户筛选，可多次指定')
+    parser.add_argument('--since', type=date.fromisoformat, help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--until', type=date.fromisoformat, help='结束日期 YYYY-MM-DD')
+    parser.add_argument('--codec', choices=CODECS, default='keep', help='镜像目标格式: 保持/gzip/AES-GCM 加密')
+    parser.add_argument('--compress-level', type=int, default=9, choices=range(0, 10), metavar='0-9', help='gzip 压缩级别')
+    parser.add_argument('--encryption-level', type=int, default=1, choices=(1, 2, 3), help='目标加密等级')
+    parser.add_argument('--source-encryption-level', type=int, choices=(1, 2, 3),
+                        help='读取旧版 Fernet 加密镜像使用的等级（默认同 --encryption-level）')
+    parser.add_argument('--password', help='读取加密镜像的密码')
+    parser.add_argument('--new-password', help='重新加密使用的新密码（密钥轮换）')
+    parser.add_argument('--compact-records', action='store_true', help='以紧凑 JSON 重写记录文件')
+    parser.add_argument('--verify-only', action='store_true', help='只校验不写入')
+    parser.add_argument('-o', '--output', help='输出目录（默认原地替换）')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数（默认全部 CPU）')
+    parser.add_argument('--journal', default=JOURNAL_FILE, help='处理日志文件（用于续传）')
+    args = parser.parse_args()
+
+    if args.new_password and args.codec == 'gzip':
+        parser.error('--new-password 不能与 --codec gzip 同时使用')
+    if args.new_password and (args.since or args.until):
+        parser.error('密钥轮换需要覆盖用户的全部加密镜像，--new-password 不能与 --since/--until 同时使用')
+
+    files = select_archives(args.roots, args.user, args.since, args.until)
+    if not files:
+        print("没有符合条件的文件")
+        sys.exit(1)
+
+    options = {
+        'codec': args.codec,
+        'compress_level': args.compress_level,
+        'encryption_level': args.encryption_level,
+        'source_encryption_level': args.source_encryption_level,
+        'password': args.password,
+        'new_password': args.new_password,
+        'compact_records': args.compact_records,
+        'verify_only': args.verify_only,
+        'output_dir': args.output
+    }
+    try:
+        report = run(files, options, args.workers, args.journal)
+    except ValueError as e:
+        print(str(e))
+        sys.exit(1)
+    report_path = write_report(report)
+    print(json.dumps({k: v for k, v in report.items() if k != 'failures'}, ensure_ascii=False, indent=2))
+    if report['failures']:
+        print(f"失败 {len(report['failures'])} 个文件，详见 {report_path}")
+    sys.exit(1 if report['failures'] else 0)
@@ -6,8 +6,8 @@
 import json
 import os
 import hashlib
-import logging
-from typing import Dict, Optional
+from log_config import get_logger
+from typing import Dict, Iterable, List, Optional
 from datetime import datetime
 
 class AuthManager:
@@ -19,8 +19,7 @@ class AuthManager:
     
     def _setup_logging(self):
         """配置日志"""
-        self.logger = logging.getLogger('auth')
-        self.logger.setLevel(logging.INFO)
+        self.logger = get_logger('auth')
     
     def _setup(self):
         """初始化权限配置"""
@@ -95,6 +94,58 @@ class AuthManager:
             self.logger.error(f"验证加密账号时发生错误: {str(e)}")
             return False
     
+    def change_password(
+        self,
+        username: str,
+        old_password: str,
+        new_password: str,
+        file_ids: Iterable[str] = ()
+    ) -> bool:
+        """
+        修改加密账号密码，同时更新已重新加密文件的密钥（密钥轮换后调用）
+        账号密码修改后，仍用原密码加密的文件无法在应用中回放，
+        因此该用户已登记的每个文件都必须在 file_ids 中，否则拒绝修改
+        
+        Args:
+            username: 用户名
+            old_password: 原密码
+            new_password: 新密码
+            file_ids: 已用新密码重新加密的文件ID，这些文件的密钥会被登记或更新
+        
+        Returns:
+            是否修改成功（原密码错误、不是加密账号或有已登记文件未重新加密时返回 False）
+        """
+        try:
+            data = self._load_auth_data()
+            user_data = data['users'].get(username)
+            if not user_data or not user_data.get('is_encryption_user'):
+                return False
+            if user_data['password_hash'] != self._hash_password(old_password):
+                self.logger.warning(f"用户 {username} 原密码错误，未修改密码")
+                return False
+            
+            file_ids = set(file_ids)
+            keys = data['encryption_keys'].setdefault(username, {})
+            missing = set(keys) - file_ids
+            if missing:
+                self.logger.warning(f"用户 {username} 有 {len(missing)} 个已登记文件未用新密码重新加密，未修改密码")
+                return False
+            
+            # 密码哈希和密钥在同一次写入中更新，避免两者不一致
+            now = datetime.now().isoformat()
+            user_data['password_hash'] = self._hash_password(new_password)
+            user_data['password_changed_at'] = now
+            for file_id in file_ids:
+                keys[file_id] = {'key': new_password, 'created_at': now}
+            
+            self._save_auth_data(data)
+            self.logger.info(f"加密账号 {username} 密码已修改，更新 {len(file_ids)} 个文件密钥")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"修改加密账号密码时发生错误: {str(e)}")
+            return False
+    
     def store_encryption_key(self, username: str, file_id: str, key: str) -> bool:
         """存储加密密钥"""
         try:
@@ -117,6 +168,15 @@ class AuthManager:
             self.logger.error(f"存储加密密钥时发生错误: {str(e)}")
             return False
     
+    def list_encryption_keys(self, username: str) -> List[str]:
+        """获取用户已登记密钥的文件ID"""
+        try:
+            data = self._load_auth_data()
+            return sorted(data.get('encryption_keys', {}).get(username, {}))
+        except Exception as e:
+            self.logger.error(f"获取加密密钥列表时发生错误: {str(e)}")
+            return []
+    
     def get_encryption_key(self, username: str, file_id: str) -> Optional[str]:
         """获取加密密钥"""
         try:
@@ -126,6 +186,22 @@ class AuthManager:
             self.logger.error(f"获取加密密钥时发生错误: {str(e)}")
             return None
     
+    def remove_encryption_key(self, username: str, file_id: str) -> bool:
+        """删除加密密钥（文件被清理后调用）"""
+        try:
+            data = self._load_auth_data()
+            keys = data.get('encryption_keys', {}).get(username, {})
+            if file_id not in keys:
+                return False
+            
+            del keys[file_id]
+            self._save_auth_data(data)
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"删除加密密钥时发生错误: {str(e)}")
+            return False
+    
     def has_file_access(self, username: str, file_id: str) -> bool:
         """检查用户是否有文件访问权限"""
         try:
@@ -0,0 +1,180 @@
+"""
+采集服务压力测试模块
+模拟多台工作站并发连接采集服务，发送事件批次和镜像文件，统计吞吐量和确认延迟
+
+用法:
+    python collector_loadtest.py tcp://127.0.0.1:9500 --clients 200 --batches 50
+    python collector_loadtest.py --local --clients 100   # 在本进程内启动临时采集服务
+"""
+
+import os
+import json
+import gzip
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List
+from stream_protocol import encode_frame, encode_batch, read_frame_async, parse_endpoint
+from collector_service import CollectorService
+
+def make_events(count: int, start: float) -> List[Dict[str, Any]]:
+    """生成模拟事件"""
+    events = []
+    x, y = 960, 540
+    for i in range(count):
+        x = min(max(x + random.randint(-15, 15), 0), 1919)
+        y = min(max(y + random.randint(-15, 15), 0), 1079)
+        event_type = 'click' if i % 50 == 49 else 'move'
+        events.append({
+            'type': event_type,
+            'position': (x, y),
+            'timestamp': start + i * 0.01,
+            'params': {'pressed': True} if event_type == 'click' else None
+        })
+    return events
+
+def make_mirror(username: str, count: int) -> bytes:
+    """生成模拟镜像文件内容"""
+    events = make_events(count, 0.0)
+    data = {
+        'username': username,
+        'timestamp': datetime.now().isoformat(),
+        'duration': count * 0.01,
+        'events': events,
+        'event_count': len(events)
+    }
+    return gzip.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+async def run_client(host: str, port: int, index: int, batches: int, batch_size: int,
+                     uploads: int, latencies: List[float], results: Dict[str, int]) -> None:
+    """单个模拟客户端：握手后依次发送批次和上传文件，每条消息等待确认"""
+    username = f'loadtest{index % 20:02d}'
+    client_id = f'loadtest-{index}-{os.getpid()}-{int(time.time())}'
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(encode_frame({'type': 'hello', 'client_id': client_id, 'username': username}))
+        await writer.drain()
+        welcome, _ = await read_frame_async(reader)
+        seq = int(welcome.get('last_seq', 0))
+
+        messages = []
+        for _ in range(batches):
+            payload = encode_batch(make_events(batch_size, time.time()))
+            messages.append(({'type': 'batch', 'count': batch_size, 'username': username}, payload))
+        for n in range(uploads):
+            payload = make_mirror(username, batch_size * 4)
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            messages.append(({
+                'type': 'upload',
+                'filename': f'mirror_{username}_{stamp}_{index}_{n}.gz',
+                'username': username,
+                'sha256': hashlib.sha256(payload).hexdigest()
+            }, payload))
+
+        for header, payload in messages:
+            seq += 1
+            header['seq'] = seq
+            sent = time.perf_counter()
+            writer.write(encode_frame(header, payload))
+            await writer.drain()
+            ack, _ = await read_frame_async(reader)
+            latencies.append(time.perf_counter() - sent)
+            status = ack.get('status', 'error')
+            results[status] = results.get(status, 0) + 1
+            if status == 'ok' and header['type'] == 'batch':
+                results['events'] = results.get('events', 0) + header['count']
+    finally:
+        writer.close()
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+async def run_loadtest(endpoint: str, clients: int, batches: int, batch_size: int,
+                       uploads: int, concurrency: int) -> Dict[str, Any]:
+    """
+    运行压力测试
+
+    Args:
+        endpoint: 采集服务地址 tcp://host:port
+        clients: 模拟客户端数
+        batches: 每个客户端发送的批次数
+        batch_size: 每批事件数
+        uploads: 每个客户端上传的镜像文件数
+        concurrency: 同时保持的连接数上限
+
+    Returns:
+        统计结果
+    """
+    _, host, port, _ = parse_endpoint(endpoint)
+    latencies: List[float] = []
+    results: Dict[str, int] = {}
+    failures = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def guarded(index: int) -> None:
+        nonlocal failures
+        async with slots:
+            try:
+                await run_client(host, port, index, batches, batch_size, uploads, latencies, results)
+            except (OSError, asyncio.IncompleteReadError):
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(guarded(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    events = results.pop('events', 0)
+    return {
+        'clients': clients,
+        'failed_clients': failures,
+        'acks': results,
+        'elapsed': round(elapsed, 3),
+        'messages_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'events_per_second': round(events / elapsed, 1) if elapsed else 0.0,
+        'ack_p50_ms': round(_percentile(latencies, 0.5) * 1000, 2),
+        'ack_p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+        'ack_max_ms': round(max(latencies, default=0.0) * 1000, 2)
+    }
+
+async def _run_local(args) -> Dict[str, Any]:
+    """在临时目录中启动采集服务并对其进行压测"""
+    with tempfile.TemporaryDirectory() as root:
+        service = CollectorService(root, args.workers)
+        server = await service.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            report = await run_loadtest(
+                f'tcp://127.0.0.1:{port}', args.clients, args.batches,
+                args.batch_size, args.uploads, args.concurrency
+            )
+            report['server'] = dict(service.stats)
+            report['catalog_entries'] = len(service.catalog.search())
+            return report
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='采集服务压力测试')
+    parser.add_argument('endpoint', nargs='?', default='tcp://127.0.0.1:9500', help='采集服务地址')
+    parser.add_argument('--local', action='store_true', help='在本进程内启动临时采集服务')
+    parser.add_argument('--clients', type=int, default=100, help='模拟客户端数')
+    parser.add_argument('--batches', type=int, default=20, help='每个客户端的批次数')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批事件数')
+    parser.add_argument('--uploads', type=int, default=1, help='每个客户端上传的镜像文件数')
+    parser.add_argument('--concurrency', type=int, default=500, help='最大并发连接数')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='本地服务的校验进程数')
+    args = parser.parse_args()
+
+    if args.local:
+        report = asyncio.run(_run_local(args))
+    else:
+        report = asyncio.run(run_loadtest(
+            args.endpoint, args.clients, args.batches, args.batch_size, args.uploads, args.concurrency
+        ))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
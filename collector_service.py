@@ -0,0 +1,438 @@
+"""
+镜像采集服务模块
+独立运行的 asyncio 服务，同时接收多台工作站上传的镜像文件（event_streamer.upload_files，config/stream.json 中
+设置 upload_mirrors 后会话结束时自动上传）和实时事件批次，
+在进程池中完成解压与校验后按 用户/日期 分区存储，并维护可检索的 SQLite 目录
+
+用法:
+    python collector_service.py --host 0.0.0.0 --port 9500 --root collector_data
+    python collector_service.py --root collector_data --search 张三 --since 2025-01-01
+    python collector_service.py --root collector_data --retention-days 365
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from stream_protocol import ProtocolError, encode_frame, read_frame_async, read_header_async
+from log_config import get_logger, setup_logging
+
+logger = get_logger('collector')
+
+DEFAULT_PORT = 9500
+DEFAULT_ROOT = 'collector_data'
+CATALOG_FILE = 'catalog.db'
+MAX_PENDING_JOBS = 64  # 同时在进程池中校验的任务上限
+MAX_BUFFERED_BYTES = 256 * 1024 * 1024  # 所有连接同时缓存在内存中的负载总量上限
+EXPIRE_INTERVAL = 6 * 3600  # 过期清理间隔(秒)
+SAFE_NAME = re.compile(r'[^\w.\-]')
+DATE_IN_NAME = re.compile(r'_(\d{8})_\d{6}')
+
+def _safe(name: str) -> str:
+    """
+    清理路径片段，防止目录穿越
+    只保留字母、数字、下划线、点和连字符，开头的点替换为下划线（排除 '.'、'..' 和隐藏文件）
+    """
+    name = SAFE_NAME.sub('_', str(name or ''))[:128]
+    stripped = name.lstrip('.')
+    name = '_' * (len(name) - len(stripped)) + stripped
+    return name or 'unknown'
+
+# ---- 进程池中执行的校验函数 ----
+
+def verify_batch(payload: bytes, count: int) -> Tuple[bytes, int, Optional[float]]:
+    """
+    解压并校验事件批次
+
+    Returns:
+        (JSON Lines 数据, 事件数, 首个事件时间戳)
+    """
+    events = json.loads(gzip.decompress(payload).decode('utf-8'))
+    if not isinstance(events, list) or len(events) != count:
+        raise ValueError(f"批次事件数不匹配: 声明 {count}, 实际 {len(events) if isinstance(events, list) else '无效'}")
+    lines = ''.join(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n' for event in events)
+    first_ts = events[0].get('timestamp') if events else None
+    return lines.encode('utf-8'), len(events), first_ts
+
+def verify_upload(payload: bytes, filename: str, sha256: str) -> Dict[str, Any]:
+    """
+    校验上传文件：核对 SHA-256；未加密的 .gz 文件额外解压并解析 JSON
+
+    Returns:
+        {size, sha256, event_count}
+    """
+    digest = hashlib.sha256(payload).hexdigest()
+    if digest != sha256:
+        raise ValueError(f"校验和不匹配: {filename}")
+
+    event_count = None
+    if filename.endswith('.gz') and not filename.endswith('.enc.gz'):
+        data = json.loads(gzip.decompress(payload).decode('utf-8'))
+        event_count = len(data.get('events', []))
+    elif filename.endswith('.json'):
+        event_count = len(json.loads(payload.decode('utf-8')).get('events', []))
+    return {'size': len(payload), 'sha256': digest, 'event_count': event_count}
+
+# ---- 目录 ----
+
+class Catalog:
+    """
+    SQLite 文件目录
+    所有操作在单线程执行器中串行执行，避免并发写冲突
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                username TEXT,
+                day TEXT,
+                kind TEXT,
+                size INTEGER,
+                sha256 TEXT,
+                event_count INTEGER,
+                client_id TEXT,
+                received_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_user_day ON files(username, day);
+            CREATE TABLE IF NOT EXISTS clients (
+                client_id TEXT PRIMARY KEY,
+                last_seq INTEGER
+            );
+        ''')
+        self.conn.commit()
+
+    def last_seq(self, client_id: str) -> int:
+        row = self.conn.execute('SELECT last_seq FROM clients WHERE client_id=?', (client_id,)).fetchone()
+        return row[0] if row else 0
+
+    def record(self, entry: Dict[str, Any], client_id: str, seq: int) -> None:
+        """登记文件并更新客户端已确认序号"""
+        with self.conn:
+            if entry['kind'] == 'stream':
+                # 事件流文件持续追加，累加大小和事件数
+                self.conn.execute('''
+                    INSERT INTO files VALUES (:path, :username, :day, :kind, :size, :sha256, :event_count, :client_id, :received_at)
+                    ON CONFLICT(path) DO UPDATE SET
+                        size = size + excluded.size,
+                        event_count = event_count + excluded.event_count,
+                        received_at = excluded.received_at
+                ''', {**entry, 'client_id': client_id})
+            else:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO files VALUES (:path, :username, :day, :kind, :size, :sha256, :event_count, :client_id, :received_at)',
+                    {**entry, 'client_id': client_id}
+                )
+            self.conn.execute(
+                'INSERT INTO clients VALUES (?, ?) ON CONFLICT(client_id) DO UPDATE SET last_seq=MAX(last_seq, excluded.last_seq)',
+                (client_id, seq)
+            )
+
+    def search(self, username: Optional[str] = None, since: Optional[date] = None,
+               until: Optional[date] = None, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按用户、日期范围和文件名检索"""
+        clauses, params = [], []
+        if username:
+            clauses.append('username = ?')
+            params.append(username)
+        if since:
+            clauses.append('day >= ?')
+            params.append(since.isoformat())
+        if until:
+            clauses.append('day <= ?')
+            params.append(until.isoformat())
+        if name:
+            clauses.append('path LIKE ?')
+            params.append(f'%{name}%')
+        where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        cursor = self.conn.execute(f'SELECT * FROM files {where} ORDER BY day, path', params)
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def remove(self, paths: List[str]) -> None:
+        """删除目录条目"""
+        with self.conn:
+            self.conn.executemany('DELETE FROM files WHERE path = ?', [(p,) for p in paths])
+
+    def close(self) -> None:
+        self.conn.close()
+
+# ---- 服务 ----
+
+class ByteBudget:
+    """
+    内存负载预算
+    连接读取负载前先按字节数预留，预算用尽时等待其他连接处理完成，避免大量客户端同时上传时耗尽内存
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        size = min(size, self.limit)  # 单个超过预算的负载独占全部预算
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.used + size <= self.limit)
+            self.used += size
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.used -= size
+                self._condition.notify_all()
+
+class CollectorService:
+    """异步采集服务"""
+    def __init__(self, root: str = DEFAULT_ROOT, workers: Optional[int] = None,
+                 max_pending: int = MAX_PENDING_JOBS, max_buffered: int = MAX_BUFFERED_BYTES,
+                 retention_days: Optional[int] = None):
+        self.root = root
+        self.retention_days = retention_days  # 超过该天数的分区文件定期删除，None 表示不清理
+        os.makedirs(root, exist_ok=True)
+        self.catalog = Catalog(os.path.join(root, CATALOG_FILE))
+        self.verify_pool = ProcessPoolExecutor(max_workers=workers)
+        self.io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='collector-io')
+        self.catalog_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='collector-catalog')
+        self.max_pending = max_pending
+        self.max_buffered = max_buffered
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._budget: Optional[ByteBudget] = None
+        self._stream_locks: Dict[str, List[Any]] = {}  # 流文件路径 -> [锁, 使用者数]，无人使用时删除
+        self._expire_task: Optional[asyncio.Task] = None
+        self.connections = 0
+        self.stats = {'batches': 0, 'uploads': 0, 'events': 0, 'errors': 0}
+
+    async def serve(self, host: str = '0.0.0.0', port: int = DEFAULT_PORT) -> None:
+        """启动服务并一直运行"""
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def start(self, host: str = '0.0.0.0', port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """启动服务（不阻塞）"""
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._budget = ByteBudget(self.max_buffered)
+        server = await asyncio.start_server(self._handle_client, host, port, limit=1024 * 1024, backlog=1024)
+        if self.retention_days:
+            self._expire_task = asyncio.create_task(self._expire_loop())
+        logger.info(f"采集服务已启动: {host}:{port}，存储目录 {self.root}")
+        return server
+
+    async def _expire_loop(self) -> None:
+        """定期删除过期分区"""
+        while True:
+            try:
+                await self.expire()
+            except Exception as e:
+                logger.error(f"清理过期采集数据时发生错误: {str(e)}")
+            await asyncio.sleep(EXPIRE_INTERVAL)
+
+    async def expire(self, today: Optional[date] = None) -> int:
+        """
+        删除超过 retention_days 天的分区文件和目录条目（文件操作在 I/O 线程中执行）
+
+        Returns:
+            删除的条目数
+        """
+        cutoff = (today or date.today()) - timedelta(days=self.retention_days + 1)
+        rows = await self._run(self.catalog_pool, self.catalog.search, None, None, cutoff)
+        if not rows:
+            return 0
+        removed = await self._run(self.io_pool, _remove_partitions, self.root, [row['path'] for row in rows])
+        await self._run(self.catalog_pool, self.catalog.remove, removed)
+        logger.info(f"已删除 {len(removed)} 个 {cutoff} 及之前的采集文件")
+        return len(removed)
+
+    def close(self) -> None:
+        if self._expire_task:
+            self._expire_task.cancel()
+        self.verify_pool.shutdown(wait=False, cancel_futures=True)
+        self.io_pool.shutdown(wait=True)
+        self.catalog_pool.submit(self.catalog.close)
+        self.catalog_pool.shutdown(wait=True)
+
+    async def _run(self, pool, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理单个客户端连接"""
+        peer = writer.get_extra_info('peername')
+        self.connections += 1
+        try:
+            header, _ = await read_frame_async(reader)
+            if header.get('type') != 'hello' or not header.get('client_id'):
+                raise ProtocolError(f"握手失败: {header}")
+            client_id = _safe(header['client_id'])
+            last_seq = await self._run(self.catalog_pool, self.catalog.last_seq, client_id)
+            writer.write(encode_frame({'type': 'welcome', 'last_seq': last_seq}))
+            await writer.drain()
+
+            while True:
+                header, payload_size = await read_header_async(reader)
+                seq = int(header.get('seq', 0))
+                # 负载从读取到处理完成一直占用预算
+                async with self._budget.reserve(payload_size):
+                    payload = await reader.readexactly(payload_size) if payload_size else b''
+                    if seq <= last_seq:
+                        status = 'duplicate'  # 断线重传的批次，已处理过
+                    else:
+                        status = await self._process(header, payload, client_id, seq)
+                        if status == 'ok':
+                            last_seq = seq
+                    del payload
+                writer.write(encode_frame({'type': 'ack', 'seq': seq, 'status': status}))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"处理客户端 {peer} 时发生错误: {str(e)}")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _process(self, header: Dict[str, Any], payload: bytes, client_id: str, seq: int) -> str:
+        """校验并存储一条消息"""
+        kind = header.get('type')
+        username = _safe(header.get('username'))
+        try:
+            async with self._slots:
+                if kind == 'batch':
+                    lines, count, first_ts = await self._run(
+                        self.verify_pool, verify_batch, payload, int(header.get('count', -1))
+                    )
+                    day = datetime.fromtimestamp(first_ts).date() if first_ts else date.today()
+                    path = self._partition(username, day, f'stream_{client_id}.jsonl')
+                    # 同一流文件的追加需要串行，避免多连接交错写入
+                    async with self._stream_lock(path):
+                        await self._run(self.io_pool, _append_file, path, lines)
+                    entry = {'kind': 'stream', 'size': len(lines), 'sha256': None, 'event_count': count}
+                    self.stats['batches'] += 1
+                    self.stats['events'] += count
+                elif kind == 'upload':
+                    filename = _safe(os.path.basename(header.get('filename', '')))
+                    info = await self._run(
+                        self.verify_pool, verify_upload, payload, filename, header.get('sha256', '')
+                    )
+                    path = self._partition(username, _day_from_name(filename), filename)
+                    await self._run(self.io_pool, _write_atomic, path, payload)
+                    entry = {'kind': 'upload', **info}
+                    self.stats['uploads'] += 1
+                else:
+                    raise ProtocolError(f"未知消息类型: {kind}")
+
+            entry.update({
+                'path': os.path.relpath(path, self.root),
+                'username': username,
+                'day': os.path.basename(os.path.dirname(path)),
+                'received_at': datetime.now().isoformat()
+            })
+            await self._run(self.catalog_pool, self.catalog.record, entry, client_id, seq)
+            return 'ok'
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"处理客户端 {client_id} 的第 {seq} 条消息失败: {str(e)}")
+            return 'error'
+
+    @asynccontextmanager
+    async def _stream_lock(self, path: str):
+        """获取流文件的追加锁，最后一个使用者释放后删除，锁表不随流文件数增长"""
+        entry = self._stream_locks.get(path)
+        if entry is None:
+            entry = self._stream_locks[path] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._stream_locks[path]
+
+    def _partition(self, username: str, day: date, filename: str) -> str:
+        """生成 用户/日期 分区路径（目录在 I/O 线程写入时创建），路径必须位于存储目录内"""
+        path = os.path.join(self.root, username, day.isoformat(), filename)
+        root = os.path.realpath(self.root)
+        if os.path.commonpath([root, os.path.realpath(path)]) != root:
+            raise ProtocolError(f"分区路径超出存储目录: {path}")
+        return path
+
+def _day_from_name(filename: str) -> date:
+    """从文件名中的 _YYYYMMDD_HHMMSS 解析日期，失败时使用当天"""
+    match = DATE_IN_NAME.search(filename)
+    if match:
+        try:
+            return datetime.strptime(match.group(1), '%Y%m%d').date()
+        except ValueError:
+            pass
+    return date.today()
+
+def _append_file(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as f:
+        f.write(data)
+
+def _remove_partitions(root: str, paths: List[str]) -> List[str]:
+    """删除分区文件及随之变空的目录，返回已删除（或本就不存在）的相对路径"""
+    removed = []
+    for relative in paths:
+        path = os.path.join(root, relative)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            removed.append(relative)
+        except OSError as e:
+            logger.error(f"删除采集文件 {path} 时发生错误: {str(e)}")
+    for directory in sorted({os.path.dirname(os.path.join(root, relative)) for relative in removed}, reverse=True):
+        for empty in (directory, os.path.dirname(directory)):
+            try:
+                os.rmdir(empty)
+            except OSError:
+                pass
+    return removed
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.part'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='鼠标镜像采集服务')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='存储目录')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='校验进程数')
+    parser.add_argument('--search', nargs='?', const='', help='检索目录（可指定用户名）')
+    parser.add_argument('--since', type=date.fromisoformat, help='检索起始日期')
+    parser.add_argument('--until', type=date.fromisoformat, help='检索结束日期')
+    parser.add_argument('--retention-days', type=int, default=None, help='定期删除超过该天数的采集数据（默认不删除）')
+    args = parser.parse_args()
+
+    if args.search is not None:
+        catalog = Catalog(os.path.join(args.root, CATALOG_FILE))
+        for row in catalog.search(args.search or None, args.since, args.until):
+            print(json.dumps(row, ensure_ascii=False))
+        sys.exit(0)
+
+    service = CollectorService(args.root, args.workers, retention_days=args.retention_days)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
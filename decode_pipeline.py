@@ -0,0 +1,243 @@
+"""
+流式解码管道模块
+以生成器串联 读取 -> 解密 -> 解压 -> 增量 JSON 解析，逐个产出事件，
+并可在生产者线程中解码、通过有界队列交给回放调度，首个事件的等待时间和内存占用不随文件大小增长
+"""
+
+import json
+import zlib
+import codecs
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+from log_config import get_logger
+
+logger = get_logger('decoder')
+
+READ_CHUNK = 256 * 1024  # 每次读取的字节数
+PREFETCH_EVENTS = 4096  # 预取队列容量（事件数）
+COMPACT_THRESHOLD = 64 * 1024  # 已解析文本超过该长度时压缩缓冲区
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'
+
+def read_chunks(path: str, chunk_size: int = READ_CHUNK) -> Iterator[bytes]:
+    """分块读取文件"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+def decrypt_chunks(chunks: Iterable[bytes], decrypt: Callable[[bytes], bytes]) -> Iterator[bytes]:
+    """
+    解密数据块
+    解密器提供 stream 方法时（见 aead_container.Decryptor）逐帧解密；
+    否则按整体解密函数处理，需要先收集完整密文
+    """
+    stream = getattr(decrypt, 'stream', None)
+    if stream is not None:
+        yield from stream(chunks)
+        return
+    plain = decrypt(b''.join(chunks))
+    for start in range(0, len(plain), READ_CHUNK):
+        yield plain[start:start + READ_CHUNK]
+
+def decompress_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """增量解压 gzip 数据块（支持多个 gzip 成员拼接，每次输出不超过 READ_CHUNK 字节）"""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, READ_CHUNK)
+            if data:
+                yield data
+            if decompressor.eof:
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                chunk = decompressor.unconsumed_tail
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+def decode_text(chunks: Iterable[bytes]) -> Iterator[str]:
+    """增量 UTF-8 解码（正确处理跨块的多字节字符）"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+class _TextBuffer:
+    """按需从文本块迭代器补充数据的解析缓冲区"""
+    def __init__(self, texts: Iterable[str]):
+        self.texts = iter(texts)
+        self.buf = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self) -> bool:
+        """追加一块文本，没有更多数据时返回 False"""
+        if self.exhausted:
+            return False
+        try:
+            text = next(self.texts)
+        except StopIteration:
+            self.exhausted = True
+            return False
+        if self.pos > COMPACT_THRESHOLD:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += text
+        return True
+
+    def peek(self) -> str:
+        """跳过空白并返回下一个字符，数据结束时返回空串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON 格式错误: 期望 {char!r}，实际 {found!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """解析下一个完整的 JSON 值，数据不足时继续读取"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # 数字可能被块边界截断（如 '12.' 与 '5' 分属两块），确认其后已是非数字字符
+            if (isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and (end == len(self.buf) or self.buf[end] in _NUMBER_CHARS)
+                    and self.fill()):
+                continue
+            self.pos = end
+            return value
+
+def iter_json_events(texts: Iterable[str], meta: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    从 JSON 文本块中增量解析 "events" 数组中的事件
+
+    Args:
+        texts: 文本块迭代器
+        meta: 可选字典，用于接收顶层的其他字段（位于事件数组之前的字段在首个事件产出前即可用）
+
+    Yields:
+        事件字典
+    """
+    meta = meta if meta is not None else {}
+    buffer = _TextBuffer(texts)
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+    while True:
+        key = buffer.value()
+        buffer.expect(':')
+        if key == 'events':
+            buffer.expect('[')
+            if buffer.peek() == ']':
+                buffer.pos += 1
+            else:
+                while True:
+                    yield buffer.value()
+                    separator = buffer.peek()
+                    buffer.pos += 1
+                    if separator == ']':
+                        break
+                    if separator != ',':
+                        raise ValueError(f"JSON 格式错误: 事件之间期望 ','，实际 {separator!r}")
+        else:
+            meta[key] = buffer.value()
+        separator = buffer.peek()
+        buffer.pos += 1
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError(f"JSON 格式错误: 字段之间期望 ','，实际 {separator!r}")
+
+def iter_events(
+    path: str,
+    decrypt: Optional[Callable[[bytes], bytes]] = None,
+    meta: Optional[Dict[str, Any]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    流式读取记录或镜像文件中的事件
+
+    Args:
+        path: 文件路径（.json / .gz / .enc.gz）
+        decrypt: 加密镜像的解密函数，输入密文返回 gzip 数据
+        meta: 可选字典，用于接收文件中的其他字段
+
+    Yields:
+        事件字典
+    """
+    chunks = read_chunks(path)
+    if path.endswith('.enc.gz'):
+        if decrypt is None:
+            raise ValueError(f"加密文件需要提供解密函数: {path}")
+        chunks = decrypt_chunks(chunks, decrypt)
+    if path.endswith('.gz'):
+        chunks = decompress_chunks(chunks)
+    yield from iter_json_events(decode_text(chunks), meta)
+
+_DONE = object()
+
+def prefetch(iterable: Iterable[Any], maxsize: int = PREFETCH_EVENTS, name: str = 'decode-producer') -> Iterator[Any]:
+    """
+    在生产者线程中迭代，通过有界队列把结果交给调用方
+    生产者中的异常会在消费端重新抛出；消费端提前结束时生产者随之停止
+
+    Args:
+        iterable: 数据源（例如 iter_events 的结果）
+        maxsize: 队列容量
+        name: 生产者线程名
+    """
+    items: queue.Queue = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, name=name, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
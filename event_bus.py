@@ -0,0 +1,190 @@
+"""
+采集事件总线模块
+每个鼠标事件只创建一次，由总线分发给已注册的接收端（记录写入、镜像写入、遥测、实时视图等）
+各接收端持有同一事件对象的引用，可分别配置过滤和转换
+"""
+
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from log_config import get_logger
+
+logger = get_logger('event_bus')
+
+class CaptureEvent:
+    """
+    采集事件
+    使用 __slots__ 存储，内存占用远小于字典；同时支持按键访问以兼容处理字典事件的代码
+    """
+    __slots__ = ('type', 'x', 'y', 'timestamp', 'params')
+
+    def __init__(self, event_type: str, x: int, y: int, timestamp: float, params: Optional[Dict[str, Any]] = None):
+        self.type = event_type
+        self.x = x
+        self.y = y
+        self.timestamp = timestamp  # Unix 时间
+        self.params = params or None  # 无参数时不分配字典
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        return (self.x, self.y)
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'position':
+            return (self.x, self.y)
+        if key == 'params':
+            return self.params or {}
+        if key in ('type', 'timestamp'):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self, time_origin: float = 0.0) -> Dict[str, Any]:
+        """
+        转换为可序列化的字典
+
+        Args:
+            time_origin: 时间原点，镜像记录使用相对时间
+        """
+        return {
+            'type': self.type,
+            'position': (self.x, self.y),
+            'timestamp': self.timestamp - time_origin,
+            'params': self.params or {}
+        }
+
+class EventSink:
+    """
+    事件接收端基类
+    filter 返回假值时丢弃事件，transform 在交给 handle 前转换事件
+    """
+    def __init__(
+        self,
+        name: str,
+        filter: Optional[Callable[[CaptureEvent], bool]] = None,
+        transform: Optional[Callable[[CaptureEvent], Any]] = None
+    ):
+        self.name = name
+        self.filter = filter
+        self.transform = transform
+
+    def accept(self, event: CaptureEvent) -> None:
+        """接收总线分发的事件"""
+        if self.filter is not None and not self.filter(event):
+            return
+        self.handle(self.transform(event) if self.transform is not None else event)
+
+    def handle(self, item: Any) -> None:
+        raise NotImplementedError
+
+class BufferSink(EventSink):
+    """在内存中保存事件引用的接收端"""
+    def __init__(self, name: str, **kwargs):
+        super().__init__(name, **kwargs)
+        self.buffer: List[Any] = []
+
+    def handle(self, item: Any) -> None:
+        self.buffer.append(item)
+
+    def clear(self) -> None:
+        self.buffer = []
+
+class DoubleBufferSink(EventSink):
+    """
+    双缓冲接收端
+    采集线程只向活动缓冲区追加；刷写时在锁内交换出整个缓冲区，刷写期间的新事件进入新的活动缓冲区
+    """
+    def __init__(self, name: str, **kwargs):
+        super().__init__(name, **kwargs)
+        self.active: List[Any] = []
+        self.dirty = False  # 上次交换后是否有新事件
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.active)
+
+    def handle(self, item: Any) -> None:
+        with self._lock:
+            self.active.append(item)
+            self.dirty = True
+
+    def swap(self) -> List[Any]:
+        """
+        交换缓冲区
+
+        Returns:
+            上次交换以来的事件，没有新事件时返回空列表
+        """
+        with self._lock:
+            if not self.dirty:
+                return []
+            full, self.active = self.active, []
+            self.dirty = False
+        return full
+
+class CallbackSink(EventSink):
+    """对每个事件调用回调函数的接收端"""
+    def __init__(self, name: str, callback: Callable[[Any], None], **kwargs):
+        super().__init__(name, **kwargs)
+        self.callback = callback
+
+    def handle(self, item: Any) -> None:
+        self.callback(item)
+
+class CaptureBus:
+    """
+    采集事件总线
+    接收端列表采用写时复制，分发时无需加锁
+    """
+    def __init__(self):
+        self._sinks: Tuple[EventSink, ...] = ()
+        self._lock = threading.Lock()
+
+    def register(self, sink: EventSink) -> EventSink:
+        """注册接收端，同名接收端会被替换"""
+        with self._lock:
+            self._sinks = tuple(s for s in self._sinks if s.name != sink.name) + (sink,)
+        return sink
+
+    def unregister(self, name: str) -> None:
+        """注销接收端"""
+        with self._lock:
+            self._sinks = tuple(s for s in self._sinks if s.name != name)
+
+    def get(self, name: str) -> Optional[EventSink]:
+        """按名称获取接收端"""
+        for sink in self._sinks:
+            if sink.name == name:
+                return sink
+        return None
+
+    @property
+    def sinks(self) -> Tuple[EventSink, ...]:
+        return self._sinks
+
+    def publish(self, event_type: str, x: int, y: int, timestamp: Optional[float] = None, **params) -> CaptureEvent:
+        """
+        创建事件并分发给所有接收端
+
+        Returns:
+            创建的事件对象
+        """
+        event = CaptureEvent(event_type, x, y, time.time() if timestamp is None else timestamp, params)
+        self.dispatch(event)
+        return event
+
+    def dispatch(self, event: CaptureEvent) -> None:
+        """分发已有事件，单个接收端出错不影响其他接收端"""
+        for sink in self._sinks:
+            try:
+                sink.accept(event)
+            except Exception as e:
+                logger.error(f"事件接收端 {sink.name} 处理事件时发生错误: {str(e)}")
+
+# 创建全局采集总线实例
+capture_bus = CaptureBus()
@@ -0,0 +1,427 @@
+"""
+远程监控事件流模块
+作为采集总线的接收端，把事件压缩成批次发送到 TCP 或 WebSocket 端点
+本地缓冲有上限：缓冲满时优先丢弃移动事件，点击等事件不丢弃；断线后自动重连并续传未确认批次
+采集线程只做入队操作，不会因网络阻塞
+另提供 upload_files，把会话结束时保存的镜像文件上传到同一采集服务
+"""
+
+import os
+import json
+import hashlib
+import time
+import socket
+import threading
+import itertools
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from event_bus import EventSink, CaptureEvent
+from stream_protocol import (
+    ProtocolError, encode_frame, decode_frame, read_frame,
+    encode_batch, decode_batch, parse_endpoint, MAX_PAYLOAD_SIZE
+)
+from log_config import get_logger
+
+logger = get_logger('streamer')
+
+STREAM_CONFIG = 'config/stream.json'
+ACCEPTED_STATUSES = ('ok', 'duplicate')  # 服务端已持久化该批次的确认状态
+
+class BatchRejected(ProtocolError):
+    """服务端确认了批次但处理失败（校验或存储出错），批次保留并在退避后重发"""
+    pass
+
+class TcpTransport:
+    """TCP 传输"""
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+
+    def connect(self) -> None:
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send(self, header: Dict[str, Any], payload: bytes = b'') -> None:
+        self.sock.sendall(encode_frame(header, payload))
+
+    def recv(self) -> Tuple[Dict[str, Any], bytes]:
+        return read_frame(self.sock)
+
+    def close(self) -> None:
+        if self.sock:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+class WebSocketTransport:
+    """WebSocket 传输（需要安装 websockets）"""
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self.ws = None
+
+    def connect(self) -> None:
+        try:
+            from websockets.sync.client import connect
+        except ImportError:
+            raise RuntimeError("使用 WebSocket 端点需要安装 websockets>=11")
+        self.ws = connect(self.url, open_timeout=self.timeout)
+
+    def send(self, header: Dict[str, Any], payload: bytes = b'') -> None:
+        self.ws.send(encode_frame(header, payload))
+
+    def recv(self) -> Tuple[Dict[str, Any], bytes]:
+        return decode_frame(self.ws.recv(timeout=self.timeout))
+
+    def close(self) -> None:
+        if self.ws:
+            try:
+                self.ws.close()
+            finally:
+                self.ws = None
+
+class EventStreamer(EventSink):
+    """
+    事件流发送端
+    批次按序号逐个发送并等待确认，未确认的批次在重连后重发，服务端按序号去重
+    """
+    def __init__(
+        self,
+        endpoint: str,
+        client_id: Optional[str] = None,
+        username: Optional[str] = None,
+        capacity: int = 50000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        timeout: float = 5.0,
+        max_backoff: float = 30.0
+    ):
+        super().__init__('stream')
+        self.scheme, self.host, self.port, self.url = parse_endpoint(endpoint)
+        self.endpoint = endpoint
+        self.client_id = client_id or f'{socket.gethostname()}-{os.getpid()}-{int(time.time())}'
+        self.username = username
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.stats = {
+            'sent_batches': 0,
+            'sent_events': 0,
+            'dropped_moves': 0,
+            'reconnects': 0,
+            'rejected_batches': 0
+        }
+        # 移动事件与其他事件分开缓冲，背压时从移动队列左端丢弃为 O(1)；
+        # 每项带全局入队序号，取批次时按序号归并以保持原始顺序
+        self._moves: deque = deque()
+        self._others: deque = deque()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._pending: Optional[Tuple[int, int, bytes]] = None  # 未确认批次 (序号, 事件数, 负载)
+        self._next_seq = 1
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- 采集线程侧 ----
+
+    def handle(self, event: CaptureEvent) -> None:
+        """入队事件，缓冲满时按背压策略丢弃移动事件"""
+        item = event.to_dict()
+        with self._lock:
+            if self.buffered >= self.capacity:
+                if event.type == 'move':
+                    self.stats['dropped_moves'] += 1
+                    return
+                self._evict_move()
+            queue = self._moves if event.type == 'move' else self._others
+            queue.append((next(self._order), item))
+            if self.buffered >= self.batch_size:
+                self._wakeup.set()
+
+    def _evict_move(self) -> bool:
+        """丢弃缓冲中最早的一个移动事件，没有移动事件时允许超出容量"""
+        if not self._moves:
+            return False
+        self._moves.popleft()
+        self.stats['dropped_moves'] += 1
+        return True
+
+    @property
+    def buffered(self) -> int:
+        """缓冲中的事件数"""
+        return len(self._moves) + len(self._others)
+
+    # ---- 发送线程侧 ----
+
+    def start(self) -> 'EventStreamer':
+        """启动发送线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='event-streamer', daemon=True)
+            self._thread.start()
+            logger.info(f"事件流已启动: {self.endpoint} (客户端 {self.client_id})")
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止发送线程，在超时时间内尽量发送剩余事件"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        logger.info(f"事件流已停止: {self.stats}，剩余未发送 {self.buffered} 条")
+
+    def _idle(self) -> bool:
+        return not self.buffered and self._pending is None
+
+    def _make_transport(self):
+        return _make_transport(self.endpoint, self.timeout)
+
+    def _run(self) -> None:
+        """发送线程主循环：连接、发送、断线重连"""
+        backoff = 0.5
+        while not (self._stop.is_set() and self._idle()):
+            transport = self._make_transport()
+            try:
+                self._handshake(transport)
+                backoff = 0.5
+                self._pump(transport)
+            except (OSError, ConnectionError, ProtocolError, RuntimeError, ValueError) as e:
+                self.stats['reconnects'] += 1
+                if isinstance(e, BatchRejected):
+                    self.stats['rejected_batches'] += 1
+                logger.warning(f"事件流连接中断: {str(e)}，{backoff:.1f}秒后重连")
+                if self._stop.wait(backoff):
+                    break  # 停止时不再重连，未发送的事件保留在缓冲中
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                transport.close()
+
+    def _handshake(self, transport) -> None:
+        """建立连接并根据服务端已确认的序号续传"""
+        transport.connect()
+        transport.send({'type': 'hello', 'client_id': self.client_id, 'username': self.username})
+        header, _ = transport.recv()
+        if header.get('type') != 'welcome':
+            raise ProtocolError(f"握手失败: {header}")
+
+        last_seq = int(header.get('last_seq', 0))
+        if self._pending and self._pending[0] <= last_seq:
+            self._pending = None  # 断线前服务端已收到该批次
+        self._next_seq = max(self._next_seq, last_seq + 1)
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            moves, others = self._moves, self._others
+            batch = []
+            while len(batch) < self.batch_size and (moves or others):
+                if not others or (moves and moves[0][0] < others[0][0]):
+                    batch.append(moves.popleft()[1])
+                else:
+                    batch.append(others.popleft()[1])
+            return batch
+
+    def _pump(self, transport) -> None:
+        """逐批发送并等待确认"""
+        while True:
+            if self._pending is None:
+                if not self.buffered:
+                    if self._stop.is_set():
+                        return
+                    self._wakeup.wait(self.flush_interval)
+                    self._wakeup.clear()
+                    continue
+                events = self._take_batch()
+                self._pending = (self._next_seq, len(events), encode_batch(events))
+                self._next_seq += 1
+
+            seq, count, payload = self._pending
+            transport.send(
+                {'type': 'batch', 'seq': seq, 'count': count, 'username': self.username},
+                payload
+            )
+            header, _ = transport.recv()
+            if header.get('type') != 'ack' or header.get('seq') != seq:
+                raise ProtocolError(f"确认消息不匹配: {header}")
+            if header.get('status') not in ACCEPTED_STATUSES:
+                # 服务端未推进已确认序号，保留未确认批次，重连后按原序号重发
+                raise BatchRejected(f"服务端处理批次 {seq} 失败: {header.get('status')}")
+
+            self._pending = None
+            self.stats['sent_batches'] += 1
+            self.stats['sent_events'] += count
+
+class LoopbackCollector:
+    """
+    本地回环采集端
+    实现与远程采集服务相同的握手、去重和确认逻辑，用于测试事件流
+    """
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.server = socket.create_server((host, port))
+        self.host, self.port = self.server.getsockname()[:2]
+        self.events: List[Dict[str, Any]] = []
+        self.last_seq: Dict[str, int] = {}
+        self.batches = 0
+        self.drop_after: Optional[int] = None  # 收到指定批次数后断开连接，用于模拟网络故障
+        self.fail_next = 0  # 接下来多少个新批次返回 error 状态且不保存，用于模拟服务端存储失败
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def endpoint(self) -> str:
+        return f'tcp://{self.host}:{self.port}'
+
+    def start(self) -> 'LoopbackCollector':
+        self._running = True
+        threading.Thread(target=self._accept_loop, name='loopback-collector', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        self.server.close()
+
+    def _accept_loop(self) -> None:
+        while self._running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        with conn:
+            try:
+                header, _ = read_frame(conn)
+                client_id = header['client_id']
+                conn.sendall(encode_frame({'type': 'welcome', 'last_seq': self.last_seq.get(client_id, 0)}))
+                while self._running:
+                    header, payload = read_frame(conn)
+                    seq = header['seq']
+                    status = 'ok'
+                    with self._lock:
+                        if seq <= self.last_seq.get(client_id, 0):
+                            status = 'duplicate'
+                        elif self.fail_next:
+                            self.fail_next -= 1
+                            status = 'error'
+                        else:
+                            self.events.extend(decode_batch(payload))
+                            self.last_seq[client_id] = seq
+                            self.batches += 1
+                        if self.drop_after is not None and self.batches >= self.drop_after:
+                            self.drop_after = None
+                            return  # 模拟断线：已收到但未确认
+                    conn.sendall(encode_frame({'type': 'ack', 'seq': seq, 'status': status}))
+            except (OSError, ConnectionError, ProtocolError, KeyError):
+                return
+
+def load_stream_config() -> Dict[str, Any]:
+    """读取事件流配置"""
+    try:
+        with open(STREAM_CONFIG, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _make_transport(endpoint: str, timeout: float):
+    scheme, host, port, url = parse_endpoint(endpoint)
+    if scheme == 'tcp':
+        return TcpTransport(host, port, timeout)
+    return WebSocketTransport(url, timeout)
+
+def upload_files(
+    endpoint: str,
+    paths: List[str],
+    username: Optional[str] = None,
+    client_id: Optional[str] = None,
+    timeout: float = 30.0
+) -> List[str]:
+    """
+    把镜像文件上传到采集服务，每个文件一条 upload 消息并等待确认
+
+    Args:
+        endpoint: 采集服务地址
+        paths: 文件路径列表
+        username: 用户名
+        client_id: 客户端 ID，默认按主机名生成（与事件流的客户端 ID 分开计数）
+        timeout: 单个文件的网络超时(秒)
+
+    Returns:
+        服务端确认已保存的文件
+    """
+    client_id = client_id or f'{socket.gethostname()}-upload'
+    uploaded = []
+    transport = _make_transport(endpoint, timeout)
+    try:
+        transport.connect()
+        transport.send({'type': 'hello', 'client_id': client_id, 'username': username})
+        header, _ = transport.recv()
+        if header.get('type') != 'welcome':
+            raise ProtocolError(f"握手失败: {header}")
+        seq = int(header.get('last_seq', 0))
+        for path in paths:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            if len(payload) > MAX_PAYLOAD_SIZE:
+                logger.warning(f"文件 {path} 超过上传大小上限，未上传")
+                continue
+            seq += 1
+            transport.send({
+                'type': 'upload',
+                'seq': seq,
+                'filename': os.path.basename(path),
+                'username': username,
+                'sha256': hashlib.sha256(payload).hexdigest()
+            }, payload)
+            header, _ = transport.recv()
+            if header.get('type') != 'ack' or header.get('seq') != seq:
+                raise ProtocolError(f"确认消息不匹配: {header}")
+            if header.get('status') in ACCEPTED_STATUSES:
+                uploaded.append(path)
+            else:
+                logger.error(f"采集服务保存文件 {path} 失败: {header.get('status')}")
+    except (OSError, ProtocolError, RuntimeError, ValueError) as e:
+        logger.error(f"上传镜像文件时发生错误: {str(e)}")
+    finally:
+        transport.close()
+    return uploaded
+
+def upload_mirror_async(path: Optional[str], username: Optional[str]) -> None:
+    """按配置（upload_mirrors）在后台线程中上传会话镜像"""
+    config = load_stream_config()
+    if not path or not config.get('upload_mirrors') or not config.get('endpoint'):
+        return
+    def worker():
+        if upload_files(config['endpoint'], [path], username, timeout=config.get('timeout', 30.0)):
+            logger.info(f"镜像文件已上传到采集服务: {path}")
+    # 非守护线程：会话结束后进程退出前等待上传完成（受 timeout 限制）
+    threading.Thread(target=worker, name='mirror-upload').start()
+
+def start_streaming(username: Optional[str] = None) -> Optional[EventStreamer]:
+    """
+    根据配置启动事件流
+
+    配置示例 (config/stream.json):
+        {"enabled": true, "endpoint": "tcp://collector:9500", "capacity": 50000, "upload_mirrors": true}
+
+    Returns:
+        事件流发送端，未启用时返回 None
+    """
+    config = load_stream_config()
+    if not config.get('enabled') or not config.get('endpoint'):
+        return None
+    try:
+        options = {
+            key: config[key]
+            for key in ('capacity', 'batch_size', 'flush_interval', 'timeout', 'max_backoff')
+            if key in config
+        }
+        return EventStreamer(config['endpoint'], username=username, **options).start()
+    except Exception as e:
+        logger.error(f"启动事件流时发生错误: {str(e)}")
+        return None
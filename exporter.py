@@ -0,0 +1,167 @@
+"""
+轨迹批量导出模块
+按用户和日期筛选记录或镜像文件，以分块缓冲写入的方式并行导出为 CSV 或 NumPy .npz
+"""
+
+import os
+import re
+import sys
+import argparse
+import numpy as np
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterable, List, Optional, Tuple
+from record_loader import load_columns, iter_recording_files
+from log_config import get_logger, setup_logging
+
+logger = get_logger('exporter')
+
+CHUNK_ROWS = 65536  # 每次写入的行数
+WRITE_BUFFER = 1024 * 1024  # 文件写缓冲大小(字节)
+FORMATS = ('csv', 'npz')
+CSV_HEADER = 'timestamp,x,y,code\n'
+
+# 文件名格式: record_<用户>_<YYYYMMDD>_<HHMMSS>.json / mirror_<用户>_<YYYYMMDD>_<HHMMSS>.gz
+FILENAME_PATTERN = re.compile(r'^(record|mirror)_(?P<user>.+)_(?P<date>\d{8})_(?P<time>\d{6})')
+
+def parse_filename(path: str) -> Tuple[Optional[str], Optional[date]]:
+    """从文件名解析用户名和日期"""
+    match = FILENAME_PATTERN.match(os.path.basename(path))
+    if not match:
+        return None, None
+    try:
+        return match.group('user'), datetime.strptime(match.group('date'), '%Y%m%d').date()
+    except ValueError:
+        return match.group('user'), None
+
+def select_files(
+    roots: Iterable[str],
+    users: Optional[Iterable[str]] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None
+) -> List[str]:
+    """
+    按用户和日期筛选文件（加密镜像不参与导出）
+
+    Args:
+        roots: 搜索目录
+        users: 用户列表，None 表示全部
+        since: 起始日期(含)
+        until: 结束日期(含)
+    """
+    users = set(users) if users else None
+    selected = []
+    for root in roots:
+        for path in iter_recording_files(root):
+            if path.endswith('.enc.gz'):
+                continue
+            username, day = parse_filename(path)
+            if users and username not in users:
+                continue
+            if (since or until) and day is None:
+                continue
+            if (since and day < since) or (until and day > until):
+                continue
+            selected.append(path)
+    return selected
+
+def _output_path(path: str, out_dir: str, fmt: str) -> str:
+    """生成输出文件路径"""
+    name = os.path.basename(path)
+    for suffix in ('.json', '.gz'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return os.path.join(out_dir, f'{name}.{fmt}')
+
+def export_file(path: str, out_dir: str, fmt: str = 'csv', chunk_rows: int = CHUNK_ROWS) -> Tuple[str, int, int]:
+    """
+    导出单个文件（在工作进程中执行）
+
+    Returns:
+        (输出路径, 行数, 输出字节数)
+    """
+    columns = load_columns(path)
+    timestamps = columns['t'] + (columns['base_time'] if columns['base_time'] is not None else columns['offset'])
+    x = columns['x'].astype(np.int32)
+    y = columns['y'].astype(np.int32)
+    code = columns['code']
+    output = _output_path(path, out_dir, fmt)
+    tmp_output = output + '.tmp'
+
+    if fmt == 'npz':
+        with open(tmp_output, 'wb') as f:
+            np.savez(f, timestamp=timestamps, x=x, y=y, code=code)
+    else:
+        with open(tmp_output, 'w', encoding='utf-8', newline='', buffering=WRITE_BUFFER) as f:
+            f.write(CSV_HEADER)
+            table = np.column_stack((timestamps, x, y, code))
+            for start in range(0, len(table), chunk_rows):
+                np.savetxt(f, table[start:start + chunk_rows], fmt=('%.6f', '%d', '%d', '%d'), delimiter=',')
+
+    os.replace(tmp_output, output)
+    return output, int(timestamps.size), os.path.getsize(output)
+
+def export_recordings(
+    paths: List[str],
+    out_dir: str,
+    fmt: str = 'csv',
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[int, int, str, int], None]] = None
+) -> List[str]:
+    """
+    并行导出文件
+
+    Args:
+        paths: 待导出的文件列表
+        out_dir: 输出目录
+        fmt: 'csv' 或 'npz'
+        workers: 工作进程数
+        progress: 进度回调 (已完成数, 总数, 输出路径, 输出字节数)
+
+    Returns:
+        成功导出的文件路径列表
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    outputs = []
+    total_bytes = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(export_file, path, out_dir, fmt): path for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                output, rows, size = future.result()
+            except Exception as e:
+                logger.error(f"导出文件 {futures[future]} 时发生错误: {str(e)}")
+                continue
+            outputs.append(output)
+            total_bytes += size
+            if progress:
+                progress(done, len(paths), output, size)
+
+    logger.info(f"已导出 {len(outputs)}/{len(paths)} 个文件，共 {total_bytes / 1024 / 1024:.1f}MB")
+    return outputs
+
+def _print_progress(done: int, total: int, output: str, size: int) -> None:
+    print(f"[{done}/{total}] {output} ({size / 1024:.1f}KB)")
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='批量导出鼠标轨迹')
+    parser.add_argument('roots', nargs='*', default=['mouse_records', 'mouse_mirrors'], help='搜索目录')
+    parser.add_argument('-o', '--output', default='exports', help='输出目录')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='csv', help='导出格式')
+    parser.add_argument('-u', '--user', action='append', help='按用户筛选，可多次指定')
+    parser.add_argument('--since', type=date.fromisoformat, help='起始日期 YYYY-MM-DD')
+    parser.add_argument('--until', type=date.fromisoformat, help='结束日期 YYYY-MM-DD')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数')
+    args = parser.parse_args()
+
+    files = select_files(args.roots, args.user, args.since, args.until)
+    if not files:
+        print("没有符合条件的文件")
+        sys.exit(1)
+
+    export_recordings(files, args.output, args.format, args.workers, _print_progress)
@@ -0,0 +1,277 @@
+"""
+飞行记录器模块
+采集总线上的固定容量环形缓冲区，始终保留最近一段时间的事件，写满后覆盖最旧的事件，内存占用与会话长度无关
+需要时（界面按钮、全局热键、标志文件或调用 dump）把缓冲区内容转储为普通镜像文件，
+沿用镜像的压缩和加密流程
+配置 mode 为 'flight' 时环形缓冲区是唯一的采集存储，记录器和镜像不再缓存整个会话
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional
+from event_bus import capture_bus, EventSink, CaptureEvent
+from mouse_mirror import mouse_mirror
+from record_loader import EVENT_CODES, event_code
+from metrics import BUFFER_SIZE, OPERATION_DURATION
+from log_config import get_logger
+
+logger = get_logger('flight_recorder')
+
+FLIGHT_CONFIG = 'config/flight_recorder.json'
+
+DEFAULT_CONFIG = {
+    'enabled': True,
+    'mode': 'full',  # 'full' 同时保存完整记录和镜像，'flight' 只保留环形缓冲区
+    'capacity': None,  # 缓冲区事件数上限，为空时按 window_seconds × max_event_rate 计算
+    'max_event_rate': 1000,  # 需要完整覆盖转储窗口的最高事件率（事件/秒），高回报率鼠标可达 1000Hz
+    'window_seconds': 300,  # 转储最近多少秒
+    'hotkey': '<ctrl>+<alt>+<f12>',  # 全局热键，留空则不注册
+    'flag_file': 'flight_dump.flag',  # 出现该文件时转储，文件内容可为转储秒数
+    'flag_poll_seconds': 1.0
+}
+
+# 每个事件一行，约 32 字节（默认 300 秒 × 1000 事件/秒约占 9.6MB）
+RING_DTYPE = np.dtype([
+    ('t', '<f8'),
+    ('x', '<i4'),
+    ('y', '<i4'),
+    ('code', 'i1'),
+    ('button', 'i1'),
+    ('dx', '<i2'),
+    ('dy', '<i2'),
+    ('value', '<f4')  # 空闲标记的时长
+])
+
+BUTTONS = ('', 'left', 'right', 'middle', 'x1', 'x2')
+BUTTON_CODES = {name: index for index, name in enumerate(BUTTONS)}
+EVENT_TYPES = {code: name for name, code in EVENT_CODES.items()}
+
+def load_flight_config() -> Dict[str, Any]:
+    """读取飞行记录器配置，缺省项使用默认值"""
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(FLIGHT_CONFIG, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return config
+
+def ring_capacity(config: Dict[str, Any]) -> int:
+    """根据配置计算环形缓冲区容量，未指定 capacity 时按窗口时长和最高事件率估算"""
+    if config.get('capacity'):
+        return int(config['capacity'])
+    return max(1, int(config['window_seconds'] * config['max_event_rate']))
+
+class RingSink(EventSink):
+    """
+    环形缓冲区接收端
+    事件按字段写入预分配的结构化数组，写入位置取模循环，不产生新对象
+    """
+    def __init__(self, name: str, capacity: int, **kwargs):
+        super().__init__(name, **kwargs)
+        self.capacity = capacity
+        self.ring = np.zeros(capacity, dtype=RING_DTYPE)
+        self.written = 0  # 累计写入数，写入位置为 written % capacity
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def handle(self, event: CaptureEvent) -> None:
+        params = event.params or {}
+        row = (
+            event.timestamp, event.x, event.y, event_code(event),
+            BUTTON_CODES.get(params.get('button', ''), 0),
+            params.get('dx', 0), params.get('dy', 0), params.get('duration', 0)
+        )
+        with self._lock:
+            self.ring[self.written % self.capacity] = row  # 整行一次赋值
+            self.written += 1
+
+    def snapshot(self, seconds: Optional[float] = None) -> np.ndarray:
+        """
+        按时间顺序复制缓冲区内容
+
+        Args:
+            seconds: 只取最后一个事件之前多少秒内的事件，None 表示全部
+        """
+        with self._lock:
+            count = len(self)
+            start = self.written % self.capacity if self.written > self.capacity else 0
+            rows = np.roll(self.ring, -start)[:count] if start else self.ring[:count].copy()
+        if seconds is not None and count:
+            rows = rows[rows['t'] >= rows['t'][-1] - seconds]
+        return rows
+
+    def clear(self) -> None:
+        with self._lock:
+            self.written = 0
+
+def rows_to_events(rows: np.ndarray) -> List[Dict[str, Any]]:
+    """把缓冲区行转换为镜像文件的事件字典（时间戳相对首个事件）"""
+    if not rows.size:
+        return []
+    origin = float(rows['t'][0])
+    events = []
+    for t, x, y, code, button, dx, dy, value in rows.tolist():
+        params: Dict[str, Any] = {}
+        if button:
+            params['button'] = BUTTONS[button]
+        if dx or dy:
+            params['dx'], params['dy'] = dx, dy
+        if code == EVENT_CODES['idle']:
+            params['duration'] = round(value, 3)
+        events.append({
+            'type': EVENT_TYPES.get(code, 'other'),
+            'position': (x, y),
+            'timestamp': t - origin,
+            'params': params
+        })
+    return events
+
+class FlightRecorder:
+    """飞行记录器"""
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or load_flight_config()
+        self.username: Optional[str] = None
+        self.password: Optional[str] = None  # 启用镜像加密时转储使用的密码
+        self.sink = RingSink('flight_recorder', ring_capacity(self.config))
+        self._hotkey_listener = None
+        self._stop = threading.Event()
+        self._flag_thread: Optional[threading.Thread] = None
+        self._dump_lock = threading.Lock()
+        BUFFER_SIZE.labels('flight').set_function(lambda: len(self.sink))
+
+    @property
+    def flight_only(self) -> bool:
+        """是否为仅飞行记录模式（不注册记录器和镜像的会话缓冲）"""
+        return bool(self.config.get('enabled', True)) and self.config.get('mode') == 'flight'
+
+    def start(self) -> bool:
+        """注册到采集总线并启动热键和标志文件触发，配置中禁用时返回 False"""
+        if not self.config.get('enabled', True):
+            return False
+        capture_bus.register(self.sink)
+        self._stop.clear()
+        if self.config.get('hotkey') and self._hotkey_listener is None:
+            self._start_hotkey()
+        if self.config.get('flag_file') and not (self._flag_thread and self._flag_thread.is_alive()):
+            self._flag_thread = threading.Thread(target=self._watch_flag, name='flight-flag', daemon=True)
+            self._flag_thread.start()
+        logger.info(
+            f"飞行记录器已启动，容量 {self.sink.capacity} 个事件，模式 {self.config.get('mode', 'full')}"
+        )
+        return True
+
+    def stop(self) -> None:
+        """注销接收端并停止触发器"""
+        capture_bus.unregister(self.sink.name)
+        self._stop.set()
+        if self._hotkey_listener is not None:
+            self._hotkey_listener.stop()
+            self._hotkey_listener = None
+
+    def _start_hotkey(self) -> None:
+        try:
+            from pynput import keyboard
+            self._hotkey_listener = keyboard.GlobalHotKeys({
+                self.config['hotkey']: lambda: self.dump_async('hotkey')
+            })
+            self._hotkey_listener.daemon = True
+            self._hotkey_listener.start()
+        except Exception as e:
+            logger.error(f"注册飞行记录器热键时发生错误: {str(e)}")
+
+    def _watch_flag(self) -> None:
+        """轮询标志文件，出现时删除并转储"""
+        path = self.config['flag_file']
+        while not self._stop.wait(self.config['flag_poll_seconds']):
+            if not os.path.exists(path):
+                continue
+            seconds = None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read().strip()
+                seconds = float(content) if content else None
+                os.remove(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取转储标志文件时发生错误: {str(e)}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.dump(seconds=seconds, reason='flag')
+
+    def check_ready(self, username: Optional[str] = None, password: Optional[str] = None) -> Optional[str]:
+        """
+        检查能否转储（需要已登录用户，启用镜像加密时还需要加密密码）
+
+        Returns:
+            不能转储的原因，可以转储时返回 None
+        """
+        if not (username or self.username):
+            return '尚未登录，无法确定飞行记录所属用户'
+        if mouse_mirror.encryption_enabled and not (password or self.password):
+            return '镜像已启用加密，请先在界面中设置加密密码'
+        return None
+
+    def dump_async(self, reason: str = 'api', seconds: Optional[float] = None) -> None:
+        """在后台线程中转储，供热键等不能阻塞的回调使用"""
+        threading.Thread(target=self.dump, kwargs={'seconds': seconds, 'reason': reason}, daemon=True).start()
+
+    def dump(
+        self,
+        username: Optional[str] = None,
+        seconds: Optional[float] = None,
+        password: Optional[str] = None,
+        reason: str = 'api'
+    ) -> Optional[str]:
+        """
+        把缓冲区中最近的事件写入镜像文件
+
+        Args:
+            username: 用户名，默认使用当前登录用户（未登录时不转储）
+            seconds: 转储最近多少秒，默认使用配置 window_seconds
+            password: 加密密码（镜像启用加密时需要）
+            reason: 触发来源，写入文件头
+
+        Returns:
+            镜像文件路径，没有事件、不能转储或保存失败时返回 None
+        """
+        problem = self.check_ready(username, password)
+        if problem:
+            logger.error(f"飞行记录转储失败({reason}): {problem}")
+            return None
+        username = username or self.username
+        seconds = self.config['window_seconds'] if seconds is None else seconds
+        with self._dump_lock:
+            with OPERATION_DURATION.labels('flight_dump').time():
+                rows = self.sink.snapshot(seconds)
+                if not rows.size:
+                    logger.warning("飞行记录器中没有事件可供转储")
+                    return None
+                events = rows_to_events(rows)
+                duration = float(rows['t'][-1] - rows['t'][0])
+                if self.sink.written > self.sink.capacity and duration < seconds:
+                    # 缓冲区已覆盖且事件率超过预期，窗口开头的事件已丢失
+                    logger.warning(
+                        f"飞行记录器缓冲区已写满覆盖，转储只包含最近 {duration:.1f}秒"
+                        f"（请求 {seconds}秒），可调大 capacity 或 max_event_rate"
+                    )
+                filepath = mouse_mirror.write_mirror(
+                    username, events, duration, password or self.password,
+                    extra={
+                        'source': 'flight_recorder',
+                        'trigger': reason,
+                        'start_time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(rows['t'][0]))
+                    }
+                )
+        if filepath:
+            logger.info(f"飞行记录已转储({reason}): {filepath}，最近 {duration:.1f}秒 {len(events)} 个事件")
+        return filepath
+
+# 创建全局飞行记录器实例
+flight_recorder = FlightRecorder()
@@ -4,26 +4,54 @@ GUI管理模块
 """
 
 from nicegui import ui, app
+from fastapi import Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+import os
+import time
 import asyncio
 from datetime import datetime
-import logging
+from log_config import get_logger, setup_logging
 from session_manager import handle_login, logout_windows
 from mouse_recorder import update_recording_info
 from mouse_mirror import mouse_mirror
 from auth_manager import auth_manager
 from theme_config import theme_manager
+from metrics import registry, EVENTS_CAPTURED, BUFFER_SIZE, OPERATION_DURATION, PLAYBACK_ERROR
+from profiler import profiler
+from event_bus import capture_bus, CallbackSink
+from record_loader import is_recording_file
+from segmentation import load_segments
+from mouse_player import MousePlayer
+from flight_recorder import flight_recorder
+
+RECORD_DIR = 'mouse_records'
+LOCAL_HOSTS = ('127.0.0.1', '::1', 'localhost')
+SEGMENT_COLUMNS = [
+    {'name': 'index', 'label': '序号', 'field': 'index'},
+    {'name': 'start', 'label': '开始', 'field': 'start'},
+    {'name': 'duration', 'label': '时长(秒)', 'field': 'duration'},
+    {'name': 'reason', 'label': '分段原因', 'field': 'reason'},
+    {'name': 'events', 'label': '事件', 'field': 'events'},
+    {'name': 'clicks', 'label': '点击', 'field': 'clicks'},
+    {'name': 'bbox', 'label': '区域', 'field': 'bbox'},
+]
 
 class GUIManager:
     def __init__(self):
         self.username = None
         self.login_status = False
         self.encryption_password = None  # 存储加密密码
+        self._last_event_counts = {}  # 上次刷新时各类型事件数，用于计算速率
+        self._last_metrics_time = time.monotonic()
+        self.last_event = None  # 实时视图：最近一次采集的事件
+        self.segment_file = None  # 分段面板当前选择的记录文件
+        self.player = None  # 片段回放器，首次跳转时创建
         self._setup_logging()
+        capture_bus.register(CallbackSink('live_view', self._on_live_event))
     
     def _setup_logging(self):
         """配置界面日志"""
-        self.logger = logging.getLogger('gui')
-        self.logger.setLevel(logging.INFO)
+        self.logger = get_logger('gui')
     
     def create_login_page(self):
         """创建登录页面"""
@@ -161,6 +189,138 @@ class GUIManager:
                         step=2,
                         on_change=lambda e: self.update_theme(button_radius=e.value)
                     ).classes('w-32')
+            
+            # 添加运行指标面板
+            with ui.expansion('运行指标', icon='insights').classes('w-full mt-4'):
+                self.metrics_label = ui.label().classes('text-xs whitespace-pre font-mono')
+                ui.timer(1.0, self.update_metrics_panel)
+                with ui.row().classes('w-full justify-center mt-2'):
+                    ui.button('采样分析30秒', on_click=self.handle_profile_click).classes('w-32')
+                    ui.button('转储飞行记录', on_click=self.handle_flight_dump_click).classes('w-32')
+            
+            # 添加记录分段面板
+            with ui.expansion('记录分段', icon='view_timeline').classes('w-full mt-4'):
+                ui.select(
+                    options=self._list_record_files(),
+                    label='记录文件',
+                    on_change=self.handle_segment_file_change
+                ).classes('w-full')
+                self.segment_table = ui.table(
+                    columns=SEGMENT_COLUMNS, rows=[], row_key='index', selection='single'
+                ).classes('w-full text-xs')
+                with ui.row().classes('w-full justify-center mt-2'):
+                    ui.button('跳转回放', on_click=self.handle_segment_play_click).classes('w-32')
+    
+    def _list_record_files(self):
+        """当前用户的记录文件（最新的在前）"""
+        if not os.path.isdir(RECORD_DIR):
+            return []
+        prefix = f'record_{self.username}_'
+        names = [
+            name for name in os.listdir(RECORD_DIR)
+            if name.startswith(prefix) and is_recording_file(name)
+        ]
+        return sorted(names, reverse=True)
+    
+    async def handle_segment_file_change(self, e):
+        """选择记录文件后加载分段索引"""
+        try:
+            self.segment_file = os.path.join(RECORD_DIR, e.value)
+            index = await app.run_in_thread(load_segments, self.segment_file)
+            self.segment_table.rows = [
+                {
+                    'index': segment['index'],
+                    'start': segment['start_time'] or f"{segment['start']:.1f}s",
+                    'duration': round(segment['end'] - segment['start'], 1),
+                    'reason': segment['reason'],
+                    'events': segment['events'],
+                    'clicks': segment['clicks'],
+                    'bbox': '({},{})-({},{})'.format(*segment['bbox'])
+                }
+                for segment in index['segments']
+            ]
+            self.segment_table.selected = []
+            self.segment_table.update()
+        except Exception as e:
+            self.logger.error(f"加载记录分段时发生错误: {str(e)}")
+            ui.notify('加载记录分段失败', type='negative')
+    
+    async def handle_segment_play_click(self):
+        """跳转回放选中的片段"""
+        if not self.segment_file or not self.segment_table.selected:
+            ui.notify('请先选择记录文件和片段', type='warning')
+            return
+        try:
+            segment_index = self.segment_table.selected[0]['index']
+            if self.player is None:
+                self.player = MousePlayer()
+            ui.notify(f'开始回放片段 {segment_index}')
+            count = await app.run_in_thread(self.player.play_segment, self.segment_file, segment_index)
+            ui.notify(f'片段回放完成，共 {count} 个事件')
+        except Exception as e:
+            self.logger.error(f"回放记录片段时发生错误: {str(e)}")
+            ui.notify('回放记录片段失败', type='negative')
+    
+    def _on_live_event(self, event):
+        """实时视图接收端，只保存最近事件的引用"""
+        self.last_event = event
+    
+    async def handle_profile_click(self):
+        """开启一次采样分析"""
+        if profiler.start(30.0):
+            ui.notify('采样分析已开始，结果将保存到 logs 目录')
+        else:
+            ui.notify('采样分析正在进行中', type='warning')
+    
+    async def handle_flight_dump_click(self):
+        """把最近一段时间的操作转储为镜像文件"""
+        try:
+            problem = flight_recorder.check_ready(self.username, self.encryption_password)
+            if problem:
+                ui.notify(problem, type='warning')
+                return
+            filepath = await app.run_in_thread(
+                flight_recorder.dump, self.username, None, self.encryption_password, 'gui'
+            )
+            if filepath:
+                ui.notify(f'飞行记录已保存: {os.path.basename(filepath)}')
+            else:
+                ui.notify('没有可转储的飞行记录', type='warning')
+        except Exception as e:
+            self.logger.error(f"转储飞行记录时发生错误: {str(e)}")
+            ui.notify('转储飞行记录失败', type='negative')
+    
+    def update_metrics_panel(self):
+        """刷新运行指标面板"""
+        try:
+            now = time.monotonic()
+            elapsed = max(now - self._last_metrics_time, 1e-6)
+            self._last_metrics_time = now
+            
+            lines = []
+            if self.last_event is not None:
+                lines.append(f'最近事件：{self.last_event.type} {self.last_event.position}')
+            lines.append('事件采集：')
+            for (event_type,), child in sorted(EVENTS_CAPTURED.items()):
+                rate = (child.value - self._last_event_counts.get(event_type, 0)) / elapsed
+                self._last_event_counts[event_type] = child.value
+                lines.append(f'  {event_type:<16}{int(child.value):>10}  {rate:>8.1f}/秒')
+            
+            lines.append('缓存事件数：')
+            for (buffer,), child in sorted(BUFFER_SIZE.items()):
+                lines.append(f'  {buffer:<16}{int(child.get()):>10}')
+            
+            lines.append('平均耗时：')
+            for (operation,), child in sorted(OPERATION_DURATION.items()):
+                if child.count:
+                    lines.append(f'  {operation:<16}{child.sum / child.count * 1000:>10.1f}毫秒')
+            for (player,), child in sorted(PLAYBACK_ERROR.items()):
+                if child.count:
+                    lines.append(f'  回放偏差[{player}]{child.sum / child.count * 1000:>8.2f}毫秒')
+            
+            self.metrics_label.text = '\n'.join(lines)
+        except Exception as e:
+            self.logger.error(f"刷新运行指标时发生错误: {str(e)}")
     
     async def handle_compression_change(self, e):
         """处理压缩等级变更"""
@@ -244,6 +404,7 @@ class GUIManager:
         """处理密码变更"""
         try:
             self.encryption_password = e.value
+            flight_recorder.password = e.value  # 热键、标志文件和接口触发的转储使用同一密码
             self.logger.info("加密密码已更新")
         except Exception as e:
             self.logger.error(f"更新加密密码时发生错误: {str(e)}")
@@ -289,9 +450,29 @@ def start_gui():
     def shutdown():
         """程序关闭时的清理工作"""
         if gui_manager.login_status:
-            logging.info("程序正在关闭，执行清理...")
+            gui_manager.logger.info("程序正在关闭，执行清理...")
             logout_windows()
     
+    @app.post('/flight_dump')
+    def flight_dump_endpoint(request: Request, seconds: float = None):
+        """转储飞行记录，返回镜像文件名（仅接受本机请求）"""
+        if request.client is None or request.client.host not in LOCAL_HOSTS:
+            gui_manager.logger.warning(f"拒绝来自 {request.client.host if request.client else '未知地址'} 的飞行记录转储请求")
+            return JSONResponse({'error': '仅允许本机请求'}, status_code=403)
+        problem = flight_recorder.check_ready()
+        if problem:
+            return JSONResponse({'error': problem}, status_code=409)
+        filepath = flight_recorder.dump(seconds=seconds, reason='http')
+        return {'file': os.path.basename(filepath) if filepath else None}
+    
+    @app.get('/metrics')
+    def metrics_endpoint():
+        """以 Prometheus 文本格式导出运行指标"""
+        return PlainTextResponse(
+            registry.render(),
+            media_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+    
     # 创建初始页面
     gui_manager.create_login_page()
     
@@ -306,4 +487,5 @@ def start_gui():
     )
 
 if __name__ == "__main__":
+    setup_logging()
     start_gui() 
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""
+屏幕热力图聚合模块
+每次保存记录时把移动和点击位置增量累加到按用户、按天持久化的二维直方图中，
+同时维护按日期累计的前缀和矩阵与日期索引，查询任意时间范围时每个用户只需
+加载两个累计矩阵相减，无需扫描目录或逐天求和
+"""
+
+import os
+import json
+import bisect
+import threading
+import numpy as np
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from record_loader import MOVE, PRESS
+from log_config import get_logger
+
+logger = get_logger('heatmap')
+
+HEATMAP_DIR = 'mouse_heatmaps'
+CELL_SIZE = 8  # 每个格子对应的像素边长
+SCREEN_WIDTH = 3840  # 支持的最大屏幕宽度
+SCREEN_HEIGHT = 2160  # 支持的最大屏幕高度
+KINDS = ('move', 'click')
+CACHE_SIZE = 32  # 缓存的矩阵文件数，每项约 1-2MB
+CUMULATIVE_DIR = 'cumulative'  # 前缀和矩阵子目录：某天的文件为该用户截至当天(含)的总计数
+INDEX_FILE = 'index.json'  # 有数据的日期列表（升序）
+
+class HeatmapStore:
+    """按用户和日期持久化的热力图累加器"""
+    def __init__(self, root: str = HEATMAP_DIR, cell_size: int = CELL_SIZE,
+                 width: int = SCREEN_WIDTH, height: int = SCREEN_HEIGHT):
+        self.root = root
+        self.cell_size = cell_size
+        self.shape = (height // cell_size, width // cell_size)
+        self._cache: 'OrderedDict[str, Tuple[float, Dict[str, np.ndarray]]]' = OrderedDict()  # 路径 -> (修改时间, 矩阵)，按最近使用排序
+        self._cache_lock = threading.Lock()
+        self._lock = threading.RLock()
+
+    def _path(self, username: str, day: date) -> str:
+        return os.path.join(self.root, username, f'{day.isoformat()}.npz')
+
+    def _cumulative_path(self, username: str, day: date) -> str:
+        return os.path.join(self.root, username, CUMULATIVE_DIR, f'{day.isoformat()}.npz')
+
+    def _save(self, path: str, arrays: Dict[str, np.ndarray]) -> None:
+        """原子地写入矩阵文件并使缓存失效"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        # 矩阵大部分为零，压缩后每个文件只有几 KB
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        with self._cache_lock:
+            self._cache.pop(path, None)
+
+    def _write_index(self, username: str, days: List[date]) -> None:
+        path = os.path.join(self.root, username, INDEX_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump([day.isoformat() for day in days], f)
+        os.replace(tmp_path, path)
+
+    def _days(self, username: str) -> List[date]:
+        """
+        读取用户的日期索引，索引缺失时（旧数据或被删除）从按天文件重建一次
+
+        Returns:
+            升序的日期列表
+        """
+        try:
+            with open(os.path.join(self.root, username, INDEX_FILE), encoding='utf-8') as f:
+                return [date.fromisoformat(value) for value in json.load(f)]
+        except FileNotFoundError:
+            return self._rebuild(username)
+
+    def _rebuild(self, username: str) -> List[date]:
+        """根据按天文件重新生成前缀和矩阵与日期索引"""
+        user_dir = os.path.join(self.root, username)
+        if not os.path.isdir(user_dir):
+            return []
+        with self._lock:
+            days = []
+            for filename in os.listdir(user_dir):
+                if not filename.endswith('.npz') or filename.endswith('.tmp.npz'):
+                    continue
+                try:
+                    days.append(date.fromisoformat(filename[:-4]))
+                except ValueError:
+                    continue
+            days.sort()
+
+            running = {kind: np.zeros(self.shape, dtype=np.int64) for kind in KINDS}
+            for day in days:
+                for kind, array in self._load(self._path(username, day)).items():
+                    running[kind] += array
+                self._save(self._cumulative_path(username, day), running)
+            self._write_index(username, days)
+            logger.info(f"已重建用户 {username} 的热力图累计索引，共 {len(days)} 天")
+            return days
+
+    def _load(self, path: str) -> Dict[str, np.ndarray]:
+        """加载某天的累加矩阵（带 LRU 缓存，最多保留 CACHE_SIZE 天）"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {kind: np.zeros(self.shape, dtype=np.int32) for kind in KINDS}
+
+        with self._cache_lock:
+            cached = self._cache.get(path)
+            if cached and cached[0] == mtime:
+                self._cache.move_to_end(path)
+                return cached[1]
+        with np.load(path) as data:
+            arrays = {kind: data[kind] for kind in KINDS}
+        with self._cache_lock:
+            self._cache[path] = (mtime, arrays)
+            self._cache.move_to_end(path)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return arrays
+
+    def _histogram(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """将坐标落入格子并计数"""
+        rows, cols = self.shape
+        ix = np.clip((x // self.cell_size).astype(np.int64), 0, cols - 1)
+        iy = np.clip((y // self.cell_size).astype(np.int64), 0, rows - 1)
+        counts = np.bincount(iy * cols + ix, minlength=rows * cols)
+        return counts.reshape(self.shape).astype(np.int32)
+
+    def add_recording(self, username: Optional[str], columns: Dict[str, Any]) -> None:
+        """
+        将一次记录合并到对应用户、对应日期的累加矩阵
+
+        Args:
+            username: 用户名
+            columns: record_loader.to_columns 返回的列式数据
+        """
+        t = columns['t']
+        if t.size == 0:
+            return
+        username = username or 'unknown'
+        base_time = columns['base_time'] or datetime.now().timestamp()
+
+        # 按本地日期切分（跨零点的会话拆分到两天）
+        first_day = datetime.fromtimestamp(base_time).date()
+        midnight = datetime(first_day.year, first_day.month, first_day.day).timestamp()
+        day_index = ((base_time - midnight + t) // 86400).astype(np.int64)
+
+        with self._lock:
+            days = self._days(username)
+            for offset in np.unique(day_index):
+                in_day = day_index == offset
+                day = first_day + timedelta(days=int(offset))
+                moves = in_day & (columns['code'] == MOVE)
+                clicks = in_day & (columns['code'] == PRESS)
+                delta = {
+                    'move': self._histogram(columns['x'][moves], columns['y'][moves]),
+                    'click': self._histogram(columns['x'][clicks], columns['y'][clicks]),
+                }
+
+                path = self._path(username, day)
+                self._save(path, {kind: array + delta[kind] for kind, array in self._load(path).items()})
+
+                # 新的一天以前一天的累计值为起点；之后每一天的累计值都要加上本次增量
+                # （通常记录的是最新一天，此时只写一个文件）
+                position = bisect.bisect_left(days, day)
+                if position == len(days) or days[position] != day:
+                    previous = (
+                        self._load(self._cumulative_path(username, days[position - 1]))
+                        if position > 0 else {}
+                    )
+                    self._save(self._cumulative_path(username, day), {
+                        kind: previous.get(kind, 0) + delta[kind].astype(np.int64) for kind in KINDS
+                    })
+                    days.insert(position, day)
+                else:
+                    cumulative_path = self._cumulative_path(username, day)
+                    self._save(cumulative_path, {
+                        kind: array + delta[kind] for kind, array in self._load(cumulative_path).items()
+                    })
+                for later in days[position + 1:]:
+                    cumulative_path = self._cumulative_path(username, later)
+                    self._save(cumulative_path, {
+                        kind: array + delta[kind] for kind, array in self._load(cumulative_path).items()
+                    })
+            self._write_index(username, days)
+
+        logger.info(f"已合并用户 {username} 的热力图数据")
+
+    def users(self) -> Iterable[str]:
+        """列出有热力图数据的用户"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def query(
+        self,
+        kind: str = 'move',
+        users: Optional[Iterable[str]] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        region: Optional[Tuple[int, int, int, int]] = None
+    ) -> np.ndarray:
+        """
+        查询聚合热力图
+
+        Args:
+            kind: 'move' 或 'click'
+            users: 用户列表，默认全部用户
+            start: 起始日期(含)
+            end: 结束日期(含)
+            region: 屏幕区域 (left, top, right, bottom)，单位像素
+
+        Returns:
+            格子计数矩阵
+        """
+        if kind not in KINDS:
+            raise ValueError(f"不支持的热力图类型: {kind}")
+
+        total = np.zeros(self.shape, dtype=np.int64)
+        for username in (users or self.users()):
+            days = self._days(username)
+            # 范围总计 = 截至 end 的累计 - 截至 start 前一天的累计
+            upper = bisect.bisect_right(days, end) if end else len(days)
+            lower = bisect.bisect_left(days, start) if start else 0
+            if upper <= lower:
+                continue
+            total += self._load(self._cumulative_path(username, days[upper - 1]))[kind]
+            if lower > 0:
+                total -= self._load(self._cumulative_path(username, days[lower - 1]))[kind]
+
+        if region:
+            left, top, right, bottom = (value // self.cell_size for value in region)
+            total = total[top:bottom + 1, left:right + 1]
+        return total
+
+    def render(self, heatmap: np.ndarray, output: str, title: str = '') -> str:
+        """
+        将热力图保存为图片
+
+        Args:
+            heatmap: query 返回的矩阵
+            output: 图片路径
+            title: 图片标题
+        """
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(12, 7))
+        plt.imshow(np.log1p(heatmap), cmap='hot', interpolation='nearest')
+        plt.colorbar(label='log(1 + 次数)')
+        plt.title(title)
+        plt.axis('off')
+        plt.savefig(output, bbox_inches='tight')
+        plt.close()
+        return output
+
+# 创建全局热力图存储实例
+heatmap_store = HeatmapStore()
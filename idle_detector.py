@@ -0,0 +1,147 @@
+"""
+空闲检测模块
+在采集路径上在线判断工作站是否空闲：超过空闲时间阈值且光标只在小半径内抖动时，
+停止缓存这些抖动移动；恢复真实操作时先补发一个紧凑的 idle 标记事件
+{duration: 空闲秒数, suppressed: 被丢弃的事件数}，再立即放行该操作
+"""
+
+import json
+import threading
+from typing import Optional, Tuple
+from log_config import get_logger
+
+logger = get_logger('idle')
+
+IDLE_CONFIG = 'config/idle.json'
+DEFAULT_IDLE_AFTER = 30.0  # 无有效操作超过该秒数后进入空闲
+DEFAULT_RADIUS = 3.0  # 相对最后一次有效操作位置的抖动半径(像素)
+IDLE_EVENT = 'idle'
+
+# 标记事件: (x, y, 时间戳, 空闲秒数, 丢弃事件数)
+IdleMarker = Tuple[int, int, float, float, int]
+
+class IdleDetector:
+    """
+    流式空闲检测器
+    只保存锚点坐标和几个标量，每个事件 O(1) 判断，不缓存任何事件
+    """
+    def __init__(self, idle_after: float = DEFAULT_IDLE_AFTER, radius: float = DEFAULT_RADIUS):
+        """
+        Args:
+            idle_after: 空闲时间阈值(秒)
+            radius: 移动半径阈值(像素)，半径内的移动视为抖动
+        """
+        self.idle_after = idle_after
+        self.radius_sq = radius * radius
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """清空状态"""
+        self.anchor: Optional[Tuple[int, int]] = None  # 最后一次有效操作的位置
+        self.last_activity: Optional[float] = None  # 最后一次有效操作的时间
+        self.idle_since: Optional[float] = None  # 进入空闲的时间，None 表示活动中
+        self.suppressed = 0  # 本次空闲期间丢弃的事件数
+        self.total_suppressed = 0
+        self.idle_periods = 0
+        self.idle_seconds = 0.0
+
+    @property
+    def idle(self) -> bool:
+        return self.idle_since is not None
+
+    def observe(self, event_type: str, x: int, y: int, timestamp: float) -> Tuple[bool, Optional[IdleMarker]]:
+        """
+        判断事件是否应当记录
+
+        Args:
+            event_type: 事件类型
+            x, y: 坐标
+            timestamp: 事件时间
+
+        Returns:
+            (是否记录该事件, 需要在该事件之前补发的空闲标记)
+        """
+        with self._lock:
+            jitter = False
+            if event_type == 'move' and self.anchor is not None:
+                dx = x - self.anchor[0]
+                dy = y - self.anchor[1]
+                jitter = dx * dx + dy * dy <= self.radius_sq
+
+            if jitter:
+                if self.idle_since is None and timestamp - self.last_activity >= self.idle_after:
+                    self.idle_since = timestamp
+                    self.suppressed = 0
+                if self.idle_since is not None:
+                    self.suppressed += 1
+                    self.total_suppressed += 1
+                    return False, None
+                return True, None
+
+            # 有效操作：更新锚点，如处于空闲则结束空闲并生成标记
+            marker = None
+            if self.idle_since is not None:
+                duration = timestamp - self.idle_since
+                marker = (self.anchor[0], self.anchor[1], self.idle_since, duration, self.suppressed)
+                self.idle_periods += 1
+                self.idle_seconds += duration
+                self.idle_since = None
+                self.suppressed = 0
+            self.anchor = (x, y)
+            self.last_activity = timestamp
+            return True, marker
+
+    def flush(self, timestamp: float) -> Optional[IdleMarker]:
+        """
+        结束当前空闲期（保存记录前调用），保证最后一段空闲也留下标记
+
+        Returns:
+            空闲标记，未处于空闲时返回 None
+        """
+        with self._lock:
+            if self.idle_since is None:
+                return None
+            duration = timestamp - self.idle_since
+            marker = (self.anchor[0], self.anchor[1], self.idle_since, duration, self.suppressed)
+            self.idle_periods += 1
+            self.idle_seconds += duration
+            self.idle_since = None
+            self.suppressed = 0
+            self.last_activity = timestamp
+            return marker
+
+    def stats(self) -> dict:
+        """获取统计信息"""
+        return {
+            'idle': self.idle,
+            'idle_periods': self.idle_periods,
+            'idle_seconds': round(self.idle_seconds, 3),
+            'suppressed': self.total_suppressed
+        }
+
+def load_idle_config() -> dict:
+    """读取空闲检测配置"""
+    try:
+        with open(IDLE_CONFIG, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def create_idle_detector() -> Optional[IdleDetector]:
+    """
+    根据配置创建空闲检测器
+
+    配置示例 (config/idle.json):
+        {"enabled": true, "idle_after": 30, "radius": 3}
+
+    Returns:
+        空闲检测器，配置中禁用时返回 None
+    """
+    config = load_idle_config()
+    if not config.get('enabled', True):
+        return None
+    return IdleDetector(
+        float(config.get('idle_after', DEFAULT_IDLE_AFTER)),
+        float(config.get('radius', DEFAULT_RADIUS))
+    )
@@ -0,0 +1,394 @@
+"""
+输入注入模块
+把回放事件转换为底层鼠标输入，同一调度时间片内到期的事件合并为一次批量注入调用
+支持移动、所有按键（左/右/中/X1/X2）以及垂直和水平滚动，并统计每批注入耗时
+"""
+
+import sys
+import time
+import ctypes
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from log_config import get_logger
+from metrics import INJECTION_BATCH_SIZE, INJECTION_COST, PLAYBACK_ERROR
+
+logger = get_logger('injector')
+
+# 输入动作类型
+MOVE = 0
+BUTTON_DOWN = 1
+BUTTON_UP = 2
+WHEEL = 3
+HWHEEL = 4
+
+BUTTONS = ('left', 'right', 'middle', 'x1', 'x2')
+WHEEL_DELTA = 120
+DEFAULT_SLOT = 0.002  # 调度时间片(秒)
+
+# 动作: (类型, x, y, 数据)  数据为按键名或滚动格数
+Action = Tuple[int, int, int, Any]
+
+def event_actions(event: Dict[str, Any]) -> List[Action]:
+    """
+    把一个事件转换为输入动作
+    兼容记录文件的 click_press/scroll_up 形式和镜像文件的 click/scroll 形式，
+    旧文件中没有按键或滚动参数时按左键、单格滚动处理
+    """
+    x, y = event['position']
+    event_type = event['type']
+    params = event.get('params') or {}
+
+    if event_type == 'move':
+        return [(MOVE, x, y, None)]
+    if event_type == 'idle':
+        return []  # 空闲标记不产生输入，只占用时间
+    if event_type in ('click_press', 'click_release', 'click'):
+        if event_type == 'click':
+            pressed = params.get('pressed', True)
+        else:
+            pressed = event_type == 'click_press'
+        button = params.get('button', 'left')
+        if button not in BUTTONS:
+            button = 'left'
+        return [(BUTTON_DOWN if pressed else BUTTON_UP, x, y, button)]
+    if event_type in ('scroll_up', 'scroll_down', 'scroll'):
+        dy = params.get('dy')
+        if dy is None:
+            dy = 1 if event_type == 'scroll_up' else -1 if event_type == 'scroll_down' else 0
+        dx = params.get('dx', 0)
+        actions = []
+        if dy:
+            actions.append((WHEEL, x, y, dy))
+        if dx:
+            actions.append((HWHEEL, x, y, dx))
+        return actions or [(MOVE, x, y, None)]
+    return [(MOVE, x, y, None)]
+
+class SendInputBackend:
+    """
+    基于 SendInput 的注入后端
+    每个动作生成一个带绝对坐标的 MOUSEINPUT，一批动作通过一次 SendInput 调用注入
+    """
+    MOUSEEVENTF_MOVE = 0x0001
+    MOUSEEVENTF_VIRTUALDESK = 0x4000
+    MOUSEEVENTF_ABSOLUTE = 0x8000
+    MOUSEEVENTF_WHEEL = 0x0800
+    MOUSEEVENTF_HWHEEL = 0x1000
+    BUTTON_FLAGS = {
+        'left': (0x0002, 0x0004, 0),
+        'right': (0x0008, 0x0010, 0),
+        'middle': (0x0020, 0x0040, 0),
+        'x1': (0x0080, 0x0100, 1),
+        'x2': (0x0080, 0x0100, 2),
+    }
+    INPUT_MOUSE = 0
+    SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN = 76, 77, 78, 79
+
+    def __init__(self):
+        from ctypes import wintypes
+        self.user32 = ctypes.WinDLL('user32', use_last_error=True)
+
+        class MOUSEINPUT(ctypes.Structure):
+            _fields_ = (
+                ('dx', wintypes.LONG),
+                ('dy', wintypes.LONG),
+                ('mouseData', wintypes.DWORD),
+                ('dwFlags', wintypes.DWORD),
+                ('time', wintypes.DWORD),
+                ('dwExtraInfo', ctypes.POINTER(wintypes.ULONG)),
+            )
+
+        class KEYBDINPUT(ctypes.Structure):
+            _fields_ = (
+                ('wVk', wintypes.WORD),
+                ('wScan', wintypes.WORD),
+                ('dwFlags', wintypes.DWORD),
+                ('time', wintypes.DWORD),
+                ('dwExtraInfo', ctypes.POINTER(wintypes.ULONG)),
+            )
+
+        class _INPUTUNION(ctypes.Union):
+            # 联合体需要包含键盘输入，保证结构大小与系统定义一致
+            _fields_ = (('mi', MOUSEINPUT), ('ki', KEYBDINPUT))
+
+        class INPUT(ctypes.Structure):
+            _anonymous_ = ('u',)
+            _fields_ = (('type', wintypes.DWORD), ('u', _INPUTUNION))
+
+        self.INPUT = INPUT
+        self.MOUSEINPUT = MOUSEINPUT
+        self.user32.SendInput.argtypes = (wintypes.UINT, ctypes.POINTER(INPUT), ctypes.c_int)
+        self.user32.SendInput.restype = wintypes.UINT
+        self.refresh_screen()
+
+    def refresh_screen(self) -> None:
+        """读取虚拟桌面范围（多显示器时坐标可能为负）"""
+        metrics = self.user32.GetSystemMetrics
+        self.left = metrics(self.SM_XVIRTUALSCREEN)
+        self.top = metrics(self.SM_YVIRTUALSCREEN)
+        self.width = max(metrics(self.SM_CXVIRTUALSCREEN), 1)
+        self.height = max(metrics(self.SM_CYVIRTUALSCREEN), 1)
+
+    def _normalize(self, x: int, y: int) -> Tuple[int, int]:
+        """屏幕坐标转换为 0-65535 的绝对坐标"""
+        nx = (x - self.left) * 65535 // max(self.width - 1, 1)
+        ny = (y - self.top) * 65535 // max(self.height - 1, 1)
+        return min(max(nx, 0), 65535), min(max(ny, 0), 65535)
+
+    def send(self, actions: List[Action]) -> int:
+        """注入一批动作，返回系统实际接受的输入数"""
+        inputs = (self.INPUT * len(actions))()
+        base_flags = self.MOUSEEVENTF_MOVE | self.MOUSEEVENTF_ABSOLUTE | self.MOUSEEVENTF_VIRTUALDESK
+        for item, (kind, x, y, data) in zip(inputs, actions):
+            item.type = self.INPUT_MOUSE
+            item.mi.dx, item.mi.dy = self._normalize(x, y)
+            flags = base_flags
+            if kind == BUTTON_DOWN or kind == BUTTON_UP:
+                down, up, xbutton = self.BUTTON_FLAGS[data]
+                flags |= down if kind == BUTTON_DOWN else up
+                item.mi.mouseData = xbutton
+            elif kind == WHEEL or kind == HWHEEL:
+                flags |= self.MOUSEEVENTF_WHEEL if kind == WHEEL else self.MOUSEEVENTF_HWHEEL
+                item.mi.mouseData = ctypes.c_uint32(int(data * WHEEL_DELTA)).value
+            item.mi.dwFlags = flags
+        sent = self.user32.SendInput(len(actions), inputs, ctypes.sizeof(self.INPUT))
+        if sent != len(actions):
+            logger.warning(f"SendInput 只注入了 {sent}/{len(actions)} 个输入: 错误码 {ctypes.get_last_error()}")
+        return sent
+
+    def prepare(self, plan) -> Tuple[Any, Any]:
+        """
+        把回放计划一次性转换为 INPUT 数组
+        用与 INPUT 内存布局一致的 NumPy 结构化数组向量化填充，回放时按批次区间直接传给 SendInput
+        """
+        self.refresh_screen()
+        size = ctypes.sizeof(self.INPUT)
+        base = self.INPUT.u.offset
+        layout = np.dtype({
+            'names': ['type', 'dx', 'dy', 'mouseData', 'dwFlags'],
+            'formats': ['<u4', '<i4', '<i4', '<u4', '<u4'],
+            'offsets': [
+                self.INPUT.type.offset,
+                base + self.MOUSEINPUT.dx.offset,
+                base + self.MOUSEINPUT.dy.offset,
+                base + self.MOUSEINPUT.mouseData.offset,
+                base + self.MOUSEINPUT.dwFlags.offset
+            ],
+            'itemsize': size
+        })
+        records = np.zeros(len(plan), dtype=layout)
+        records['type'] = self.INPUT_MOUSE
+        x = plan.x.astype(np.int64)
+        y = plan.y.astype(np.int64)
+        records['dx'] = np.clip((x - self.left) * 65535 // max(self.width - 1, 1), 0, 65535)
+        records['dy'] = np.clip((y - self.top) * 65535 // max(self.height - 1, 1), 0, 65535)
+
+        flags = np.full(len(plan), self.MOUSEEVENTF_MOVE | self.MOUSEEVENTF_ABSOLUTE | self.MOUSEEVENTF_VIRTUALDESK, dtype=np.uint32)
+        mouse_data = np.zeros(len(plan), dtype=np.uint32)
+        down_flags = np.array([self.BUTTON_FLAGS[b][0] for b in BUTTONS], dtype=np.uint32)
+        up_flags = np.array([self.BUTTON_FLAGS[b][1] for b in BUTTONS], dtype=np.uint32)
+        xbuttons = np.array([self.BUTTON_FLAGS[b][2] for b in BUTTONS], dtype=np.uint32)
+        for opcode, table in ((BUTTON_DOWN, down_flags), (BUTTON_UP, up_flags)):
+            mask = plan.opcodes == opcode
+            flags[mask] |= table[plan.data[mask]]
+            mouse_data[mask] = xbuttons[plan.data[mask]]
+        for opcode, flag in ((WHEEL, self.MOUSEEVENTF_WHEEL), (HWHEEL, self.MOUSEEVENTF_HWHEEL)):
+            mask = plan.opcodes == opcode
+            flags[mask] |= flag
+            mouse_data[mask] = plan.data[mask].astype(np.int32).view(np.uint32)
+        records['dwFlags'] = flags
+        records['mouseData'] = mouse_data
+        return records, ctypes.addressof((self.INPUT * len(plan)).from_buffer(records)) if len(plan) else 0
+
+    def send_range(self, prepared: Tuple[Any, Any], start: int, end: int) -> int:
+        """注入预先准备好的 INPUT 数组中的 [start, end) 区间"""
+        _, address = prepared
+        size = ctypes.sizeof(self.INPUT)
+        pointer = ctypes.cast(address + start * size, ctypes.POINTER(self.INPUT))
+        count = end - start
+        sent = self.user32.SendInput(count, pointer, size)
+        if sent != count:
+            logger.warning(f"SendInput 只注入了 {sent}/{count} 个输入: 错误码 {ctypes.get_last_error()}")
+        return sent
+
+class FakeInjectionBackend:
+    """
+    测试用注入后端
+    不依赖 Windows，记录每批收到的动作，可模拟每个输入的注入耗时
+    """
+    def __init__(self, cost_per_input: float = 0.0):
+        self.batches: List[List[Action]] = []
+        self.cost_per_input = cost_per_input
+
+    @property
+    def actions(self) -> List[Action]:
+        """按注入顺序展开的全部动作"""
+        return [action for batch in self.batches for action in batch]
+
+    def send(self, actions: List[Action]) -> int:
+        self.batches.append(list(actions))
+        if self.cost_per_input:
+            time.sleep(self.cost_per_input * len(actions))
+        return len(actions)
+
+    def prepare(self, plan):
+        return plan
+
+    def send_range(self, plan, start: int, end: int) -> int:
+        return self.send(plan.actions(start, end))
+
+class InjectionStats:
+    """注入统计"""
+    def __init__(self):
+        self.events = 0
+        self.inputs = 0
+        self.batches = 0
+        self.total_ns = 0  # 注入调用总耗时(纳秒)
+        self.max_ns = 0  # 单批最大耗时(纳秒)
+        self.max_lateness = 0.0  # 最大调度延迟(秒)
+
+    def snapshot(self) -> Dict[str, float]:
+        """获取统计快照"""
+        batches = self.batches
+        return {
+            'events': self.events,
+            'inputs': self.inputs,
+            'batches': batches,
+            'avg_batch_inputs': self.inputs / batches if batches else 0.0,
+            'avg_batch_us': (self.total_ns / batches / 1000) if batches else 0.0,
+            'max_batch_us': self.max_ns / 1000,
+            'max_lateness_ms': self.max_lateness * 1000
+        }
+
+class InputInjector:
+    """
+    批量输入注入器
+    按事件时间戳调度，到期时间落在同一时间片内的事件合并为一批注入
+    """
+    def __init__(self, backend=None, slot: float = DEFAULT_SLOT, label: str = 'player'):
+        """
+        Args:
+            backend: 注入后端，默认在 Windows 上使用 SendInputBackend
+            slot: 调度时间片(秒)，到期时间相差不超过该值的事件合并注入
+            label: 指标标签
+        """
+        self.backend = backend
+        self.slot = slot
+        self.label = label
+        self.stats = InjectionStats()
+
+    def _get_backend(self):
+        if self.backend is None:
+            if sys.platform != 'win32':
+                raise RuntimeError("SendInput 注入仅支持 Windows，其他平台请显式指定注入后端")
+            self.backend = SendInputBackend()
+        return self.backend
+
+    def inject(self, actions: List[Action]) -> int:
+        """立即注入一批动作并记录耗时"""
+        if not actions:
+            return 0
+        backend = self._get_backend()
+        start = time.perf_counter_ns()
+        sent = backend.send(actions)
+        self._record_batch(len(actions), time.perf_counter_ns() - start)
+        return sent
+
+    def _record_batch(self, inputs: int, elapsed: int) -> None:
+        """记录一批注入的输入数和耗时(纳秒)"""
+        stats = self.stats
+        stats.batches += 1
+        stats.inputs += inputs
+        stats.total_ns += elapsed
+        if elapsed > stats.max_ns:
+            stats.max_ns = elapsed
+        INJECTION_COST.labels(self.label).observe(elapsed / 1e9)
+        INJECTION_BATCH_SIZE.labels(self.label).observe(inputs)
+
+    def play(self, events: Iterable[Dict[str, Any]], time_origin: Optional[float] = None) -> int:
+        """
+        按时间戳回放事件
+
+        Args:
+            events: 事件列表或迭代器（按时间排序）
+            time_origin: 时间原点；镜像文件使用相对时间传 0，None 表示以首个事件时间为原点
+
+        Returns:
+            回放的事件数
+        """
+        timing_error = PLAYBACK_ERROR.labels(self.label)
+        iterator = iter(events)
+        pending = next(iterator, None)
+        if pending is None:
+            return 0
+        origin = pending['timestamp'] if time_origin is None else time_origin
+        start = time.perf_counter()
+        count = 0
+
+        while pending is not None:
+            wait_time = (pending['timestamp'] - origin) - (time.perf_counter() - start)
+            if wait_time > 0:
+                time.sleep(wait_time)
+
+            # 收集当前时间片内到期的全部事件
+            now = time.perf_counter() - start
+            horizon = now + self.slot
+            actions: List[Action] = []
+            while pending is not None:
+                due = pending['timestamp'] - origin
+                if due > horizon:
+                    break
+                lateness = now - due
+                timing_error.observe(abs(lateness))
+                if lateness > self.stats.max_lateness:
+                    self.stats.max_lateness = lateness
+                actions.extend(event_actions(pending))
+                count += 1
+                pending = next(iterator, None)
+
+            self.inject(actions)
+
+        self.stats.events += count
+        return count
+
+    def play_plan(self, plan, loops: int = 1) -> int:
+        """
+        回放预编译的回放计划（见 replay_plan）
+        批次边界在编译时已确定，回放循环每批只做一次等待和一次注入调用
+
+        Args:
+            plan: ReplayPlan
+            loops: 循环次数
+
+        Returns:
+            回放的事件数
+        """
+        if not len(plan):
+            return 0
+        backend = self._get_backend()
+        prepared = backend.prepare(plan)
+        times = plan.times.tolist()
+        bounds = plan.batches.tolist()
+        timing_error = PLAYBACK_ERROR.labels(self.label)
+        stats = self.stats
+        perf_counter = time.perf_counter
+        perf_counter_ns = time.perf_counter_ns
+
+        for _ in range(loops):
+            start = perf_counter()
+            for index in range(len(bounds) - 1):
+                first, last = bounds[index], bounds[index + 1]
+                due = times[first]
+                wait_time = due - (perf_counter() - start)
+                if wait_time > 0:
+                    time.sleep(wait_time)
+                lateness = perf_counter() - start - due
+                timing_error.observe(abs(lateness))
+                if lateness > stats.max_lateness:
+                    stats.max_lateness = lateness
+
+                begin = perf_counter_ns()
+                backend.send_range(prepared, first, last)
+                self._record_batch(last - first, perf_counter_ns() - begin)
+            stats.events += plan.events
+        return plan.events * loops
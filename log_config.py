@@ -0,0 +1,203 @@
+"""
+统一日志模块
+所有日志记录先进入内存队列，由后台线程写入按子系统划分的日志文件
+支持按大小和时间轮转，并按保留天数清理旧日志
+文件处理器只在主进程中由入口调用 setup_logging() 创建；进程池工作进程只挂空处理器，
+避免多个进程同时追加和轮转同一日志文件（Windows 上轮转会因文件占用失败）
+"""
+
+import os
+import re
+import glob
+import time
+import queue
+import atexit
+import logging
+import threading
+import multiprocessing
+import logging.handlers
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+LOG_DIR = 'logs'
+LOG_FORMAT = '%(asctime)s [%(name)s] %(levelname)s: %(message)s'
+
+# 汇总日志文件（包含所有子系统）
+COMBINED_LOG = 'app.log'
+
+# 子系统日志文件 -> 写入该文件的日志器名称
+SUBSYSTEM_LOGS: Dict[str, Tuple[str, ...]] = {
+    'mouse_control.log': ('controller',),
+    'mouse_recorder.log': ('recorder',),
+    'mouse_mirror.log': ('mirror',),
+    'playback.log': ('player',),
+    'easyfas_launcher.log': ('launcher',),
+    'startup.log': ('startup', 'main', 'readiness'),
+    'mouse_events.log': ('tracker',),
+    'gui.log': ('gui', 'auth', 'theme'),
+}
+
+# 轮转与保留策略
+MAX_BYTES = 10 * 1024 * 1024  # 单个日志文件最大10MB
+BACKUP_COUNT = 20  # 每个文件最多保留的轮转份数
+ROLLOVER_INTERVAL = 24 * 3600  # 按天轮转
+RETENTION_DAYS = 30  # 轮转文件保留天数
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_worker_silenced = False
+_lock = threading.Lock()
+
+class SubsystemFilter(logging.Filter):
+    """只放行指定日志器（及其子日志器）的记录"""
+    def __init__(self, names: Tuple[str, ...]):
+        super().__init__()
+        self.names = names
+        self.prefixes = tuple(f'{name}.' for name in names)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.name in self.names or record.name.startswith(self.prefixes)
+
+class SizedTimedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    同时按大小和时间轮转的文件处理器
+    轮转时删除超过保留天数的旧文件
+    """
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = MAX_BYTES,
+        backup_count: int = BACKUP_COUNT,
+        interval: int = ROLLOVER_INTERVAL,
+        retention_days: int = RETENTION_DAYS
+    ):
+        super().__init__(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding='utf-8',
+            delay=True
+        )
+        self.interval = interval
+        self.retention_days = retention_days
+        self.rollover_at = self._compute_rollover(time.time())
+
+    def _compute_rollover(self, now: float) -> float:
+        """计算下一次按时间轮转的时刻（按天轮转时对齐到本地零点）"""
+        if self.interval == 24 * 3600:
+            tomorrow = datetime.fromtimestamp(now).date() + timedelta(days=1)
+            return datetime(tomorrow.year, tomorrow.month, tomorrow.day).timestamp()
+        return now + self.interval
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if time.time() >= self.rollover_at and os.path.exists(self.baseFilename):
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = self._compute_rollover(time.time())
+        self._purge_expired()
+
+    def _purge_expired(self) -> None:
+        """删除超过保留天数的轮转文件"""
+        cutoff = time.time() - self.retention_days * 86400
+        pattern = re.compile(re.escape(os.path.basename(self.baseFilename)) + r'\.\d+$')
+        for path in glob.glob(self.baseFilename + '.*'):
+            try:
+                if pattern.match(os.path.basename(path)) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+def _is_worker_process() -> bool:
+    """是否为子进程（进程池工作进程）"""
+    return multiprocessing.parent_process() is not None
+
+def _silence_worker() -> None:
+    """子进程不写日志文件，只挂空处理器（也避免 logging 的 lastResort 输出）"""
+    global _worker_silenced, _listener, _queue_handler
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.NullHandler())
+    # fork 出的子进程继承了父进程的对象，但后台写入线程不会随之复制
+    _listener = None
+    _queue_handler = None
+    _worker_silenced = True
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_silence_worker)
+
+def is_configured() -> bool:
+    """日志系统是否已在本进程初始化"""
+    return _listener is not None
+
+def setup_logging(level: int = logging.INFO, log_dir: str = LOG_DIR) -> None:
+    """
+    初始化统一日志系统（可重复调用，仅首次生效）
+    由程序入口在主进程中调用；在子进程中调用时只挂空处理器
+
+    Args:
+        level: 日志级别
+        log_dir: 日志目录
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return
+        if _is_worker_process():
+            if not _worker_silenced:
+                _silence_worker()
+            return
+
+        os.makedirs(log_dir, exist_ok=True)
+        formatter = logging.Formatter(LOG_FORMAT)
+
+        handlers = []
+        combined = SizedTimedRotatingFileHandler(os.path.join(log_dir, COMBINED_LOG))
+        combined.setFormatter(formatter)
+        handlers.append(combined)
+
+        for filename, names in SUBSYSTEM_LOGS.items():
+            handler = SizedTimedRotatingFileHandler(os.path.join(log_dir, filename))
+            handler.setFormatter(formatter)
+            handler.addFilter(SubsystemFilter(names))
+            handlers.append(handler)
+
+        # 调用线程只负责入队，写盘由后台线程完成
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        root.setLevel(level)
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+        root.addHandler(_queue_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """停止后台写入线程并刷新剩余日志"""
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    获取子系统日志器（不初始化日志系统，模块导入时调用没有副作用；子进程中挂空处理器）
+
+    Args:
+        name: 子系统名称（见 SUBSYSTEM_LOGS）
+    """
+    if not _worker_silenced and _is_worker_process():
+        with _lock:
+            if not _worker_silenced:
+                _silence_worker()
+    return logging.getLogger(name)
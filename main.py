@@ -4,30 +4,42 @@
 """
 
 import threading
-import logging
-import time
 from mouse_recorder import start_recording
 from mouse_controller import mouse_controller
+from readiness import wait_for_window
+from notice import MAIN_WINDOW_TITLE
+from startup_profiler import startup_profiler
+from retention import retention_manager
+from log_config import get_logger
+
+logger = get_logger('main')
 
 def main():
     """主程序入口"""
     try:
-        logging.info("等待智造协同平台初始化完成...")
-        time.sleep(2)  # 给智造协同平台一些初始化时间
+        logger.info("等待智造协同平台初始化完成...")
+        # 主窗口已出现时立即继续，最多等待2秒
+        with startup_profiler.phase('main_window_wait'):
+            wait_for_window(MAIN_WINDOW_TITLE, timeout=2.0)
         
-        logging.info("开始启动鼠标记录功能...")
+        logger.info("开始启动鼠标记录功能...")
         # 启动记录器线程
+        startup_profiler.mark('recorder_thread_start')
         recorder_thread = threading.Thread(target=start_recording)
         recorder_thread.daemon = True
         recorder_thread.start()
         
+        # 后台低优先级执行数据保留清理（需在 config/retention.json 中启用）
+        retention_manager.start()
+        
         # 等待记录器线程结束
         recorder_thread.join()
         
     except Exception as e:
-        logging.error(f"程序运行错误: {str(e)}")
+        logger.error(f"程序运行错误: {str(e)}")
         print(f"程序运行错误: {str(e)}")
     finally:
+        retention_manager.stop()
         # 确保鼠标被禁用
         mouse_controller.disable()
 
@@ -0,0 +1,270 @@
+"""
+运行指标模块
+提供进程内的计数器、仪表和直方图，并以 Prometheus 文本格式导出
+热路径上只做一次字典查找和整数累加
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 默认耗时直方图分桶(秒)
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+def _format_value(value: float) -> str:
+    """格式化指标值"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    """格式化标签"""
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _CounterValue:
+    """计数器取值"""
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+class _GaugeValue:
+    """仪表取值，可绑定函数在导出时求值"""
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """绑定取值函数，只在导出时调用，不增加热路径开销"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float('nan')
+        return self.value
+
+class _HistogramValue:
+    """直方图取值"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        """记录代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+class _Metric:
+    """带标签的指标基类"""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """获取指定标签取值对应的子指标"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_value()
+                    self._children[values] = child
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def items(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}'
+        ]
+        for values, child in sorted(self.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = 'counter'
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}']
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+    kind = 'gauge'
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default().set_function(function)
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}']
+
+class Histogram(_Metric):
+    """分桶直方图"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(child.sum)}')
+        lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+class MetricsRegistry:
+    """指标注册表"""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """导出 Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# 创建全局指标注册表
+registry = MetricsRegistry()
+
+# 采集相关指标
+EVENTS_CAPTURED = registry.counter(
+    'mouse_events_captured_total', '已采集的鼠标事件数', ('type',)
+)
+CALLBACK_LATENCY = registry.histogram(
+    'mouse_callback_latency_seconds', '监听回调处理耗时', ('type',),
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+)
+BUFFER_SIZE = registry.gauge(
+    'mouse_buffer_events', '内存中缓存的事件数', ('buffer',)
+)
+IDLE_SUPPRESSED = registry.counter(
+    'mouse_idle_suppressed_total', '空闲期间未记录的抖动事件数'
+)
+
+# 存储与可视化相关指标
+OPERATION_DURATION = registry.histogram(
+    'mouse_operation_duration_seconds', '保存、压缩、加密和绘图耗时', ('operation',)
+)
+
+# 回放相关指标
+PLAYBACK_ERROR = registry.histogram(
+    'mouse_playback_timing_error_seconds', '回放事件实际执行时间与计划时间的偏差', ('player',),
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5)
+)
+INJECTION_COST = registry.histogram(
+    'mouse_injection_batch_seconds', '每批输入注入调用耗时', ('player',),
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+)
+INJECTION_BATCH_SIZE = registry.histogram(
+    'mouse_injection_batch_inputs', '每批注入的输入数', ('player',),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
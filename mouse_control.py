@@ -1,11 +1,11 @@
 from pynput.mouse import Listener, Button
-import logging
 import os
 import time
 import platform
 import sys
 import matplotlib.pyplot as plt
 import numpy as np
+from log_config import get_logger, setup_logging
 
 # 检查操作系统
 if platform.system() != 'Windows':
@@ -18,11 +18,7 @@ if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
 # 配置日志
-logging.basicConfig(
-    filename=os.path.join(log_dir, 'mouse_events.log'),
-    level=logging.INFO,
-    format='%(asctime)s: %(message)s'
-)
+logger = get_logger('tracker')
 
 class MouseTracker:
     def __init__(self):
@@ -36,28 +32,30 @@ class MouseTracker:
             self.points.append((x, y))
             self.timestamps.append(time.time())
         except Exception as e:
-            logging.error(f"添加轨迹点时发生错误: {str(e)}")
+            logger.error(f"添加轨迹点时发生错误: {str(e)}")
     
     def save_trajectory(self, filename='mouse_trajectory.txt'):
         """保存轨迹到文件"""
         if not self.points:
-            logging.warning("没有轨迹点可供保存")
+            logger.warning("没有轨迹点可供保存")
             return
         
         try:
             filepath = os.path.join(log_dir, filename)
-            with open(filepath, 'w', encoding='utf-8') as f:
+            table = np.column_stack((self.timestamps, np.array(self.points)))
+            with open(filepath, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
                 f.write("时间戳,X坐标,Y坐标\n")
-                for t, (x, y) in zip(self.timestamps, self.points):
-                    f.write(f"{t},{x},{y}\n")
-            logging.info(f"轨迹已保存到: {filepath}")
+                # 分块写入，避免逐行格式化和逐行写文件
+                for start in range(0, len(table), 65536):
+                    np.savetxt(f, table[start:start + 65536], fmt=('%.6f', '%d', '%d'), delimiter=',')
+            logger.info(f"轨迹已保存到: {filepath}")
         except Exception as e:
-            logging.error(f"保存轨迹时发生错误: {str(e)}")
+            logger.error(f"保存轨迹时发生错误: {str(e)}")
     
     def plot_trajectory(self, save_plot=True):
         """可视化鼠标轨迹"""
         if not self.points:
-            logging.warning("没有轨迹点可供绘制")
+            logger.warning("没有轨迹点可供绘制")
             return
             
         try:
@@ -80,10 +78,10 @@ class MouseTracker:
             if save_plot:
                 plot_path = os.path.join(log_dir, 'mouse_trajectory.png')
                 plt.savefig(plot_path)
-                logging.info(f"轨迹图已保存到: {plot_path}")
+                logger.info(f"轨迹图已保存到: {plot_path}")
             plt.close()
         except Exception as e:
-            logging.error(f"绘制轨迹图时发生错误: {str(e)}")
+            logger.error(f"绘制轨迹图时发生错误: {str(e)}")
 
 # 创建全局追踪器实例
 tracker = MouseTracker()
@@ -93,19 +91,19 @@ def on_move(x, y):
     try:
         if tracker.recording:
             tracker.add_point(x, y)
-        logging.info(f'鼠标移动到 {(x, y)}')
+        logger.info(f'鼠标移动到 {(x, y)}')
     except Exception as e:
-        logging.error(f"处理鼠标移动事件时发生错误: {str(e)}")
+        logger.error(f"处理鼠标移动事件时发生错误: {str(e)}")
 
 def on_click(x, y, button, pressed):
     """处理鼠标点击事件"""
     try:
         action = '按下' if pressed else '释放'
         button_name = '左键' if button == Button.left else '右键' if button == Button.right else '中键'
-        logging.info(f'鼠标{action} {button_name} 在位置 {(x, y)}')
+        logger.info(f'鼠标{action} {button_name} 在位置 {(x, y)}')
         
         if button == Button.right and pressed:
-            logging.info('检测到右键点击，停止记录')
+            logger.info('检测到右键点击，停止记录')
             tracker.recording = False
             tracker.save_trajectory()
             tracker.plot_trajectory()
@@ -113,16 +111,16 @@ def on_click(x, y, button, pressed):
         
         return True
     except Exception as e:
-        logging.error(f"处理鼠标点击事件时发生错误: {str(e)}")
+        logger.error(f"处理鼠标点击事件时发生错误: {str(e)}")
         return False
 
 def on_scroll(x, y, dx, dy):
     """处理鼠标滚轮事件"""
     try:
         scroll_direction = '向上' if dy > 0 else '向下'
-        logging.info(f'鼠标在位置 {(x, y)} {scroll_direction}滚动')
+        logger.info(f'鼠标在位置 {(x, y)} {scroll_direction}滚动')
     except Exception as e:
-        logging.error(f"处理鼠标滚轮事件时发生错误: {str(e)}")
+        logger.error(f"处理鼠标滚轮事件时发生错误: {str(e)}")
 
 def start_mouse_listener():
     """启动鼠标监听"""
@@ -138,7 +136,7 @@ def start_mouse_listener():
             listener.join()
             
     except Exception as e:
-        logging.error(f"监听器发生错误: {str(e)}")
+        logger.error(f"监听器发生错误: {str(e)}")
         print(f"监听器发生错误: {str(e)}")
     finally:
         # 确保数据被保存
@@ -147,4 +145,5 @@ def start_mouse_listener():
             tracker.plot_trajectory()
 
 if __name__ == "__main__":
+    setup_logging()
     start_mouse_listener() 
\ No newline at end of file
@@ -1,85 +1,294 @@
-from pynput.mouse import Listener, Controller
-import win32api
-import win32con
-import win32gui
 import threading
-import logging
+import time
+import ctypes
+from ctypes import wintypes
+from typing import Callable, Dict, List, Optional, Tuple
+from log_config import get_logger
+
+logger = get_logger('controller')
+
+# Windows 钩子常量
+WH_MOUSE_LL = 14
+HC_ACTION = 0
+WM_QUIT = 0x0012
+
+class HookStats:
+    """
+    钩子回调耗时统计
+    只做整数累加，保证回调中的统计开销可以忽略
+    """
+    def __init__(self):
+        self.count = 0  # 回调次数
+        self.blocked = 0  # 被拦截的事件数
+        self.pins = 0  # 实际执行的光标固定次数
+        self.total_ns = 0  # 回调总耗时(纳秒)
+        self.max_ns = 0  # 单次回调最大耗时(纳秒)
+
+    def reset(self):
+        """清空统计"""
+        self.__init__()
+
+    def snapshot(self) -> Dict[str, float]:
+        """获取统计快照"""
+        count = self.count
+        return {
+            'count': count,
+            'blocked': self.blocked,
+            'pins': self.pins,
+            'avg_us': (self.total_ns / count / 1000) if count else 0.0,
+            'max_us': self.max_ns / 1000
+        }
+
+class Win32HookBackend:
+    """
+    基于 ctypes 的底层鼠标钩子后端
+    钩子必须在拥有消息循环的线程中安装，回调也在该线程中执行
+    """
+    def __init__(self):
+        self.user32 = ctypes.WinDLL('user32', use_last_error=True)
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self.HOOKPROC = ctypes.WINFUNCTYPE(
+            wintypes.LPARAM, ctypes.c_int, wintypes.WPARAM, wintypes.LPARAM
+        )
+        self.user32.SetWindowsHookExW.argtypes = (
+            ctypes.c_int, self.HOOKPROC, wintypes.HINSTANCE, wintypes.DWORD
+        )
+        self.user32.SetWindowsHookExW.restype = wintypes.HHOOK
+        self.user32.CallNextHookEx.argtypes = (
+            wintypes.HHOOK, ctypes.c_int, wintypes.WPARAM, wintypes.LPARAM
+        )
+        self.user32.CallNextHookEx.restype = wintypes.LPARAM
+        self.user32.UnhookWindowsHookEx.argtypes = (wintypes.HHOOK,)
+        self.user32.PostThreadMessageW.argtypes = (
+            wintypes.DWORD, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM
+        )
+        self.kernel32.GetModuleHandleW.restype = wintypes.HMODULE
+        self._proc = None  # 必须保持引用，防止回调被回收
+        self._hook = None
+        self._thread_id = None
+
+    def install(self, callback: Callable[[], bool]) -> bool:
+        """
+        在当前线程安装钩子
+
+        Args:
+            callback: 事件回调，返回 True 表示拦截事件
+        """
+        user32 = self.user32
+
+        def hook_proc(nCode, wParam, lParam):
+            if nCode == HC_ACTION and callback():
+                return 1  # 阻止事件继续传递
+            return user32.CallNextHookEx(None, nCode, wParam, lParam)
+
+        self._proc = self.HOOKPROC(hook_proc)
+        self._thread_id = self.kernel32.GetCurrentThreadId()
+        self._hook = user32.SetWindowsHookExW(
+            WH_MOUSE_LL,  # 底层鼠标钩子
+            self._proc,  # 回调函数
+            self.kernel32.GetModuleHandleW(None),  # 模块句柄
+            0  # 全局钩子
+        )
+        return bool(self._hook)
+
+    def run_loop(self) -> None:
+        """运行消息循环，直到收到 WM_QUIT"""
+        msg = wintypes.MSG()
+        while self.user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            self.user32.TranslateMessage(ctypes.byref(msg))
+            self.user32.DispatchMessageW(ctypes.byref(msg))
+
+    def stop(self) -> None:
+        """通知钩子线程退出消息循环（可在任意线程调用）"""
+        if self._thread_id:
+            self.user32.PostThreadMessageW(self._thread_id, WM_QUIT, 0, 0)
+
+    def uninstall(self) -> None:
+        """在钩子线程中卸载钩子"""
+        if self._hook:
+            self.user32.UnhookWindowsHookEx(self._hook)
+        self._hook = None
+        self._proc = None
+        self._thread_id = None
+
+    def set_cursor_pos(self, x: int, y: int) -> None:
+        """设置光标位置"""
+        self.user32.SetCursorPos(x, y)
+
+    def get_cursor_pos(self) -> Tuple[int, int]:
+        """获取当前光标位置"""
+        point = wintypes.POINT()
+        self.user32.GetCursorPos(ctypes.byref(point))
+        return point.x, point.y
+
+class FakeHookBackend:
+    """
+    测试用钩子后端
+    不依赖 Windows，通过 emit 模拟系统投递鼠标事件
+    """
+    def __init__(self):
+        self.callback = None
+        self.installed = False
+        self.cursor_moves: List[Tuple[int, int]] = []  # 记录的光标固定调用
+        self.install_thread = None  # 安装钩子的线程
+        self.cursor_pos = (0, 0)  # 模拟的当前光标位置
+        self._quit = threading.Event()
+
+    def install(self, callback: Callable[[], bool]) -> bool:
+        self.callback = callback
+        self.installed = True
+        self.install_thread = threading.current_thread()
+        self._quit.clear()
+        return True
+
+    def run_loop(self) -> None:
+        self._quit.wait()
+
+    def stop(self) -> None:
+        self._quit.set()
+
+    def uninstall(self) -> None:
+        self.callback = None
+        self.installed = False
+
+    def set_cursor_pos(self, x: int, y: int) -> None:
+        self.cursor_moves.append((x, y))
+
+    def get_cursor_pos(self) -> Tuple[int, int]:
+        return self.cursor_pos
+
+    def emit(self, count: int = 1) -> List[bool]:
+        """
+        模拟投递鼠标事件
+
+        Returns:
+            每个事件是否被拦截
+        """
+        if not self.callback:
+            return [False] * count
+        return [self.callback() for _ in range(count)]
 
 class MouseController:
     """
     鼠标控制器类
     用于实现鼠标的禁用和启用功能，通过Windows钩子实现系统级的鼠标控制
+    钩子运行在独立线程的消息循环中，回调只做最少的工作
     """
-    def __init__(self):
-        self.mouse = Controller()  # pynput的鼠标控制器
+    def __init__(self, backend=None):
+        self._mouse = None  # pynput的鼠标控制器，首次使用时创建
         self.original_pos = (0, 0)  # 存储鼠标初始位置
         self.disabled = False  # 鼠标禁用状态标志
-        self.hook = None  # Windows鼠标钩子句柄
-        self._setup_logging()  # 初始化日志系统
-    
-    def _setup_logging(self):
-        """配置日志系统"""
-        logging.basicConfig(
-            filename='mouse_control.log',
-            level=logging.INFO,
-            format='%(asctime)s: %(message)s'
-        )
-    
+        self.backend = backend  # 钩子后端，首次禁用时按需创建
+        self.pin_interval = 0.05  # 光标固定的最小间隔(秒)
+        self.stats = HookStats()  # 回调耗时统计
+        self._last_pin = 0.0  # 上次固定光标的时间
+        self._hook_thread: Optional[threading.Thread] = None
+        self._hook_ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def mouse(self):
+        """pynput的鼠标控制器（按需导入，导入本模块不依赖 pynput）"""
+        if self._mouse is None:
+            from pynput.mouse import Controller
+            self._mouse = Controller()
+        return self._mouse
+
     def disable(self):
         """
         禁用鼠标功能
         通过设置系统钩子来捕获并阻止鼠标事件
         """
-        if not self.disabled:
-            self.disabled = True
-            # 记录当前鼠标位置，用于固定鼠标
-            self.original_pos = win32gui.GetCursorPos()
-            self._start_hook()  # 启动鼠标钩子
-            logging.info("鼠标已禁用")
-    
+        with self._lock:
+            if not self.disabled:
+                if self.backend is None:
+                    self.backend = Win32HookBackend()
+                # 记录当前鼠标位置，用于固定鼠标
+                self.original_pos = self.backend.get_cursor_pos()
+                self.disabled = True
+                self._start_hook()  # 启动鼠标钩子
+                logger.info("鼠标已禁用")
+
     def enable(self):
         """
         启用鼠标功能
-        移除系统钩子，恢复鼠标正常功能
+        停止钩子线程并移除系统钩子，恢复鼠标正常功能
         """
-        if self.disabled:
-            self.disabled = False
-            # 移除系统钩子
-            if self.hook:
-                win32api.UnhookWindowsHookEx(self.hook)
-                self.hook = None
-            logging.info("鼠标已启用")
-    
-    def _mouse_hook_proc(self, nCode, wParam, lParam):
+        with self._lock:
+            if self.disabled:
+                self.disabled = False
+                self._stop_hook()
+                logger.info(f"鼠标已启用，钩子统计: {self.stats.snapshot()}")
+
+    def get_hook_stats(self) -> Dict[str, float]:
+        """获取钩子回调耗时统计"""
+        return self.stats.snapshot()
+
+    def _mouse_hook_proc(self) -> bool:
         """
         鼠标钩子回调函数
-        处理所有鼠标事件，在禁用状态下阻止事件传递
-        
-        Args:
-            nCode: 钩子代码
-            wParam: 鼠标消息类型
-            lParam: 鼠标事件详细信息
+        在钩子线程中执行，仅判断状态并按间隔固定光标，避免拖慢系统鼠标
+
+        Returns:
+            是否阻止事件继续传递
         """
-        if self.disabled:
-            # 将鼠标位置重置到初始位置
-            win32api.SetCursorPos(self.original_pos[0], self.original_pos[1])
-            return 1  # 返回1表示阻止事件继续传递
-        # 允许事件继续传递
-        return win32api.CallNextHookEx(self.hook, nCode, wParam, lParam)
-    
+        start = time.perf_counter_ns()
+        stats = self.stats
+        blocked = self.disabled
+        if blocked:
+            # 节流：只在间隔到期时将鼠标位置重置到初始位置
+            now = start / 1e9
+            if now - self._last_pin >= self.pin_interval:
+                self._last_pin = now
+                self.backend.set_cursor_pos(*self.original_pos)
+                stats.pins += 1
+            stats.blocked += 1
+        elapsed = time.perf_counter_ns() - start
+        stats.count += 1
+        stats.total_ns += elapsed
+        if elapsed > stats.max_ns:
+            stats.max_ns = elapsed
+        return blocked
+
+    def _hook_thread_main(self):
+        """钩子线程：安装钩子并运行消息循环"""
+        try:
+            if not self.backend.install(self._mouse_hook_proc):
+                logger.error("安装鼠标钩子失败")
+                return
+            self._hook_ready.set()
+            self.backend.run_loop()
+        except Exception as e:
+            logger.error(f"鼠标钩子线程发生错误: {str(e)}")
+        finally:
+            self.backend.uninstall()
+            self._hook_ready.set()
+
     def _start_hook(self):
         """
         启动系统级鼠标钩子
-        设置底层鼠标钩子来捕获所有鼠标事件
+        在独立线程中安装底层鼠标钩子并运行消息循环
         """
-        if not self.hook:
-            # 设置全局鼠标钩子
-            self.hook = win32api.SetWindowsHookEx(
-                win32con.WH_MOUSE_LL,  # 底层鼠标钩子
-                self._mouse_hook_proc,  # 回调函数
-                None,  # 应用程序实例句柄
-                0  # 全局钩子
-            )
+        if self._hook_thread and self._hook_thread.is_alive():
+            return
+
+        self._hook_ready.clear()
+        self._last_pin = 0.0
+        self._hook_thread = threading.Thread(
+            target=self._hook_thread_main,
+            name='mouse-hook',
+            daemon=True
+        )
+        self._hook_thread.start()
+        if not self._hook_ready.wait(timeout=2.0):
+            logger.warning("等待鼠标钩子安装超时")
+
+    def _stop_hook(self):
+        """停止钩子线程"""
+        if self._hook_thread:
+            self.backend.stop()
+            self._hook_thread.join(timeout=2.0)
+            self._hook_thread = None
 
 # 创建全局鼠标控制器实例，供其他模块使用
-mouse_controller = MouseController() 
\ No newline at end of file
+mouse_controller = MouseController()
@@ -3,44 +3,60 @@
 实现鼠标操作的实时镜像和回放功能，支持数据压缩
 """
 
-from pynput.mouse import Controller
-import win32api
-import win32con
-import logging
 import time
 import json
 import os
 import gzip
-import base64
 from datetime import datetime
-from typing import Dict, List, Any
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from typing import Dict, List, Any, Optional
 from auth_manager import auth_manager
+from aead_container import Decryptor, decrypt_bytes, encrypt_bytes
+from log_config import get_logger
+from metrics import BUFFER_SIZE, OPERATION_DURATION
+from event_bus import capture_bus, BufferSink, CaptureEvent
+from decode_pipeline import iter_events, prefetch
+from input_injector import InputInjector
+from replay_plan import plan_cache
+from record_loader import mirror_file_id, to_columns
+from spatial_index import spatial_index
+
+logger = get_logger('mirror')
 
 class MouseMirror:
     """鼠标镜像控制器"""
     def __init__(self):
-        self.mouse = Controller()
+        self.injector = InputInjector(label='mirror')  # 批量输入注入
         self.recording = False
-        self.mirror_events: List[Dict[str, Any]] = []
+        self._sink = BufferSink('mirror', filter=lambda event: self.recording)
         self.compression_level = 9  # 最高压缩级别
         self.encryption_enabled = False  # 加密开关
         self.encryption_level = 1  # 加密强度 (1-3)
-        self._setup_logging()
+        self.start_time = time.time()  # 镜像开始时间
+        BUFFER_SIZE.labels('mirror').set_function(lambda: len(self.mirror_events))
+    
+    @property
+    def mirror_events(self) -> List[CaptureEvent]:
+        """镜像事件列表（与记录器共享同一事件对象）"""
+        return self._sink.buffer
     
-    def _setup_logging(self):
-        """配置日志"""
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
+    def start_mirror(self) -> None:
+        """开始镜像记录，清空已有事件并注册到采集总线"""
+        self._sink.clear()
+        self.start_time = time.time()
+        self.recording = True
+        capture_bus.register(self._sink)
+    
+    def add_event(self, event_type: str, x: int, y: int, **params) -> None:
+        """
+        直接添加镜像事件（不经过采集总线时使用）
         
-        log_file = os.path.join('logs', 'mouse_mirror.log')
-        logging.basicConfig(
-            filename=log_file,
-            level=logging.INFO,
-            format='%(asctime)s: %(message)s'
-        )
+        Args:
+            event_type: 事件类型
+            x: X坐标
+            y: Y坐标
+            **params: 事件参数
+        """
+        self._sink.accept(CaptureEvent(event_type, x, y, time.time(), params))
     
     def _compress_data(self, data: str) -> bytes:
         """
@@ -59,7 +75,7 @@ class MouseMirror:
                 compresslevel=self.compression_level
             )
         except Exception as e:
-            logging.error(f"数据压缩失败: {str(e)}")
+            logger.error(f"数据压缩失败: {str(e)}")
             raise
     
     def _decompress_data(self, compressed_data: bytes) -> str:
@@ -76,7 +92,7 @@ class MouseMirror:
             # 解压数据并转换为字符串
             return gzip.decompress(compressed_data).decode('utf-8')
         except Exception as e:
-            logging.error(f"数据解压失败: {str(e)}")
+            logger.error(f"数据解压失败: {str(e)}")
             raise
     
     def _optimize_events(self) -> List[Dict[str, Any]]:
@@ -84,7 +100,7 @@ class MouseMirror:
         优化事件数据，减少冗余
         
         Returns:
-            优化后的事件列表
+            优化后的事件列表（时间戳为相对镜像开始的秒数）
         """
         if not self.mirror_events:
             return []
@@ -94,11 +110,11 @@ class MouseMirror:
         
         for event in self.mirror_events:
             # 对于移动事件，只保留关键点
-            if event['type'] == 'move':
+            if event.type == 'move':
                 if not last_event or \
-                   last_event['type'] != 'move' or \
-                   abs(event['position'][0] - last_event['position'][0]) > 5 or \
-                   abs(event['position'][1] - last_event['position'][1]) > 5:
+                   last_event.type != 'move' or \
+                   abs(event.x - last_event.x) > 5 or \
+                   abs(event.y - last_event.y) > 5:
                     optimized.append(event)
                     last_event = event
             else:
@@ -106,87 +122,116 @@ class MouseMirror:
                 optimized.append(event)
                 last_event = event
         
-        return optimized
-    
-    def _generate_key(self, password: str, level: int) -> bytes:
-        """
-        根据密码和加密等级生成密钥
-        
-        Args:
-            password: 加密密码
-            level: 加密强度(1-3)
-        """
-        # 根据加密等级设置不同的迭代次数
-        iterations = {
-            1: 100000,    # 基础加密
-            2: 200000,    # 中等加密
-            3: 400000     # 高强度加密
-        }.get(level, 100000)
-        
-        salt = b'mouse_recorder_salt'  # 固定盐值
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=iterations,
-        )
-        return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+        return [event.to_dict(self.start_time) for event in optimized]
     
     def _encrypt_data(self, data: bytes, password: str) -> bytes:
-        """加密数据"""
+        """加密数据（AES-GCM 分帧容器，见 aead_container）"""
         if not self.encryption_enabled:
             return data
             
         try:
-            key = self._generate_key(password, self.encryption_level)
-            f = Fernet(key)
-            return f.encrypt(data)
+            return encrypt_bytes(data, password, self.encryption_level)
         except Exception as e:
-            logging.error(f"数据加密失败: {str(e)}")
+            logger.error(f"数据加密失败: {str(e)}")
             raise
     
     def _decrypt_data(self, encrypted_data: bytes, password: str) -> bytes:
-        """解密数据"""
+        """解密数据，自动识别分帧容器和旧版 Fernet 格式"""
         try:
-            key = self._generate_key(password, self.encryption_level)
-            f = Fernet(key)
-            return f.decrypt(encrypted_data)
+            return decrypt_bytes(encrypted_data, password, self.encryption_level)
         except Exception as e:
-            logging.error(f"数据解密失败: {str(e)}")
+            logger.error(f"数据解密失败: {str(e)}")
             raise
     
-    def save_mirror(self, username: str, password: str = None) -> str:
-        """保存压缩和加密的镜像记录"""
+    def save_mirror(self, username: str, password: str = None, spatial: bool = True) -> str:
+        """
+        保存压缩和加密的镜像记录
+        
+        Args:
+            username: 用户名
+            password: 加密密码
+            spatial: 是否把镜像事件加入时空索引（加密镜像始终不加入；
+                     由 save_recording 调用时记录文件已加入索引，传 False 避免重复）
+        """
+        with OPERATION_DURATION.labels('save_mirror').time():
+            filepath = self._save_mirror(username, password)
+        if filepath and spatial and not filepath.endswith('.enc.gz'):
+            self._update_spatial_index(username, filepath)
+        return filepath
+    
+    def _update_spatial_index(self, username: str, filepath: str) -> None:
+        """将镜像事件加入时空索引"""
+        try:
+            with OPERATION_DURATION.labels('spatial_index').time():
+                spatial_index.add(username, to_columns(self.mirror_events), os.path.basename(filepath))
+        except Exception as e:
+            logger.error(f"更新时空索引时发生错误: {str(e)}")
+    
+    def _save_mirror(self, username: str, password: str = None) -> str:
+        """保存镜像记录的具体实现"""
+        if not self.mirror_events:
+            logger.warning("没有镜像数据可供保存")
+            return None
+        
+        # 优化事件数据
+        optimized_events = self._optimize_events()
+        return self.write_mirror(username, optimized_events, time.time() - self.start_time, password)
+    
+    def write_mirror(
+        self,
+        username: str,
+        events: List[Dict[str, Any]],
+        duration: float,
+        password: str = None,
+        extra: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """
+        按当前压缩和加密设置写入镜像文件（会话镜像和飞行记录转储共用）
+        
+        Args:
+            username: 用户名
+            events: 事件字典列表（时间戳为相对秒数）
+            duration: 时长(秒)
+            password: 加密密码
+            extra: 附加到文件头的字段
+        
+        Returns:
+            文件路径，失败时返回 None
+        """
         try:
-            if not self.mirror_events:
-                logging.warning("没有镜像数据可供保存")
-                return None
-            
             # 创建镜像文件夹
             mirror_dir = 'mouse_mirrors'
             if not os.path.exists(mirror_dir):
                 os.makedirs(mirror_dir)
             
-            # 优化事件数据
-            optimized_events = self._optimize_events()
-            
             # 准备数据
             data = {
                 'username': username,
                 'timestamp': datetime.now().isoformat(),
-                'duration': time.time() - self.start_time,
-                'events': optimized_events,
-                'event_count': len(optimized_events)
+                'duration': duration,
+                **(extra or {}),
+                'events': events,
+                'event_count': len(events)
             }
             
             # 压缩数据
             json_str = json.dumps(data, ensure_ascii=False)
-            compressed_data = self._compress_data(json_str)
+            with OPERATION_DURATION.labels('compress').time():
+                compressed_data = self._compress_data(json_str)
+            
+            # 生成文件名（加密文件使用不同扩展名，同一秒内多次保存时追加序号）
+            ext = '.enc.gz' if self.encryption_enabled else '.gz'
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            base, suffix = timestamp, 1
+            while os.path.exists(os.path.join(mirror_dir, f'mirror_{username}_{timestamp}{ext}')):
+                timestamp = f'{base}_{suffix}'
+                suffix += 1
+            filepath = os.path.join(mirror_dir, f'mirror_{username}_{timestamp}{ext}')
             
             # 如果启用加密，验证用户权限
             if self.encryption_enabled:
                 if not password or not auth_manager.verify_encryption_user(username, password):
-                    logging.error("无效的加密账号")
+                    logger.error("无效的加密账号")
                     return None
                 
                 # 生成文件ID并存储密钥
@@ -195,13 +240,8 @@ class MouseMirror:
             
             # 如果启用加密，则加密数据
             if self.encryption_enabled and password:
-                compressed_data = self._encrypt_data(compressed_data, password)
-            
-            # 生成文件名（加密文件使用不同扩展名）
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            ext = '.enc.gz' if self.encryption_enabled else '.gz'
-            filename = f'mirror_{username}_{timestamp}{ext}'
-            filepath = os.path.join(mirror_dir, filename)
+                with OPERATION_DURATION.labels('encrypt').time():
+                    compressed_data = self._encrypt_data(compressed_data, password)
             
             # 保存压缩数据
             with open(filepath, 'wb') as f:
@@ -212,9 +252,9 @@ class MouseMirror:
             compressed_size = len(compressed_data)
             compression_ratio = (1 - compressed_size / original_size) * 100
             
-            logging.info(
+            logger.info(
                 f"镜像数据已保存: {filepath}\n"
-                f"事件数: {len(optimized_events)}\n"
+                f"事件数: {len(events)}\n"
                 f"原始大小: {original_size/1024:.2f}KB\n"
                 f"压缩大小: {compressed_size/1024:.2f}KB\n"
                 f"压缩率: {compression_ratio:.1f}%"
@@ -223,97 +263,75 @@ class MouseMirror:
             return filepath
             
         except Exception as e:
-            logging.error(f"保存镜像数据时发生错误: {str(e)}")
+            logger.error(f"保存镜像数据时发生错误: {str(e)}")
             return None
     
-    def play_mirror(self, filepath: str, username: str, password: str = None) -> None:
-        """回放加密的镜像记录"""
+    def play_mirror(self, filepath: str, username: str, password: str = None, loops: int = 1) -> None:
+        """
+        回放镜像记录（支持加密文件）
+        
+        Args:
+            filepath: 镜像文件路径
+            username: 当前用户
+            password: 加密文件的密码
+            loops: 循环回放次数
+        """
         try:
             # 如果是加密文件，检查权限
             if filepath.endswith('.enc.gz'):
                 if not password or not auth_manager.verify_encryption_user(username, password):
-                    logging.error("无权访问加密文件")
+                    logger.error("无权访问加密文件")
                     return
                 
-                # 获取文件ID
-                file_id = os.path.basename(filepath).replace('.enc.gz', '')
+                # 获取文件ID（与保存时存储密钥使用的 ID 一致）
+                file_id = mirror_file_id(filepath)
                 
                 # 验证访问权限
                 if not auth_manager.has_file_access(username, file_id):
-                    logging.error("无权访问此文件")
+                    logger.error("无权访问此文件")
                     return
             
-            # 加载数据
-            with open(filepath, 'rb') as f:
-                data = f.read()
-            
-            # 如果是加密文件，先解密
-            if filepath.endswith('.enc.gz') and password:
-                data = self._decrypt_data(data, password)
-            
-            # 解压数据
-            json_str = self._decompress_data(data)
-            data = json.loads(json_str)
-            
-            events = data['events']
-            if not events:
-                logging.warning("镜像文件中没有事件数据")
-                return
-            
-            logging.info(
-                f"开始回放镜像: {filepath}\n"
-                f"用户: {data['username']}\n"
-                f"事件数: {data['event_count']}\n"
-                f"总时长: {data['duration']:.1f}秒"
-            )
-            
-            # 回放事件
-            start_time = time.time()
-            for event in events:
-                # 计算等待时间
-                wait_time = event['timestamp'] - (time.time() - start_time)
-                if wait_time > 0:
-                    time.sleep(wait_time)
+            count = 0
+            remaining = loops
+            plan = plan_cache.lookup(filepath)
+            if plan is None:
+                # 首次回放：生产者线程流式读取、解密、解压和解析，边回放边编译回放计划
+                decrypt = None
+                if filepath.endswith('.enc.gz'):
+                    decrypt = Decryptor(password, self.encryption_level)  # 分帧容器逐帧解密
+                meta: Dict[str, Any] = {}
+                events = prefetch(iter_events(filepath, decrypt, meta), name='mirror-decoder')
                 
-                # 执行事件
-                self._play_event(event)
+                def announce(events):
+                    # 首个事件产出时，事件数组之前的字段已解析完毕
+                    for index, event in enumerate(events):
+                        if index == 0:
+                            logger.info(
+                                f"开始回放镜像: {filepath}\n"
+                                f"用户: {meta.get('username')}\n"
+                                f"总时长: {meta.get('duration', 0):.1f}秒"
+                            )
+                        yield event
+                
+                # 镜像使用相对时间戳，原点为 0
+                count = self.injector.play(announce(plan_cache.capture(filepath, events)), time_origin=0.0)
+                remaining -= 1
+                plan = plan_cache.lookup(filepath) if remaining > 0 else None
+            else:
+                logger.info(f"开始回放镜像: {filepath}（已缓存回放计划，{plan.events} 个事件，时长 {plan.duration:.1f}秒）")
             
-            logging.info("镜像回放完成")
+            # 重复回放直接执行预编译的回放计划
+            if remaining > 0 and plan is not None:
+                count += self.injector.play_plan(plan, remaining)
             
-        except Exception as e:
-            logging.error(f"回放镜像时发生错误: {str(e)}")
-    
-    def _play_event(self, event: Dict[str, Any]) -> None:
-        """
-        执行单个事件
-        
-        Args:
-            event: 事件数据
-        """
-        try:
-            x, y = event['position']
-            event_type = event['type']
-            params = event.get('params', {})
+            if not count:
+                logger.warning("镜像文件中没有事件数据")
+                return
             
-            # 设置鼠标位置
-            self.mouse.position = (x, y)
+            logger.info(f"镜像回放完成，共 {count} 个事件: {self.injector.stats.snapshot()}")
             
-            # 根据事件类型执行操作
-            if event_type == 'click':
-                if params.get('pressed'):
-                    win32api.mouse_event(win32con.MOUSEEVENTF_LEFTDOWN, x, y, 0, 0)
-                else:
-                    win32api.mouse_event(win32con.MOUSEEVENTF_LEFTUP, x, y, 0, 0)
-            elif event_type == 'scroll':
-                win32api.mouse_event(
-                    win32con.MOUSEEVENTF_WHEEL,
-                    x, y,
-                    params.get('dy', 0) * 120,
-                    0
-                )
         except Exception as e:
-            logging.error(f"执行事件时发生错误: {str(e)}")
-            raise
+            logger.error(f"回放镜像时发生错误: {str(e)}")
 
 # 创建全局镜像控制器实例
 mouse_mirror = MouseMirror() 
\ No newline at end of file
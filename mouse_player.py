@@ -1,10 +1,14 @@
-from pynput.mouse import Controller
-import json
-import time
 import os
-import logging
 import sys
+import argparse
 import platform
+from log_config import get_logger, setup_logging
+from decode_pipeline import iter_events, prefetch
+from input_injector import InputInjector
+from replay_plan import plan_cache
+from segmentation import load_segments, plan_range, format_segment
+
+logger = get_logger('player')
 
 # 检查操作系统
 if platform.system() != 'Windows':
@@ -13,82 +17,118 @@ if platform.system() != 'Windows':
 
 class MousePlayer:
     def __init__(self):
-        self.mouse = Controller()
+        self.injector = InputInjector(label='player')  # 批量输入注入
         self.log_dir = 'mouse_records'
-        
-        # 配置日志
-        if not os.path.exists(self.log_dir):
-            os.makedirs(self.log_dir)
-            
-        logging.basicConfig(
-            filename=os.path.join(self.log_dir, 'playback.log'),
-            level=logging.INFO,
-            format='%(asctime)s: %(message)s'
-        )
     
     def load_recording(self, record_file):
-        """加载记录文件"""
+        """
+        加载记录文件
+        返回事件迭代器，由生产者线程流式解析，不会一次性读入整个文件
+        """
         try:
-            with open(record_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data['events']
+            if not os.path.exists(record_file):
+                raise FileNotFoundError(record_file)
+            return prefetch(iter_events(record_file), name='player-decoder')
         except Exception as e:
-            logging.error(f"加载记录文件时发生错误: {str(e)}")
+            logger.error(f"加载记录文件时发生错误: {str(e)}")
             return None
     
     def play_events(self, events):
-        """回放鼠标事件"""
-        if not events:
-            logging.error("没有可回放的事件")
-            return
-        
+        """回放鼠标事件（接受列表或迭代器），移动、按键和滚动均按原始时间注入"""
         try:
-            start_time = time.time()
-            first_event_time = events[0]['timestamp']
-            
-            for event in events:
-                # 计算等待时间
-                event_time = event['timestamp'] - first_event_time
-                current_time = time.time() - start_time
-                wait_time = event_time - current_time
-                
-                if wait_time > 0:
-                    time.sleep(wait_time)
-                
-                # 移动鼠标到指定位置
-                x, y = event['position']
-                self.mouse.position = (x, y)
-                
-                # 记录事件
-                logging.info(f"回放事件: {event['type']} 在位置 {(x, y)}")
+            count = self.injector.play(events)
+            if not count:
+                logger.error("没有可回放的事件")
+                return
+            logger.info(f"回放完成，共 {count} 个事件: {self.injector.stats.snapshot()}")
                 
         except Exception as e:
-            logging.error(f"回放事件时发生错误: {str(e)}")
+            logger.error(f"回放事件时发生错误: {str(e)}")
+
+    def play_file(self, record_file, loops=1):
+        """
+        回放记录文件
+        首次回放时流式解码并顺带编译回放计划，之后的回放和循环直接执行缓存的计划
+        
+        Returns:
+            回放的事件数，加载失败时返回 None
+        """
+        plan = plan_cache.lookup(record_file)
+        remaining = loops
+        count = 0
+        if plan is None:
+            events = self.load_recording(record_file)
+            if events is None:
+                return None
+            count = self.injector.play(plan_cache.capture(record_file, events))
+            remaining -= 1
+            plan = plan_cache.lookup(record_file) if remaining > 0 else None
+        if remaining > 0 and plan is not None:
+            count += self.injector.play_plan(plan, remaining)
+        logger.info(f"回放完成，共 {count} 个事件: {self.injector.stats.snapshot()}")
+        return count
+
+    def list_segments(self, record_file):
+        """获取记录文件的任务分段（索引不存在或过期时自动生成）"""
+        return load_segments(record_file)['segments']
+
+    def play_segment(self, record_file, segment_index, loops=1):
+        """
+        直接跳转回放记录中的某个任务片段
+        从缓存的回放计划中截取片段对应的动作区间，不需要从头解码或等待
+        
+        Returns:
+            回放的事件数
+        """
+        index = load_segments(record_file)
+        segments = index['segments']
+        if not 0 <= segment_index < len(segments):
+            raise IndexError(f"片段序号超出范围: {segment_index}（共 {len(segments)} 段）")
+        segment = segments[segment_index]
+        start, end = plan_range(index, segment)
+        plan = plan_cache.get(record_file).slice(start, end, segment['events'])
+        logger.info(f"回放片段: {format_segment(segment)}")
+        count = self.injector.play_plan(plan, loops)
+        logger.info(f"片段回放完成，共 {count} 个事件: {self.injector.stats.snapshot()}")
+        return count
 
-def play_recording(record_file):
+def play_recording(record_file, loops=1):
     """回放指定的记录文件"""
     player = MousePlayer()
     
     try:
         print(f"开始回放记录: {record_file}")
-        events = player.load_recording(record_file)
-        if events:
-            player.play_events(events)
+        count = player.play_file(record_file, loops)
+        if count is None:
+            print("加载记录文件失败")
+        elif count:
             print("回放完成")
         else:
-            print("加载记录文件失败")
+            print("没有可回放的事件")
     except Exception as e:
         print(f"回放过程中发生错误: {str(e)}")
-        logging.error(f"回放过程中发生错误: {str(e)}")
+        logger.error(f"回放过程中发生错误: {str(e)}")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("使用方法: python mouse_player.py <record_file>")
-        sys.exit(1)
+    setup_logging()
+    parser = argparse.ArgumentParser(description='回放鼠标记录')
+    parser.add_argument('record_file', help='记录文件')
+    parser.add_argument('loops', nargs='?', type=int, default=1, help='循环次数')
+    parser.add_argument('--list-segments', action='store_true', help='列出记录的任务分段')
+    parser.add_argument('--segment', type=int, default=None, metavar='N', help='只回放第 N 个片段')
+    args = parser.parse_args()
     
-    record_file = sys.argv[1]
+    record_file = args.record_file
     if not os.path.exists(record_file):
         print(f"记录文件不存在: {record_file}")
         sys.exit(1)
     
-    play_recording(record_file) 
\ No newline at end of file
+    if args.list_segments:
+        for segment in MousePlayer().list_segments(record_file):
+            print(format_segment(segment))
+    elif args.segment is not None:
+        print(f"开始回放片段 {args.segment}: {record_file}")
+        MousePlayer().play_segment(record_file, args.segment, args.loops)
+        print("回放完成")
+    else:
+        play_recording(record_file, args.loops) 
\ No newline at end of file
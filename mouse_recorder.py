@@ -5,8 +5,8 @@
 """
 
 from pynput.mouse import Listener, Button
-import logging
 import os
+import json
 import time
 import platform
 import sys
@@ -19,6 +19,112 @@ import win32gui
 import win32con
 from mouse_controller import mouse_controller
 from mouse_mirror import mouse_mirror
+from flight_recorder import flight_recorder
+from startup_profiler import startup_profiler
+from log_config import get_logger, setup_logging
+from metrics import EVENTS_CAPTURED, CALLBACK_LATENCY, BUFFER_SIZE, OPERATION_DURATION, IDLE_SUPPRESSED
+from record_loader import columns_from_arrays, event_code, load_columns
+from heatmap import heatmap_store
+from session_index import session_index
+from spatial_index import spatial_index
+from event_bus import capture_bus, DoubleBufferSink, CallbackSink
+from event_streamer import start_streaming, upload_mirror_async
+from idle_detector import IDLE_EVENT, create_idle_detector
+
+logger = get_logger('recorder')
+
+CHECKPOINT_INTERVAL = 30.0  # 定期检查点间隔(秒)
+PARTIAL_SUFFIX = '.partial.jsonl'
+
+# 已写入检查点的事件只保留热力图和索引需要的字段，每个事件 17 字节
+FLUSHED_DTYPE = np.dtype([
+    ('t', '<f8'),
+    ('x', '<i4'),
+    ('y', '<i4'),
+    ('code', 'i1')
+])
+
+def assemble_record(partial_file, data_file, meta):
+    """
+    由检查点文件组装最终记录 JSON
+    检查点中每行是一个已序列化的事件，直接拼接，不重新序列化；没有换行结尾的半行（写入中断）被丢弃
+
+    Args:
+        partial_file: 检查点文件
+        data_file: 最终记录文件
+        meta: 写在事件数组之后的字段
+
+    Returns:
+        事件数
+    """
+    tmp_file = data_file + '.tmp'
+    count = 0
+    with open(partial_file, 'r', encoding='utf-8') as src, open(tmp_file, 'w', encoding='utf-8') as dst:
+        dst.write('{"events": [\n')
+        for line in src:
+            if not line.endswith('\n'):
+                break
+            if count:
+                dst.write(',\n')
+            dst.write(line[:-1])
+            count += 1
+        dst.write('\n]')
+        for key, value in meta.items():
+            dst.write(f', {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}')
+        dst.write('}\n')
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp_file, data_file)
+    os.remove(partial_file)
+    return count
+
+def index_recording(data_file, username, columns):
+    """把记录合并到热力图，并加入相似会话索引和时空索引（各部分失败互不影响）"""
+    try:
+        with OPERATION_DURATION.labels('heatmap').time():
+            heatmap_store.add_recording(username, columns)
+    except Exception as e:
+        logger.error(f"更新热力图时发生错误: {str(e)}")
+    try:
+        with OPERATION_DURATION.labels('session_index').time():
+            session_index.add(data_file, username, columns)
+    except Exception as e:
+        logger.error(f"更新会话索引时发生错误: {str(e)}")
+    try:
+        with OPERATION_DURATION.labels('spatial_index').time():
+            spatial_index.add(username, columns, os.path.basename(data_file))
+    except Exception as e:
+        logger.error(f"更新时空索引时发生错误: {str(e)}")
+
+def recover_partials(log_dir):
+    """
+    把上次异常退出遗留的检查点文件组装为记录文件，并补充到热力图和索引中
+    登录前（temp_ 开头）的检查点没有所属用户，只组装记录文件，不加入索引
+    """
+    for name in sorted(os.listdir(log_dir)):
+        if not name.endswith(PARTIAL_SUFFIX):
+            continue
+        record_id = name[len('record_'):-len(PARTIAL_SUFFIX)]
+        # 记录ID格式为 <用户名>_<日期>_<时间>
+        username = None if record_id.startswith('temp_') else record_id.rsplit('_', 2)[0]
+        data_file = os.path.join(log_dir, f'record_{record_id}.json')
+        try:
+            count = assemble_record(
+                os.path.join(log_dir, name),
+                data_file,
+                {'record_id': record_id, 'username': username, 'recovered': True, 'timestamp': datetime.now().isoformat()}
+            )
+            logger.info(f"已从检查点恢复记录 {record_id}，共 {count} 个事件")
+        except Exception as e:
+            logger.error(f"恢复检查点 {name} 时发生错误: {str(e)}")
+            continue
+        if username and count:
+            try:
+                index_recording(data_file, username, load_columns(data_file))
+            except Exception as e:
+                logger.error(f"索引恢复的记录 {record_id} 时发生错误: {str(e)}")
+        elif count:
+            logger.warning(f"恢复的记录 {record_id} 没有所属用户，未加入热力图和索引")
 
 class FloatingWindow:
     """
@@ -74,42 +180,77 @@ class MouseRecorder:
         self.record_id = 'temp_' + datetime.now().strftime('%Y%m%d_%H%M%S')
         self.username = None
         
-        self._setup_logging()  # 配置日志系统
+        # 上次异常退出时只留下检查点文件，先组装为记录
+        recover_partials(self.log_dir)
         
-        # 初始化数据存储
-        self.points = []  # 存储坐标点
-        self.timestamps = []  # 存储时间戳
-        self.events = []  # 存储事件信息
+        # 仅飞行记录模式下只保留飞行记录器的环形缓冲区，不缓存整个会话
+        self.flight_only = flight_recorder.flight_only
+        
+        # 记录写入端（双缓冲），事件对象由采集总线统一创建，此处只保存引用
+        self._sink = None if self.flight_only else capture_bus.register(DoubleBufferSink('recorder'))
+        self._flushed = []  # 已写入检查点的事件（FLUSHED_DTYPE 数组，每个检查点一段）
+        self._flushed_count = 0
+        self._unwritten = []  # 已交换出但写入失败的事件，下次检查点重试
+        self._partial_size = 0  # 检查点文件中完整写入的字节数
+        self._save_lock = threading.RLock()  # 检查点与最终保存互斥
+        self.saved_file = None  # 最终保存后的记录文件，保证只保存一次
+        self._stop_checkpoint = threading.Event()
         self.recording = True  # 记录状态标志
+        self.idle_detector = create_idle_detector()  # 空闲检测，空闲期间不缓存抖动移动
         
         self.floating_window = None  # 悬浮窗实例
         
-        # 启动镜像记录
-        mouse_mirror.start_mirror()
+        # 启动镜像记录（镜像写入端同样注册在采集总线上）
+        if not self.flight_only:
+            mouse_mirror.start_mirror()
+        
+        # 飞行记录器常驻采集总线，保留最近一段时间的事件
+        flight_recorder.start()
+        
+        # 按配置启动远程监控事件流
+        self.streamer = start_streaming()
+        if self.streamer:
+            capture_bus.register(self.streamer)
+            BUFFER_SIZE.labels('stream').set_function(lambda: self.streamer.buffered)
+        
+        # 定期把新事件追加到检查点文件
+        if not self.flight_only:
+            threading.Thread(target=self._checkpoint_loop, name='recorder-checkpoint', daemon=True).start()
     
-    def _setup_logging(self):
-        """设置日志"""
-        log_file = os.path.join(self.log_dir, f'record_{self.record_id}.log')
-        logging.basicConfig(
-            filename=log_file,
-            level=logging.INFO,
-            format='%(asctime)s: %(message)s'
-        )
+    def columns(self):
+        """
+        已写入检查点的事件的列式快照（to_columns 格式）
+        缓冲区中尚未写入检查点的事件不包含在内，保存时先执行检查点
+        """
+        with self._save_lock:
+            rows = np.concatenate(self._flushed) if self._flushed else np.empty(0, dtype=FLUSHED_DTYPE)
+        return columns_from_arrays(rows['t'], rows['x'], rows['y'], rows['code'])
+    
+    @property
+    def event_count(self):
+        """已记录的事件数（不复制列表）"""
+        return self._flushed_count + len(self._unwritten) + (len(self._sink) if self._sink else 0)
+    
+    @property
+    def partial_file(self):
+        """当前记录的检查点文件"""
+        return os.path.join(self.log_dir, f'record_{self.record_id}{PARTIAL_SUFFIX}')
     
     def update_user_info(self, username):
-        """更新用户信息并重命名文件"""
+        """更新用户信息和记录ID"""
         self.username = username
         new_record_id = f'{username}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
         
-        # 重命名现有文件
-        old_log = os.path.join(self.log_dir, f'record_{self.record_id}.log')
-        new_log = os.path.join(self.log_dir, f'record_{new_record_id}.log')
-        
-        if os.path.exists(old_log):
-            os.rename(old_log, new_log)
-        
-        self.record_id = new_record_id
-        logging.info(f"记录ID更新为: {self.record_id}")
+        with self._save_lock:
+            # 登录前已写入的检查点随记录ID改名
+            old_partial = self.partial_file
+            self.record_id = new_record_id
+            if os.path.exists(old_partial):
+                os.replace(old_partial, self.partial_file)
+        if self.streamer:
+            self.streamer.username = username
+        flight_recorder.username = username
+        logger.info(f"记录ID更新为: {self.record_id}")
         
         # 显示浮窗
         self.show_floating_window()
@@ -126,70 +267,157 @@ class MouseRecorder:
     def add_point(self, x, y, event_type='move', **kwargs):
         """添加轨迹点和事件"""
         try:
+            startup_profiler.mark_first_event()
             timestamp = time.time()
-            self.points.append((x, y))
-            self.timestamps.append(timestamp)
-            self.events.append({
-                'type': event_type,
-                'position': (x, y),
-                'timestamp': timestamp,
-                'params': kwargs
-            })
-            
-            # 添加到镜像记录
-            mouse_mirror.add_event(event_type, x, y, **kwargs)
+            if self.idle_detector:
+                record, marker = self.idle_detector.observe(event_type, x, y, timestamp)
+                if marker:
+                    self._publish_idle_marker(marker)
+                if not record:
+                    IDLE_SUPPRESSED.inc()
+                    return
+            # 事件只创建一次，由总线分发给记录、镜像和遥测等接收端
+            capture_bus.publish(event_type, x, y, timestamp, **kwargs)
             
         except Exception as e:
-            logging.error(f"添加轨迹点时发生错误: {str(e)}")
+            logger.error(f"添加轨迹点时发生错误: {str(e)}")
+    
+    def _publish_idle_marker(self, marker):
+        """发布空闲标记事件，代替空闲期间的抖动移动"""
+        x, y, idle_since, duration, suppressed = marker
+        capture_bus.publish(IDLE_EVENT, x, y, idle_since, duration=round(duration, 3), suppressed=suppressed)
+        logger.info(f"空闲 {duration:.1f}秒后恢复操作，未记录 {suppressed} 个抖动事件")
+    
+    def _checkpoint_loop(self):
+        """检查点线程"""
+        while not self._stop_checkpoint.wait(CHECKPOINT_INTERVAL):
+            self.checkpoint()
+    
+    def checkpoint(self):
+        """
+        交换缓冲区，把上次检查点以来的新事件追加到检查点文件
+        
+        Returns:
+            写入的事件数
+        """
+        if self._sink is None:
+            return 0
+        with self._save_lock:
+            batch = self._unwritten + self._sink.swap()
+            if not batch:
+                return 0
+            try:
+                with OPERATION_DURATION.labels('checkpoint').time():
+                    data = ''.join(json.dumps(event.to_dict(), ensure_ascii=False) + '\n' for event in batch)
+                    with open(self.partial_file, 'ab') as f:
+                        f.truncate(self._partial_size)  # 去掉上次失败留下的半行
+                        f.write(data.encode('utf-8'))
+                        f.flush()
+                        os.fsync(f.fileno())
+                        self._partial_size = f.tell()
+            except Exception as e:
+                self._unwritten = batch
+                logger.error(f"写入检查点时发生错误: {str(e)}")
+                return 0
+            self._unwritten = []
+            # 事件内容已落盘，只保留紧凑的数组，释放事件对象
+            self._flushed.append(np.array(
+                [(event.timestamp, event.x, event.y, event_code(event)) for event in batch],
+                dtype=FLUSHED_DTYPE
+            ))
+            self._flushed_count += len(batch)
+            return len(batch)
     
     def save_recording(self):
-        """保存记录数据"""
-        if not self.events:
-            logging.warning("没有记录数据可供保存")
+        """保存记录数据（右键处理和监听结束时都会调用，只执行一次）"""
+        with self._save_lock:
+            if self.saved_file:
+                return self.saved_file
+            return self._save_recording()
+    
+    def _save_recording(self):
+        """保存记录数据的具体实现"""
+        # 结束最后一段空闲，保证记录中留有标记
+        if self.idle_detector:
+            marker = self.idle_detector.flush(time.time())
+            if marker:
+                self._publish_idle_marker(marker)
+        
+        if self.flight_only:
+            # 会话事件只在飞行记录器中，按需转储，这里只结束会话
+            logger.info("仅飞行记录模式，不保存完整记录")
+            try:
+                self._end_session()
+            except Exception as e:
+                logger.error(f"结束会话时发生错误: {str(e)}")
+            return
+        
+        if not self.event_count:
+            logger.warning("没有记录数据可供保存")
             return
         
         try:
-            # 保存事件数据
+            # 只需写入上次检查点之后的事件，再由检查点文件组装最终记录
+            self._stop_checkpoint.set()
             data_file = os.path.join(self.log_dir, f'record_{self.record_id}.json')
-            import json
-            with open(data_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'events': self.events,
+            with OPERATION_DURATION.labels('save_recording').time():
+                self.checkpoint()
+                if self._unwritten:
+                    raise OSError("检查点文件写入失败")
+                assemble_record(self.partial_file, data_file, {
                     'record_id': self.record_id,
                     'username': self.username,
                     'timestamp': datetime.now().isoformat()
-                }, f, ensure_ascii=False, indent=2)
+                })
+            self.saved_file = data_file
+            
+            # 检查点后全部事件都已落盘，取一次快照供轨迹图和索引共用
+            columns = self.columns()
             
             # 绘制并保存轨迹图
-            self._save_trajectory_plot()
+            with OPERATION_DURATION.labels('plot').time():
+                self._save_trajectory_plot(columns)
             
-            logging.info(f"记录数据已保存到: {data_file}")
+            # 合并到热力图并加入相似会话索引和时空索引
+            index_recording(data_file, self.username, columns)
             
-            # 关闭浮窗
-            if self.floating_window:
-                self.floating_window.root.destroy()
+            logger.info(f"记录数据已保存到: {data_file}")
             
-            # 禁用鼠标并退出登录
-            mouse_controller.disable()
-            from session_manager import logout_windows
-            logout_windows()
+            self._end_session()
             
-            # 保存镜像数据
+            # 保存镜像数据（同一会话已由记录文件加入时空索引），按配置上传到采集服务
             if self.username:
-                mouse_mirror.save_mirror(self.username)
+                mirror_file = mouse_mirror.save_mirror(self.username, spatial=False)
+                upload_mirror_async(mirror_file, self.username)
             
             return data_file
             
         except Exception as e:
-            logging.error(f"保存记录数据时发生错误: {str(e)}")
+            logger.error(f"保存记录数据时发生错误: {str(e)}")
     
-    def _save_trajectory_plot(self):
+    def _end_session(self):
+        """关闭浮窗、停止事件流，然后禁用鼠标并退出登录"""
+        # 关闭浮窗
+        if self.floating_window:
+            self.floating_window.root.destroy()
+        
+        # 停止事件流（尽量发送剩余事件）
+        if self.streamer:
+            capture_bus.unregister(self.streamer.name)
+            self.streamer.stop()
+        
+        # 禁用鼠标并退出登录
+        mouse_controller.disable()
+        from session_manager import logout_windows
+        logout_windows()
+    
+    def _save_trajectory_plot(self, columns):
         """保存轨迹图"""
-        if not self.points:
+        if not columns['t'].size:
             return
             
         try:
-            points = np.array(self.points)
+            points = np.column_stack((columns['x'], columns['y']))
             plt.figure(figsize=(10, 8))
             
             # 绘制轨迹线
@@ -209,34 +437,44 @@ class MouseRecorder:
             plt.savefig(plot_path)
             plt.close()
             
-            logging.info(f"轨迹图已保存到: {plot_path}")
+            logger.info(f"轨迹图已保存到: {plot_path}")
         except Exception as e:
-            logging.error(f"保存轨迹图时发生错误: {str(e)}")
+            logger.error(f"保存轨迹图时发生错误: {str(e)}")
+
+# 遥测接收端：按事件类型计数
+capture_bus.register(CallbackSink('telemetry', lambda event: EVENTS_CAPTURED.labels(event.type).inc()))
 
 def start_recording():
     """开始记录鼠标轨迹"""
+    global current_recorder
     recorder = MouseRecorder()
+    current_recorder = recorder
+    BUFFER_SIZE.labels('recorder').set_function(lambda: recorder.event_count)
     
     def on_move(x, y):
         try:
+            start = time.perf_counter()
             if recorder.recording:
                 recorder.add_point(x, y, 'move')
-            logging.info(f'鼠标移动到 {(x, y)}')
+            logger.info(f'鼠标移动到 {(x, y)}')
+            CALLBACK_LATENCY.labels('move').observe(time.perf_counter() - start)
         except Exception as e:
-            logging.error(f"处理鼠标移动事件时发生错误: {str(e)}")
+            logger.error(f"处理鼠标移动事件时发生错误: {str(e)}")
 
     def on_click(x, y, button, pressed):
         try:
+            start = time.perf_counter()
             action = 'press' if pressed else 'release'
             event_type = f'click_{action}'
             if recorder.recording:
-                recorder.add_point(x, y, event_type)
+                recorder.add_point(x, y, event_type, button=button.name)
             
             button_name = '左键' if button == Button.left else '右键' if button == Button.right else '中键'
-            logging.info(f'鼠标{action} {button_name} 在位置 {(x, y)}')
+            logger.info(f'鼠标{action} {button_name} 在位置 {(x, y)}')
+            CALLBACK_LATENCY.labels('click').observe(time.perf_counter() - start)
             
             if button == Button.right and pressed:
-                logging.info('检测到右键点击，停止记录')
+                logger.info('检测到右键点击，停止记录')
                 recorder.recording = False
                 recorder.save_recording()
                 # 这里可以添加退出登录的代码
@@ -244,17 +482,19 @@ def start_recording():
             
             return True
         except Exception as e:
-            logging.error(f"处理鼠标点击事件时发生错误: {str(e)}")
+            logger.error(f"处理鼠标点击事件时发生错误: {str(e)}")
             return False
 
     def on_scroll(x, y, dx, dy):
         try:
+            start = time.perf_counter()
             event_type = 'scroll_up' if dy > 0 else 'scroll_down'
             if recorder.recording:
-                recorder.add_point(x, y, event_type)
-            logging.info(f'鼠标在位置 {(x, y)} {"向上" if dy > 0 else "向下"}滚动')
+                recorder.add_point(x, y, event_type, dx=dx, dy=dy)
+            logger.info(f'鼠标在位置 {(x, y)} {"向上" if dy > 0 else "向下"}滚动')
+            CALLBACK_LATENCY.labels('scroll').observe(time.perf_counter() - start)
         except Exception as e:
-            logging.error(f"处理鼠标滚轮事件时发生错误: {str(e)}")
+            logger.error(f"处理鼠标滚轮事件时发生错误: {str(e)}")
 
     try:
         print(f"开始记录鼠标轨迹... (右键点击停止并保存)")
@@ -265,13 +505,14 @@ def start_recording():
             on_click=on_click,
             on_scroll=on_scroll
         ) as listener:
+            startup_profiler.mark('listener_started')
             listener.join()
             
     except Exception as e:
-        logging.error(f"监听器发生错误: {str(e)}")
+        logger.error(f"监听器发生错误: {str(e)}")
         print(f"监听器发生错误: {str(e)}")
     finally:
-        if recorder.events:
+        if recorder.event_count:
             recorder.save_recording()
 
 def update_recording_info(username):
@@ -284,6 +525,7 @@ def update_recording_info(username):
 current_recorder = None
 
 if __name__ == "__main__":
+    setup_logging()
     # 测试代码
     current_recorder = MouseRecorder()
     current_recorder.update_user_info("test_user")
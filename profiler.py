@@ -0,0 +1,196 @@
+"""
+按需采样分析模块
+运行时通过界面按钮、信号或标志文件开启，在指定时间窗口内定期采样各线程调用栈
+结束后在 logs/ 下写出分析摘要和可直接生成火焰图的折叠栈文件
+未开启时不运行任何采样代码
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from log_config import get_logger
+
+logger = get_logger('profiler')
+
+PROFILE_DIR = 'logs'
+FLAG_FILE = os.path.join(PROFILE_DIR, 'profile.flag')  # 存在时触发一次采样，内容可为采样秒数
+DEFAULT_DURATION = 30.0  # 默认采样时长(秒)
+DEFAULT_INTERVAL = 0.005  # 默认采样间隔(秒)
+MAX_STACK_DEPTH = 64  # 单个调用栈最大深度
+
+class SamplingProfiler:
+    """
+    调用栈采样器
+    在后台线程中通过 sys._current_frames 采样，不修改被分析的代码
+    """
+    def __init__(self, interval: float = DEFAULT_INTERVAL, output_dir: str = PROFILE_DIR):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.last_output: Optional[Tuple[str, str]] = None  # 最近一次输出的(摘要文件, 折叠栈文件)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        """是否正在采样"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float = DEFAULT_DURATION) -> bool:
+        """
+        开始采样
+
+        Args:
+            duration: 采样时长(秒)
+
+        Returns:
+            是否成功开始（已在采样时返回 False）
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(duration,),
+                name='sampling-profiler',
+                daemon=True
+            )
+            self._thread.start()
+            logger.info(f"开始采样分析，时长 {duration}秒，间隔 {self.interval * 1000:.1f}毫秒")
+            return True
+
+    def stop(self) -> None:
+        """提前结束采样（仍会写出已采集的数据）"""
+        self._stop.set()
+
+    def _run(self, duration: float) -> None:
+        """采样线程主循环"""
+        stacks: Counter = Counter()
+        own_ident = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + duration
+        samples = 0
+
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stacks[self._collapse(names.get(ident, str(ident)), frame)] += 1
+            samples += 1
+            time.sleep(self.interval)
+
+        self.last_output = self._write(stacks, samples, time.perf_counter() - started)
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        """将调用栈折叠为 '线程;外层函数;...;内层函数' 形式"""
+        parts = []
+        while frame is not None and len(parts) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        parts.append(thread_name.replace(';', '_'))
+        return ';'.join(reversed(parts))
+
+    def _write(self, stacks: Counter, samples: int, elapsed: float) -> Optional[Tuple[str, str]]:
+        """写出分析摘要和折叠栈文件"""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            folded_file = os.path.join(self.output_dir, f'profile_{stamp}.folded')
+            summary_file = os.path.join(self.output_dir, f'profile_{stamp}.json')
+
+            with open(folded_file, 'w', encoding='utf-8') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+            with open(summary_file, 'w', encoding='utf-8') as f:
+                json.dump(self._summarize(stacks, samples, elapsed), f, ensure_ascii=False, indent=2)
+
+            logger.info(f"采样分析完成: {samples} 次采样，结果已保存到 {summary_file} 和 {folded_file}")
+            return summary_file, folded_file
+        except Exception as e:
+            logger.error(f"写出采样分析结果时发生错误: {str(e)}")
+            return None
+
+    def _summarize(self, stacks: Counter, samples: int, elapsed: float) -> Dict:
+        """统计各函数的自身和累计采样数"""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')[1:]  # 去掉线程名
+            if not frames:
+                continue
+            self_counts[frames[-1]] += count
+            for name in set(frames):
+                total_counts[name] += count
+
+        total = sum(stacks.values()) or 1
+        return {
+            'samples': samples,
+            'interval': self.interval,
+            'elapsed': round(elapsed, 3),
+            'top_self': [
+                {'function': name, 'samples': count, 'percent': round(count * 100 / total, 2)}
+                for name, count in self_counts.most_common(30)
+            ],
+            'top_total': [
+                {'function': name, 'samples': count, 'percent': round(count * 100 / total, 2)}
+                for name, count in total_counts.most_common(30)
+            ]
+        }
+
+def _read_flag_duration() -> float:
+    """读取标志文件中的采样时长"""
+    try:
+        with open(FLAG_FILE, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        return float(content) if content else DEFAULT_DURATION
+    except (OSError, ValueError):
+        return DEFAULT_DURATION
+
+def _watch_flag_file(poll_interval: float) -> None:
+    """轮询标志文件，出现时触发一次采样并删除标志"""
+    while True:
+        time.sleep(poll_interval)
+        if not os.path.exists(FLAG_FILE):
+            continue
+        duration = _read_flag_duration()
+        try:
+            os.remove(FLAG_FILE)
+        except OSError:
+            pass
+        profiler.start(duration)
+
+def install_triggers(poll_interval: float = 1.0) -> None:
+    """
+    安装外部触发方式（需在主线程调用）
+    - 信号：Windows 下为 SIGBREAK(Ctrl+Break)，其他系统为 SIGUSR1
+    - 标志文件：logs/profile.flag
+
+    Args:
+        poll_interval: 标志文件轮询间隔(秒)
+    """
+    signum = getattr(signal, 'SIGBREAK', None) or getattr(signal, 'SIGUSR1', None)
+    if signum is not None:
+        try:
+            signal.signal(signum, lambda *_: profiler.start())
+        except ValueError:
+            logger.warning("非主线程无法注册采样分析信号")
+
+    threading.Thread(
+        target=_watch_flag_file,
+        args=(poll_interval,),
+        name='profile-flag-watcher',
+        daemon=True
+    ).start()
+
+# 创建全局采样分析器实例
+profiler = SamplingProfiler()
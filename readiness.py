@@ -0,0 +1,115 @@
+"""
+就绪等待模块
+以轮询加指数退避的方式等待窗口出现或进程状态满足条件，替代启动流程中的固定 sleep
+"""
+
+import time
+from typing import Any, Callable, Optional
+import pygetwindow as gw
+from log_config import get_logger
+
+logger = get_logger('readiness')
+
+# 默认轮询参数
+DEFAULT_INTERVAL = 0.05  # 首次轮询间隔(秒)
+DEFAULT_MAX_INTERVAL = 0.5  # 最大轮询间隔(秒)
+DEFAULT_BACKOFF = 1.5  # 退避倍数
+
+def wait_until(
+    condition: Callable[[], Any],
+    timeout: Optional[float] = 10.0,
+    interval: float = DEFAULT_INTERVAL,
+    max_interval: float = DEFAULT_MAX_INTERVAL,
+    backoff: float = DEFAULT_BACKOFF,
+    description: str = '条件'
+) -> Any:
+    """
+    轮询等待条件成立
+
+    条件一旦返回真值立即返回，轮询间隔按 backoff 递增直到 max_interval
+
+    Args:
+        condition: 无参可调用对象，返回真值表示就绪
+        timeout: 超时时间(秒)，None 表示一直等待
+        interval: 首次轮询间隔(秒)
+        max_interval: 最大轮询间隔(秒)
+        backoff: 每次轮询后间隔的放大倍数
+        description: 日志中使用的条件描述
+
+    Returns:
+        条件的返回值，超时返回 None
+    """
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    delay = interval
+
+    while True:
+        try:
+            result = condition()
+        except Exception as e:
+            logger.debug(f"检查{description}时发生错误: {str(e)}")
+            result = None
+
+        now = time.monotonic()
+        if result:
+            logger.info(f"{description}已就绪，耗时 {now - start:.3f}秒")
+            return result
+
+        if deadline is not None and now >= deadline:
+            logger.warning(f"等待{description}超时 ({timeout}秒)")
+            return None
+
+        sleep_time = delay if deadline is None else min(delay, deadline - now)
+        time.sleep(sleep_time)
+        delay = min(delay * backoff, max_interval)
+
+def find_window(title: str) -> Optional[gw.Window]:
+    """
+    查找标题包含指定文本的第一个窗口
+
+    Args:
+        title: 窗口标题(包含匹配)
+
+    Returns:
+        窗口对象，未找到返回 None
+    """
+    windows = gw.getWindowsWithTitle(title)
+    return windows[0] if windows else None
+
+def wait_for_window(title: str, timeout: Optional[float] = 10.0, **kwargs) -> Optional[gw.Window]:
+    """
+    等待指定标题的窗口出现
+
+    Args:
+        title: 窗口标题(包含匹配)
+        timeout: 超时时间(秒)
+        **kwargs: 透传给 wait_until 的轮询参数
+
+    Returns:
+        窗口对象，超时返回 None
+    """
+    return wait_until(
+        lambda: find_window(title),
+        timeout=timeout,
+        description=f"窗口[{title}]",
+        **kwargs
+    )
+
+def wait_for_active(window: gw.Window, timeout: Optional[float] = 1.0, **kwargs) -> bool:
+    """
+    等待窗口成为前台活动窗口
+
+    Args:
+        window: 窗口对象
+        timeout: 超时时间(秒)
+        **kwargs: 透传给 wait_until 的轮询参数
+
+    Returns:
+        是否已激活
+    """
+    return bool(wait_until(
+        lambda: window.isActive,
+        timeout=timeout,
+        description=f"窗口[{window.title}]激活",
+        **kwargs
+    ))
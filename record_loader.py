@@ -0,0 +1,173 @@
+"""
+记录文件加载模块
+统一读取 mouse_records/*.json 与 mouse_mirrors/*.gz，并转换为按列存储的 NumPy 数组
+"""
+
+import os
+import json
+import gzip
+import numpy as np
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# 事件类型编码
+MOVE = 0
+PRESS = 1
+RELEASE = 2
+SCROLL_UP = 3
+SCROLL_DOWN = 4
+IDLE = 5
+OTHER = 9
+
+EVENT_CODES = {
+    'move': MOVE,
+    'click_press': PRESS,
+    'click_release': RELEASE,
+    'scroll_up': SCROLL_UP,
+    'scroll_down': SCROLL_DOWN,
+    'idle': IDLE,
+}
+
+# 超过该值的时间戳视为 Unix 时间（记录文件），否则为相对时间（镜像文件）
+EPOCH_THRESHOLD = 1e9
+
+RECORD_SUFFIXES = ('.json',)
+MIRROR_SUFFIXES = ('.gz',)
+SIDECAR_SUFFIXES = ('.segments.json',)  # 记录旁的索引文件，不是记录本身
+
+def event_code(event: Dict[str, Any]) -> int:
+    """
+    获取事件类型编码
+    兼容记录文件的 click_press/scroll_up 形式和镜像回放使用的 click/scroll 形式
+    """
+    event_type = event.get('type')
+    code = EVENT_CODES.get(event_type)
+    if code is not None:
+        return code
+    params = event.get('params') or {}
+    if event_type == 'click':
+        return PRESS if params.get('pressed') else RELEASE
+    if event_type == 'scroll':
+        return SCROLL_UP if params.get('dy', 0) > 0 else SCROLL_DOWN
+    return OTHER
+
+def is_recording_file(path: str) -> bool:
+    """判断是否为可加载的记录或镜像文件"""
+    name = os.path.basename(path)
+    if name.endswith(SIDECAR_SUFFIXES):
+        return False
+    return (
+        (name.startswith('record_') and name.endswith(RECORD_SUFFIXES))
+        or (name.startswith('mirror_') and name.endswith(MIRROR_SUFFIXES))
+    )
+
+def mirror_file_id(path: str) -> str:
+    """
+    获取镜像文件的密钥 ID（与保存时 auth_manager.store_encryption_key 使用的 ID 一致）
+    mirror_<用户>_<YYYYMMDD>_<HHMMSS>.enc.gz -> <用户>_<YYYYMMDD>_<HHMMSS>
+    """
+    name = os.path.basename(path)
+    for suffix in ('.enc.gz', '.gz'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name[len('mirror_'):] if name.startswith('mirror_') else name
+
+def load_recording(path: str, decrypt: Optional[Callable[[bytes], bytes]] = None) -> Dict[str, Any]:
+    """
+    加载记录或镜像文件
+
+    Args:
+        path: 文件路径
+        decrypt: 加密镜像的解密函数，输入文件内容返回 gzip 数据
+
+    Returns:
+        文件中的完整数据字典
+    """
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith('.enc.gz'):
+        if decrypt is None:
+            raise ValueError(f"加密文件需要提供解密函数: {path}")
+        data = decrypt(data)
+    return json.loads(gzip.decompress(data).decode('utf-8'))
+
+def to_columns(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    将事件列表转换为列式数组
+
+    Returns:
+        {
+            't': 相对首个事件的秒数 (float64),
+            'x', 'y': 坐标 (float64),
+            'code': 事件类型编码 (int8),
+            'base_time': 首个事件的 Unix 时间，镜像文件为 None,
+            'offset': 首个事件的原始时间戳
+        }
+    """
+    count = len(events)
+    if not count:
+        return columns_from_arrays(np.empty(0), np.empty(0), np.empty(0), np.empty(0, dtype=np.int8))
+
+    t = np.fromiter((e['timestamp'] for e in events), dtype=np.float64, count=count)
+    xy = np.array([e['position'] for e in events], dtype=np.float64).reshape(count, 2)
+    code = np.fromiter((event_code(e) for e in events), dtype=np.int8, count=count)
+    return columns_from_arrays(t, xy[:, 0], xy[:, 1], code)
+
+def columns_from_arrays(t: np.ndarray, x: np.ndarray, y: np.ndarray, code: np.ndarray) -> Dict[str, Any]:
+    """
+    由原始时间戳、坐标和类型编码数组构造与 to_columns 相同格式的列式数据
+
+    Args:
+        t: 原始时间戳
+        x, y: 坐标
+        code: 事件类型编码
+    """
+    if not t.size:
+        return {
+            't': np.empty(0), 'x': np.empty(0), 'y': np.empty(0),
+            'code': np.empty(0, dtype=np.int8), 'base_time': None, 'offset': 0.0
+        }
+    t = np.asarray(t, dtype=np.float64)
+    offset = float(t[0])
+    return {
+        't': t - offset,
+        'x': np.asarray(x, dtype=np.float64),
+        'y': np.asarray(y, dtype=np.float64),
+        'code': np.asarray(code, dtype=np.int8),
+        'base_time': offset if offset > EPOCH_THRESHOLD else None,
+        'offset': offset
+    }
+
+def load_columns(path: str, decrypt: Optional[Callable[[bytes], bytes]] = None) -> Dict[str, Any]:
+    """
+    加载文件并返回列式数组和元数据
+
+    Returns:
+        to_columns 的结果，附加 'username' 和 'path'
+    """
+    data = load_recording(path, decrypt)
+    columns = to_columns(data.get('events', []))
+    columns['username'] = data.get('username')
+    columns['path'] = path
+
+    # 镜像文件使用相对时间，用保存时间减去时长推算开始时间
+    if columns['base_time'] is None and data.get('timestamp') and data.get('duration') is not None:
+        try:
+            saved_at = datetime.fromisoformat(data['timestamp']).timestamp()
+            columns['base_time'] = saved_at - float(data['duration']) + columns['offset']
+        except (TypeError, ValueError):
+            pass
+    return columns
+
+def iter_recording_files(root: str):
+    """递归遍历目录下的记录和镜像文件"""
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if is_recording_file(path):
+                yield path
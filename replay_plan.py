@@ -0,0 +1,363 @@
+"""
+回放计划模块
+把记录或镜像文件编译为紧凑的回放计划：按动作存储的相对时间、操作码、坐标和数据数组，
+以及按调度时间片预先划分好的批次边界。计划按 文件路径、大小、修改时间 + 回放选项 缓存在内存和磁盘中，
+命中磁盘缓存时再核对文件内容哈希，重复和循环回放无需再次解码和逐事件解释
+"""
+
+import os
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from decode_pipeline import iter_events
+from input_injector import Action, BUTTONS, BUTTON_DOWN, BUTTON_UP, WHEEL, HWHEEL, WHEEL_DELTA, DEFAULT_SLOT, event_actions
+from record_loader import EPOCH_THRESHOLD
+from metrics import OPERATION_DURATION
+from log_config import get_logger
+
+logger = get_logger('replay_plan')
+
+PLAN_VERSION = 2  # 计划格式版本，变更后旧缓存自动失效
+CACHE_DIR = 'replay_cache'
+MEMORY_PLANS = 16  # 内存中缓存的计划数
+DISK_PLANS = 200  # 磁盘上缓存的计划数
+HASH_CHUNK = 1024 * 1024
+
+class ReplayPlan:
+    """
+    编译后的回放计划
+
+    Attributes:
+        times: 每个动作相对回放开始的计划时间(秒, float64)
+        opcodes: 动作类型 (uint8，取值同 input_injector 的 MOVE/BUTTON_DOWN/...)
+        x, y: 屏幕坐标 (int32)
+        data: 按键动作为 BUTTONS 中的序号，滚动动作为滚轮增量（格数 * 120）(int32)
+        batches: 批次边界 (int32)，第 i 批为 [batches[i], batches[i+1])
+        events: 源事件数
+        source: 源文件的 SHA-256（从磁盘缓存加载时可用，用于核对源文件是否变化）
+    """
+    def __init__(self, times, opcodes, x, y, data, batches, events: int):
+        self.times = times
+        self.opcodes = opcodes
+        self.x = x
+        self.y = y
+        self.data = data
+        self.batches = batches
+        self.events = events
+        self.source = ''
+
+    def __len__(self) -> int:
+        return int(self.opcodes.size)
+
+    @property
+    def batch_count(self) -> int:
+        return max(int(self.batches.size) - 1, 0)
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1]) if self.times.size else 0.0
+
+    def actions(self, start: int = 0, end: Optional[int] = None) -> List[Action]:
+        """把指定区间还原为 input_injector 的动作元组（用于测试后端和调试）"""
+        result = []
+        for op, x, y, data in zip(
+            self.opcodes[start:end].tolist(), self.x[start:end].tolist(),
+            self.y[start:end].tolist(), self.data[start:end].tolist()
+        ):
+            if op == BUTTON_DOWN or op == BUTTON_UP:
+                data = BUTTONS[data]
+            elif op == WHEEL or op == HWHEEL:
+                data = data // WHEEL_DELTA
+            else:
+                data = None
+            result.append((op, x, y, data))
+        return result
+
+    def slice(self, start_time: float, end_time: float, events: Optional[int] = None) -> 'ReplayPlan':
+        """
+        截取计划时间在 [start_time, end_time] 内的动作，时间平移到从 0 开始
+        批次边界沿用原计划（在区间端点处截断），不需要重新划分
+
+        Args:
+            start_time: 开始时间(秒，计划时间轴)
+            end_time: 结束时间(秒，计划时间轴)
+            events: 区间内的源事件数，None 时按动作数计
+        """
+        first = int(np.searchsorted(self.times, start_time, side='left'))
+        last = int(np.searchsorted(self.times, end_time, side='right'))
+        inner = self.batches[(self.batches > first) & (self.batches < last)]
+        batches = np.concatenate(([first], inner, [last])).astype(np.int32) - first if last > first \
+            else np.zeros(1, dtype=np.int32)
+        times = self.times[first:last]
+        return ReplayPlan(
+            times - times[0] if times.size else times, self.opcodes[first:last], self.x[first:last],
+            self.y[first:last], self.data[first:last], batches,
+            last - first if events is None else events
+        )
+
+    def save(self, path: str, source: str = '') -> None:
+        """原子写入 .npz 文件（不压缩，加载更快），source 为源文件哈希"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f, version=np.int32(PLAN_VERSION), times=self.times, opcodes=self.opcodes,
+                x=self.x, y=self.y, data=self.data, batches=self.batches, events=np.int64(self.events),
+                source=np.str_(source)
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ReplayPlan':
+        with np.load(path) as f:
+            if int(f['version']) != PLAN_VERSION:
+                raise ValueError(f"回放计划版本不匹配: {path}")
+            plan = cls(
+                f['times'], f['opcodes'], f['x'], f['y'], f['data'], f['batches'], int(f['events'])
+            )
+            plan.source = str(f['source'])
+            return plan
+
+class PlanBuilder:
+    """逐个接收事件并累积回放计划的各列"""
+    def __init__(self, time_origin: Optional[float] = None):
+        self.origin = time_origin
+        self.times: List[float] = []
+        self.opcodes: List[int] = []
+        self.xs: List[int] = []
+        self.ys: List[int] = []
+        self.data: List[int] = []
+        self.events = 0
+
+    def add(self, event: Dict[str, Any]) -> None:
+        timestamp = event['timestamp']
+        if self.origin is None:
+            self.origin = timestamp if timestamp > EPOCH_THRESHOLD else 0.0
+        for op, x, y, value in event_actions(event):
+            self.times.append(timestamp)
+            self.opcodes.append(op)
+            self.xs.append(x)
+            self.ys.append(y)
+            if op == BUTTON_DOWN or op == BUTTON_UP:
+                self.data.append(BUTTONS.index(value))
+            elif op == WHEEL or op == HWHEEL:
+                self.data.append(int(round(value * WHEEL_DELTA)))
+            else:
+                self.data.append(0)
+        self.events += 1
+
+    def build(self, slot: float = DEFAULT_SLOT, speed: float = 1.0) -> ReplayPlan:
+        times = (np.asarray(self.times, dtype=np.float64) - (self.origin or 0.0)) / speed
+        if times.size:
+            times = np.maximum.accumulate(times)  # 保证单调，系统时间回拨时不乱序
+        return ReplayPlan(
+            times,
+            np.asarray(self.opcodes, dtype=np.uint8),
+            np.asarray(self.xs, dtype=np.int32),
+            np.asarray(self.ys, dtype=np.int32),
+            np.asarray(self.data, dtype=np.int32),
+            split_batches(times, slot),
+            self.events
+        )
+
+def compile_plan(
+    events: Iterable[Dict[str, Any]],
+    slot: float = DEFAULT_SLOT,
+    speed: float = 1.0,
+    time_origin: Optional[float] = None
+) -> ReplayPlan:
+    """
+    编译回放计划
+
+    Args:
+        events: 事件列表或迭代器（按时间排序）
+        slot: 调度时间片(秒)，同一时间片内的动作划为一批
+        speed: 回放速度倍数
+        time_origin: 时间原点；None 表示自动判断（Unix 时间戳以首个事件为原点，相对时间戳以 0 为原点）
+
+    Returns:
+        回放计划
+    """
+    builder = PlanBuilder(time_origin)
+    for event in events:
+        builder.add(event)
+    return builder.build(slot, speed)
+
+def split_batches(times: np.ndarray, slot: float) -> np.ndarray:
+    """
+    按调度时间片划分批次：批次内动作的计划时间不晚于该批首个动作 + slot
+
+    Returns:
+        批次边界数组（首元素 0，末元素为动作数）
+    """
+    bounds = [0]
+    size = int(times.size)
+    if not size:
+        return np.zeros(1, dtype=np.int32)
+    start = 0
+    while start < size:
+        # 每批一次二分查找，批次数远少于动作数
+        end = int(np.searchsorted(times, times[start] + slot, side='right'))
+        end = max(end, start + 1)
+        bounds.append(end)
+        start = end
+    return np.asarray(bounds, dtype=np.int32)
+
+def file_sha256(path: str) -> str:
+    """计算文件 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class PlanCache:
+    """
+    回放计划缓存
+    内存中按 LRU 保留最近使用的计划；磁盘上以 .npz 保存，超过上限时删除最久未使用的文件
+    加密镜像的计划只缓存在内存中，避免解密后的轨迹落盘
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR, memory_plans: int = MEMORY_PLANS, disk_plans: int = DISK_PLANS):
+        self.cache_dir = cache_dir
+        self.memory_plans = memory_plans
+        self.disk_plans = disk_plans
+        self._plans: 'OrderedDict[str, ReplayPlan]' = OrderedDict()
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}  # 路径 -> (大小, 修改时间, 哈希)
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'compiles': 0, 'stale': 0}
+
+    def _file_hash(self, path: str) -> str:
+        """文件哈希，大小和修改时间未变时复用上次结果"""
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_sha256(path)
+        self._hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def cache_key(self, path: str, slot: float, speed: float) -> str:
+        """
+        缓存键: 文件路径、大小、修改时间 + 回放选项
+        只需一次 stat，不读取文件内容，首个事件的回放延迟与文件大小无关
+        """
+        stat = os.stat(path)
+        source = f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}'
+        options = f'v{PLAN_VERSION}|slot={slot!r}|speed={speed!r}'
+        return hashlib.sha256(f'{source}|{options}'.encode('utf-8')).hexdigest()
+
+    def lookup(self, path: str, slot: float = DEFAULT_SLOT, speed: float = 1.0) -> Optional[ReplayPlan]:
+        """查找已缓存的回放计划（先内存后磁盘），未命中返回 None"""
+        key = self.cache_key(path, slot, speed)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return plan
+
+        disk_path = os.path.join(self.cache_dir, f'{key}.npz')
+        if path.endswith('.enc.gz') or not os.path.exists(disk_path):
+            return None
+        try:
+            plan = ReplayPlan.load(disk_path)
+            # 命中后才核对内容哈希，防止文件被改写但大小和修改时间未变
+            if plan.source != self._file_hash(path):
+                self.stats['stale'] += 1
+                logger.info(f"回放计划缓存与源文件内容不一致，将重新编译: {path}")
+                os.remove(disk_path)
+                return None
+            os.utime(disk_path)  # 更新修改时间，用于磁盘 LRU
+        except Exception as e:
+            logger.warning(f"读取回放计划缓存失败，将重新编译: {str(e)}")
+            return None
+        self.stats['disk_hits'] += 1
+        self._remember(key, plan)
+        return plan
+
+    def store(self, path: str, plan: ReplayPlan, slot: float = DEFAULT_SLOT, speed: float = 1.0) -> None:
+        """写入缓存（加密文件只写内存）"""
+        key = self.cache_key(path, slot, speed)
+        self._remember(key, plan)
+        if not path.endswith('.enc.gz'):
+            # 写入时回放已完成或已编译，此时计算内容哈希不影响首个事件的延迟
+            self._store(os.path.join(self.cache_dir, f'{key}.npz'), plan, path)
+
+    def get(
+        self,
+        path: str,
+        decrypt: Optional[Callable[[bytes], bytes]] = None,
+        slot: float = DEFAULT_SLOT,
+        speed: float = 1.0
+    ) -> ReplayPlan:
+        """
+        获取文件的回放计划，未命中时编译并写入缓存
+
+        Args:
+            path: 记录或镜像文件
+            decrypt: 加密镜像的解密函数
+            slot: 调度时间片(秒)
+            speed: 回放速度倍数
+        """
+        plan = self.lookup(path, slot, speed)
+        if plan is None:
+            with OPERATION_DURATION.labels('compile_plan').time():
+                plan = compile_plan(iter_events(path, decrypt), slot, speed)
+            self._compiled(path, plan)
+            self.store(path, plan, slot, speed)
+        return plan
+
+    def capture(
+        self,
+        path: str,
+        events: Iterable[Dict[str, Any]],
+        slot: float = DEFAULT_SLOT,
+        speed: float = 1.0
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        透传事件流并顺带编译回放计划，事件流完整结束后写入缓存
+        用于首次回放：边解码边回放，下次回放直接使用计划
+        """
+        builder = PlanBuilder()
+        for event in events:
+            builder.add(event)
+            yield event
+        plan = builder.build(slot, speed)
+        self._compiled(path, plan)
+        self.store(path, plan, slot, speed)
+
+    def _compiled(self, path: str, plan: ReplayPlan) -> None:
+        self.stats['compiles'] += 1
+        logger.info(f"已编译回放计划: {path}，{plan.events} 个事件，{len(plan)} 个动作，{plan.batch_count} 批")
+
+    def _remember(self, key: str, plan: ReplayPlan) -> None:
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.memory_plans:
+                self._plans.popitem(last=False)
+
+    def _store(self, disk_path: str, plan: ReplayPlan, path: str) -> None:
+        """写入磁盘缓存（附带源文件哈希）并清理超出上限的旧计划"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            plan.save(disk_path, self._file_hash(path))
+            entries = [
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir) if name.endswith('.npz')
+            ]
+            if len(entries) > self.disk_plans:
+                entries.sort(key=os.path.getmtime)
+                for old_path in entries[:len(entries) - self.disk_plans]:
+                    os.remove(old_path)
+        except OSError as e:
+            logger.warning(f"写入回放计划缓存失败: {str(e)}")
+
+    def clear(self) -> None:
+        """清空内存缓存"""
+        with self._lock:
+            self._plans.clear()
+
+# 创建全局回放计划缓存实例
+plan_cache = PlanCache()
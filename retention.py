@@ -0,0 +1,379 @@
+"""
+数据保留策略模块
+按文件日期分层处理 mouse_records/ 和 mouse_mirrors/：
+    热数据（hot_days 天内）保持原样；
+    温数据（hot_days 至 expire_days）降采样后原地重写为紧凑文件，路径和格式不变，
+        分析、热力图、导出、回放和会话索引仍可直接读取，文件头中的 downsampled 字段记录降采样参数；
+    过期数据（超过 expire_days）连同加密密钥、会话索引和时空索引条目一起删除
+清理在低优先级后台线程中执行，读写经过限速，并在采集活跃时让路，不与实时记录争抢资源
+默认不启用，需要在 config/retention.json 中设置 "enabled": true
+采集服务端的过期清理由 collector_service 的 --retention-days 选项负责
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import argparse
+import platform
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from record_loader import iter_recording_files, mirror_file_id
+from exporter import parse_filename
+from event_bus import capture_bus, CallbackSink
+from log_config import get_logger, setup_logging
+
+logger = get_logger('retention')
+
+RETENTION_CONFIG = 'config/retention.json'
+RETENTION_STATE = 'config/retention_state.json'  # 已降采样的文件 -> (大小, 修改时间)，避免重复读取
+IO_CHUNK = 256 * 1024  # 限速读写的块大小
+
+DEFAULT_CONFIG = {
+    'enabled': False,  # 会删除和改写原始数据，需要显式开启
+    'hot_days': 14,  # 保持原始精度的天数
+    'expire_days': 365,  # 超过该天数的数据删除
+    'downsample_interval': 0.1,  # 温数据中相邻移动事件的最小间隔(秒)，点击和滚动全部保留
+    'compress_level': 9,
+    'interval_hours': 6,  # 两次清理之间的间隔
+    'io_rate_mb': 4.0,  # 读写限速(MB/秒)
+    'duty_cycle': 0.25,  # 工作时间占比，其余时间休眠
+    'quiet_seconds': 2.0,  # 最近该秒数内有采集事件时暂停处理
+    'quiet_timeout': 60.0,  # 持续有采集事件时最长等待时间，超时后仍以限速继续
+    'roots': ['mouse_records', 'mouse_mirrors']
+}
+
+def load_retention_config() -> Dict[str, Any]:
+    """
+    读取保留策略配置，缺省项使用默认值
+
+    配置示例 (config/retention.json):
+        {"enabled": true, "hot_days": 14, "expire_days": 365, "io_rate_mb": 4}
+    """
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(RETENTION_CONFIG, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return config
+
+class IoThrottle:
+    """令牌桶限速器，按字节数限制读写速率"""
+    def __init__(self, rate_bytes: float):
+        self.rate = rate_bytes
+        self.allowance = rate_bytes
+        self.last = time.monotonic()
+
+    def consume(self, size: int) -> None:
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+        self.last = now
+        self.allowance -= size
+        if self.allowance < 0:
+            time.sleep(-self.allowance / self.rate)
+
+def downsample_events(events: List[Dict[str, Any]], interval: float) -> List[Dict[str, Any]]:
+    """
+    降采样：保留全部非移动事件；移动事件与上一个保留的移动间隔不足 interval 时丢弃，
+    但点击、滚动前的最后一次移动总是保留，保证动作前的光标位置不变
+    """
+    result = []
+    last_kept = None
+    pending = None  # 最近一次被丢弃的移动
+    for event in events:
+        if event.get('type') != 'move':
+            if pending is not None:
+                result.append(pending)
+                pending = None
+            result.append(event)
+            continue
+        timestamp = event.get('timestamp', 0)
+        if last_kept is None or timestamp - last_kept >= interval:
+            result.append(event)
+            last_kept = timestamp
+            pending = None
+        else:
+            pending = event
+    if pending is not None:
+        result.append(pending)
+    return result
+
+def _lower_thread_priority() -> None:
+    """把当前线程切换为后台优先级（Windows 后台模式同时降低 CPU 和 I/O 优先级）"""
+    try:
+        if platform.system() == 'Windows':
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        elif hasattr(os, 'setpriority'):
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)  # Linux 上按线程生效
+    except (OSError, AttributeError) as e:
+        logger.warning(f"降低清理线程优先级失败: {str(e)}")
+
+def _sidecars(path: str) -> List[str]:
+    """记录文件附带的轨迹图和分段索引"""
+    paths = [path + '.segments.json']
+    if path.endswith('.json'):
+        paths.append(path[:-len('.json')] + '.png')
+    return [p for p in paths if os.path.exists(p)]
+
+class RetentionManager:
+    """保留策略执行器"""
+    def __init__(self, config: Optional[Dict[str, Any]] = None, state_path: str = RETENTION_STATE):
+        self.config = config or load_retention_config()
+        self.state_path = state_path
+        self.throttle = IoThrottle(self.config['io_rate_mb'] * 1024 * 1024)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_capture = 0.0
+        self._run_lock = threading.Lock()
+
+    # ---- 调度 ----
+
+    def start(self) -> bool:
+        """启动后台清理线程，配置中未启用时返回 False"""
+        if not self.config.get('enabled', False):
+            logger.info(f"数据保留清理未启用，如需开启请在 {RETENTION_CONFIG} 中设置 \"enabled\": true")
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        capture_bus.register(CallbackSink('retention', self._on_capture))
+        self._thread = threading.Thread(target=self._loop, name='retention', daemon=True)
+        self._thread.start()
+        logger.warning(
+            f"数据保留清理已启用: {self.config['hot_days']} 天前的记录和镜像将被降采样改写，"
+            f"{self.config['expire_days']} 天前的数据将被删除"
+        )
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止后台清理（当前文件处理完后退出）"""
+        self._stop.set()
+        capture_bus.unregister('retention')
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _on_capture(self, event) -> None:
+        """采集事件回调，只记录时间"""
+        self._last_capture = time.monotonic()
+
+    def _loop(self) -> None:
+        _lower_thread_priority()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"执行数据保留清理时发生错误: {str(e)}")
+            self._stop.wait(self.config['interval_hours'] * 3600)
+
+    def _yield(self, started: float) -> None:
+        """按工作占比休眠，并在采集活跃时等待空闲"""
+        duty = min(max(self.config['duty_cycle'], 0.01), 1.0)
+        self._stop.wait((time.monotonic() - started) * (1 - duty) / duty)
+        deadline = time.monotonic() + self.config['quiet_timeout']
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            quiet = time.monotonic() - self._last_capture
+            if quiet >= self.config['quiet_seconds']:
+                return
+            self._stop.wait(self.config['quiet_seconds'] - quiet)
+
+    # ---- 分层 ----
+
+    def classify(self, today: Optional[date] = None) -> Dict[str, Any]:
+        """
+        按文件日期分层
+
+        Returns:
+            {'downsample': [温数据文件], 'expire': [(文件, 用户, 日期)]}
+        """
+        today = today or date.today()
+        hot_limit = today - timedelta(days=self.config['hot_days'])
+        expire_limit = today - timedelta(days=self.config['expire_days'])
+        state = self._load_state()
+        downsample = []
+        expire = []
+        for root in self.config['roots']:
+            for path in iter_recording_files(root):
+                username, day = parse_filename(path)
+                if username is None or day is None or day >= hot_limit:
+                    continue
+                if day < expire_limit:
+                    expire.append((path, username, day))
+                elif not path.endswith('.enc.gz') and not self._is_downsampled(path, state):
+                    # 加密镜像没有密码无法降采样，保持原样直到过期
+                    downsample.append(path)
+        return {'downsample': downsample, 'expire': expire}
+
+    def run_once(self, today: Optional[date] = None) -> Dict[str, int]:
+        """
+        执行一次清理
+
+        Returns:
+            统计信息
+        """
+        with self._run_lock:
+            tiers = self.classify(today)
+            stats = {'downsampled_files': 0, 'expired_files': 0, 'removed_keys': 0, 'bytes_freed': 0}
+            state = self._load_state()
+            for path in tiers['downsample']:
+                if self._stop.is_set():
+                    break
+                started = time.monotonic()
+                try:
+                    stats['bytes_freed'] += self.downsample_file(path)
+                    stats['downsampled_files'] += 1
+                    stat = os.stat(path)
+                    state[path] = [stat.st_size, stat.st_mtime_ns]
+                except Exception as e:
+                    logger.error(f"降采样文件 {path} 时发生错误: {str(e)}")
+                self._yield(started)
+
+            if not self._stop.is_set():
+                self._expire(tiers['expire'], stats)
+            self._save_state(state)
+            logger.info(f"数据保留清理完成: {stats}")
+            return stats
+
+    # ---- 状态 ----
+
+    def _load_state(self) -> Dict[str, List[int]]:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict[str, List[int]]) -> None:
+        """保存已降采样文件列表（去掉已删除的文件）"""
+        state = {path: entry for path, entry in state.items() if os.path.exists(path)}
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+            tmp_path = self.state_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"保存数据保留状态时发生错误: {str(e)}")
+
+    @staticmethod
+    def _is_downsampled(path: str, state: Dict[str, List[int]]) -> bool:
+        """文件已降采样且之后未被改动"""
+        entry = state.get(path)
+        if not entry:
+            return False
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns] == entry
+
+    # ---- 温数据 ----
+
+    def _read(self, path: str) -> bytes:
+        chunks = []
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(IO_CHUNK)
+                if not chunk:
+                    break
+                self.throttle.consume(len(chunk))
+                chunks.append(chunk)
+        return b''.join(chunks)
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for start in range(0, len(data), IO_CHUNK):
+                chunk = data[start:start + IO_CHUNK]
+                self.throttle.consume(len(chunk))
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _load(self, path: str) -> Dict[str, Any]:
+        raw = self._read(path)
+        if path.endswith('.gz'):
+            raw = gzip.decompress(raw)
+        return json.loads(raw.decode('utf-8'))
+
+    def downsample_file(self, path: str) -> int:
+        """
+        降采样并原地重写记录或镜像文件（记录写为紧凑 JSON，镜像按配置级别重新压缩）
+        路径不变，会话索引和时空索引中的条目继续有效；分段索引按修改时间自动重建
+
+        Returns:
+            释放的字节数
+        """
+        original_size = os.path.getsize(path)
+        data = self._load(path)
+        if data.get('downsampled'):
+            return 0
+        events = data.get('events', [])
+        data['events'] = downsample_events(events, self.config['downsample_interval'])
+        if 'event_count' in data:
+            data['event_count'] = len(data['events'])
+        data['downsampled'] = {
+            'interval': self.config['downsample_interval'],
+            'original_events': len(events)
+        }
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if path.endswith('.gz'):
+            payload = gzip.compress(payload, compresslevel=self.config['compress_level'])
+        self._write_atomic(path, payload)
+        logger.info(
+            f"已降采样 {path}: {len(events)} -> {len(data['events'])} 个事件，"
+            f"释放 {(original_size - len(payload)) / 1024:.1f}KB"
+        )
+        return original_size - len(payload)
+
+    # ---- 过期数据 ----
+
+    def _expire(self, files: List[Tuple[str, str, date]], stats: Dict[str, int]) -> None:
+        """删除过期文件及其密钥和索引"""
+        from auth_manager import auth_manager
+        from session_index import session_index
+        from spatial_index import spatial_index
+
+        days = set()
+        session_ids = []
+        for path, username, day in files:
+            try:
+                for victim in [path] + _sidecars(path):
+                    stats['bytes_freed'] += os.path.getsize(victim)
+                    os.remove(victim)
+                stats['expired_files'] += 1
+                if path.endswith('.enc.gz') and auth_manager.remove_encryption_key(username, mirror_file_id(path)):
+                    stats['removed_keys'] += 1
+                session_ids.append(path)
+                days.add((username, day))
+            except OSError as e:
+                logger.error(f"删除过期文件 {path} 时发生错误: {str(e)}")
+
+        if session_ids:
+            session_index.remove(session_ids)
+        for username, day in sorted(days):
+            spatial_index.remove_day(username, day)
+
+# 创建全局保留策略实例
+retention_manager = RetentionManager()
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='执行一次数据保留清理')
+    parser.add_argument('--today', type=date.fromisoformat, default=None, help='按指定日期计算数据年龄')
+    parser.add_argument('--dry-run', action='store_true', help='只列出将要处理的文件')
+    args = parser.parse_args()
+
+    if args.dry_run:
+        tiers = retention_manager.classify(args.today)
+        for path in tiers['downsample']:
+            print(f"降采样 {path}")
+        for path, _, _ in tiers['expire']:
+            print(f"删除 {path}")
+        sys.exit(0)
+    print(json.dumps(retention_manager.run_once(args.today), ensure_ascii=False))
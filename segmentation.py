@@ -0,0 +1,317 @@
+"""
+任务分段模块
+按空闲间隔（含 idle 标记）、点击簇和屏幕区域变化把记录切分为活动片段，
+全部在列式数组上向量化计算；每个记录旁保存 <文件>.segments.json 分段索引，
+包含每段的起止时间、事件计数和包围盒，供回放器和界面直接跳转到任意片段
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from record_loader import (
+    load_columns, iter_recording_files, MOVE, PRESS, SCROLL_UP, SCROLL_DOWN, IDLE, EPOCH_THRESHOLD
+)
+from log_config import get_logger, setup_logging
+
+logger = get_logger('segmentation')
+
+SEGMENT_VERSION = 1  # 索引格式版本，变更后旧索引自动重建
+SEGMENT_SUFFIX = '.segments.json'
+DEFAULT_GAP = 10.0  # 超过该秒数的事件间隔视为任务边界
+BURST_GAP = 1.5  # 相邻点击间隔不超过该秒数时属于同一点击簇
+REGION_SIZE = 480  # 屏幕区域格子边长(像素)
+TIME_EPSILON = 1e-6  # 索引中的时间保留到微秒，换算计划区间时的容差
+
+# 分段原因
+REASONS = ('start', 'gap', 'idle', 'region')
+_START, _GAP, _IDLE, _REGION = 1, 2, 3, 4
+
+def segment_columns(
+    columns: Dict[str, Any],
+    gap: float = DEFAULT_GAP,
+    burst_gap: float = BURST_GAP,
+    region_size: int = REGION_SIZE
+) -> List[Dict[str, Any]]:
+    """
+    计算单个会话的分段
+
+    分段边界:
+        gap: 相邻事件间隔不小于 gap 秒
+        idle: 空闲标记之后的第一个事件（标记本身不计入任何片段）
+        region: 相邻两个点击簇位于不同区域时，在光标进入新区域的位置切分；
+                同一点击簇内的区域变化（如跨格子的双击）不切分
+
+    Args:
+        columns: record_loader.to_columns 返回的列式数据
+        gap: 空闲间隔阈值(秒)
+        burst_gap: 点击簇内的最大点击间隔(秒)
+        region_size: 区域格子边长(像素)
+
+    Returns:
+        片段列表，时间为相对首个事件的秒数
+    """
+    code = columns['code']
+    keep = code != IDLE
+    after_idle = np.zeros(code.size, dtype=bool)
+    after_idle[1:] = code[:-1] == IDLE
+    t, x, y, code, after_idle = (
+        columns['t'][keep], columns['x'][keep], columns['y'][keep], code[keep], after_idle[keep]
+    )
+    count = t.size
+    if not count:
+        return []
+
+    reasons = np.zeros(count, dtype=np.int8)
+    dt = np.diff(t)
+    reasons[1:][dt >= gap] = _GAP
+    reasons[after_idle] = _IDLE
+    reasons[0] = _START
+
+    # 点击簇：按点击间隔分组，每簇的第一个点击为簇起点
+    presses = np.flatnonzero(code == PRESS)
+    burst_start = np.zeros(count, dtype=bool)
+    if presses.size:
+        new_burst = np.diff(t[presses]) > burst_gap
+        burst_start[presses[0]] = True
+        burst_start[presses[1:][new_burst]] = True
+
+        # 区域变化：比较上一簇最后一个点击与下一簇第一个点击所在的格子
+        cell = (x // region_size).astype(np.int64) * 65536 + (y // region_size).astype(np.int64)
+        first = presses[1:][new_burst]
+        previous = presses[:-1][new_burst]
+        changed = cell[first] != cell[previous]
+        first, previous = first[changed], previous[changed]
+        # 两簇之间已有间隔边界时不再按区域切分
+        hard = np.cumsum(reasons > 0)
+        first = first[hard[first] == hard[previous]]
+        if first.size:
+            run_starts = np.flatnonzero(np.concatenate(([True], cell[1:] != cell[:-1])))
+            cuts = run_starts[np.searchsorted(run_starts, first, side='right') - 1]
+            reasons[cuts] = _REGION
+
+    bounds = np.flatnonzero(reasons)
+    ends = np.append(bounds[1:], count)
+    cumulative = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+
+    def per_segment(mask: np.ndarray) -> List[int]:
+        return np.add.reduceat(mask.astype(np.int64), bounds).tolist()
+
+    moves = per_segment(code == MOVE)
+    clicks = per_segment(code == PRESS)
+    scrolls = per_segment((code == SCROLL_UP) | (code == SCROLL_DOWN))
+    bursts = per_segment(burst_start)
+    x0 = np.minimum.reduceat(x, bounds).tolist()
+    y0 = np.minimum.reduceat(y, bounds).tolist()
+    x1 = np.maximum.reduceat(x, bounds).tolist()
+    y1 = np.maximum.reduceat(y, bounds).tolist()
+    starts = t[bounds]
+    finishes = t[ends - 1]
+    paths = cumulative[ends - 1] - cumulative[bounds]
+    pauses = np.where(bounds > 0, t[bounds] - t[np.maximum(bounds - 1, 0)], 0.0)
+    base_time = columns.get('base_time')
+
+    segments = []
+    for i, (first_index, end_index) in enumerate(zip(bounds.tolist(), ends.tolist())):
+        start = float(starts[i])
+        segments.append({
+            'index': i,
+            'reason': REASONS[int(reasons[first_index]) - 1],
+            'start': round(start, 6),
+            'end': round(float(finishes[i]), 6),
+            'start_time': (
+                datetime.fromtimestamp(base_time + start).isoformat(timespec='seconds')
+                if base_time is not None else None
+            ),
+            'pause_before': round(float(pauses[i]), 3),
+            'events': end_index - first_index,
+            'moves': moves[i],
+            'clicks': clicks[i],
+            'scrolls': scrolls[i],
+            'bursts': bursts[i],
+            'path_length': round(float(paths[i]), 1),
+            'bbox': [int(x0[i]), int(y0[i]), int(x1[i]), int(y1[i])]
+        })
+    return segments
+
+def sidecar_path(path: str) -> str:
+    """分段索引文件路径"""
+    return path + SEGMENT_SUFFIX
+
+def _params(gap: float, burst_gap: float, region_size: int) -> Dict[str, Any]:
+    return {'gap': gap, 'burst_gap': burst_gap, 'region_size': region_size}
+
+def segment_file(
+    path: str,
+    decrypt: Optional[Callable[[bytes], bytes]] = None,
+    gap: float = DEFAULT_GAP,
+    burst_gap: float = BURST_GAP,
+    region_size: int = REGION_SIZE
+) -> Dict[str, Any]:
+    """
+    计算文件的分段索引
+
+    Returns:
+        索引字典（含源文件大小和修改时间，用于判断索引是否过期）
+    """
+    stat = os.stat(path)
+    columns = load_columns(path, decrypt)
+    segments = segment_columns(columns, gap, burst_gap, region_size)
+    return {
+        'version': SEGMENT_VERSION,
+        'source': os.path.basename(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'params': _params(gap, burst_gap, region_size),
+        'username': columns.get('username'),
+        'offset': columns['offset'],
+        'duration': round(float(columns['t'][-1]), 3) if columns['t'].size else 0.0,
+        'segments': segments
+    }
+
+def write_segments(path: str, index: Dict[str, Any]) -> None:
+    """原子写入分段索引"""
+    target = sidecar_path(path)
+    tmp_path = target + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, target)
+
+def read_segments(path: str) -> Optional[Dict[str, Any]]:
+    """读取已保存的分段索引，不存在或损坏时返回 None"""
+    try:
+        with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _is_fresh(path: str, index: Optional[Dict[str, Any]], params: Dict[str, Any]) -> bool:
+    if not index or index.get('version') != SEGMENT_VERSION or index.get('params') != params:
+        return False
+    stat = os.stat(path)
+    return index.get('size') == stat.st_size and index.get('mtime_ns') == stat.st_mtime_ns
+
+def load_segments(
+    path: str,
+    decrypt: Optional[Callable[[bytes], bytes]] = None,
+    rebuild: bool = False,
+    gap: float = DEFAULT_GAP,
+    burst_gap: float = BURST_GAP,
+    region_size: int = REGION_SIZE
+) -> Dict[str, Any]:
+    """
+    获取文件的分段索引，索引不存在、过期或参数不同时重新计算并保存
+    加密镜像的索引只在内存中计算，不写入旁路文件，避免泄露活动时间和区域
+
+    Args:
+        path: 记录或镜像文件
+        decrypt: 加密镜像的解密函数
+        rebuild: 是否强制重建
+        gap: 空闲间隔阈值(秒)
+        burst_gap: 点击簇内的最大点击间隔(秒)
+        region_size: 区域格子边长(像素)
+
+    Returns:
+        分段索引字典
+    """
+    params = _params(gap, burst_gap, region_size)
+    encrypted = path.endswith('.enc.gz')
+    if not rebuild and not encrypted:
+        index = read_segments(path)
+        if _is_fresh(path, index, params):
+            return index
+
+    index = segment_file(path, decrypt, gap, burst_gap, region_size)
+    if not encrypted:
+        try:
+            write_segments(path, index)
+        except OSError as e:
+            logger.warning(f"写入分段索引失败: {str(e)}")
+    logger.info(f"已生成分段索引: {path}，{len(index['segments'])} 段")
+    return index
+
+def plan_range(index: Dict[str, Any], segment: Dict[str, Any], speed: float = 1.0) -> Tuple[float, float]:
+    """
+    把片段换算为回放计划时间轴上的区间（与 replay_plan.PlanBuilder 的时间原点规则一致：
+    Unix 时间戳以首个事件为原点，镜像的相对时间戳以 0 为原点）
+
+    Returns:
+        (开始时间, 结束时间)，单位秒
+    """
+    offset = index.get('offset') or 0.0
+    base = 0.0 if offset > EPOCH_THRESHOLD else offset
+    return (
+        (base + segment['start'] - TIME_EPSILON) / speed,
+        (base + segment['end'] + TIME_EPSILON) / speed
+    )
+
+def format_segment(segment: Dict[str, Any]) -> str:
+    """单行描述片段"""
+    when = segment['start_time'] or f"{segment['start']:.1f}s"
+    x0, y0, x1, y1 = segment['bbox']
+    return (
+        f"#{segment['index']:<4}{when:<20}{segment['end'] - segment['start']:>9.1f}秒 "
+        f"{segment['reason']:<7}事件{segment['events']:>7} 点击{segment['clicks']:>5} "
+        f"滚动{segment['scrolls']:>5} 区域({x0},{y0})-({x1},{y1})"
+    )
+
+def index_file(path: str, rebuild: bool = False, **params) -> Optional[Tuple[str, int]]:
+    """
+    为单个文件生成分段索引（在工作进程中执行）
+
+    Returns:
+        (文件路径, 片段数)，失败返回 None
+    """
+    try:
+        return path, len(load_segments(path, rebuild=rebuild, **params)['segments'])
+    except Exception as e:
+        logger.error(f"分段文件 {path} 时发生错误: {str(e)}")
+        return None
+
+def index_tree(root: str, workers: Optional[int] = None, rebuild: bool = False, **params) -> List[Tuple[str, int]]:
+    """
+    使用进程池为目录下的所有记录文件生成分段索引（加密镜像跳过）
+
+    Returns:
+        [(文件路径, 片段数)]
+    """
+    paths = [p for p in iter_recording_files(root) if not p.endswith('.enc.gz')]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(index_file, path, rebuild, **params) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is not None:
+                results.append(result)
+    results.sort()
+    logger.info(f"已为 {len(results)}/{len(paths)} 个文件生成分段索引: {root}")
+    return results
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='记录文件任务分段')
+    parser.add_argument('paths', nargs='+', help='记录文件，或 mouse_records/、mouse_mirrors/ 目录')
+    parser.add_argument('--gap', type=float, default=DEFAULT_GAP, help='空闲间隔阈值(秒)')
+    parser.add_argument('--burst-gap', type=float, default=BURST_GAP, help='点击簇内的最大点击间隔(秒)')
+    parser.add_argument('--region-size', type=int, default=REGION_SIZE, help='区域格子边长(像素)')
+    parser.add_argument('--rebuild', action='store_true', help='忽略已有索引，强制重建')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数')
+    args = parser.parse_args()
+    options = {'gap': args.gap, 'burst_gap': args.burst_gap, 'region_size': args.region_size}
+
+    for target in args.paths:
+        if os.path.isdir(target):
+            for path, count in index_tree(target, args.workers, args.rebuild, **options):
+                print(f"{path}: {count} 段")
+        elif os.path.exists(target):
+            index = load_segments(target, rebuild=args.rebuild, **options)
+            print(f"{target}: {len(index['segments'])} 段")
+            for segment in index['segments']:
+                print(f"  {format_segment(segment)}")
+        else:
+            print(f"文件或目录不存在: {target}")
+            sys.exit(1)
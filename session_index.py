@@ -0,0 +1,395 @@
+"""
+会话特征索引模块
+每次保存记录时把会话概括为定长特征向量（速度直方图、点击位置直方图、停顿统计），
+追加到 mouse_index/ 下按行存储的 float32 矩阵，查询时以内存映射方式读取矩阵计算最近邻，
+不需要读取任何原始记录文件
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from record_loader import load_columns, iter_recording_files, MOVE, PRESS, SCROLL_UP, SCROLL_DOWN, IDLE
+from analytics import PAUSE_THRESHOLD, MIN_DT
+from log_config import get_logger, setup_logging
+
+logger = get_logger('session_index')
+
+INDEX_DIR = 'mouse_index'
+INDEX_VERSION = 1  # 特征定义变更时递增，旧索引需要重建
+
+# 速度直方图：对数分箱，单位 像素/秒
+SPEED_BINS = np.concatenate(([0.0], np.geomspace(10, 20000, 15), [np.inf]))
+# 点击位置直方图：按参考屏幕尺寸划分 8x8 网格，超出部分计入边缘格子
+CLICK_GRID = 8
+SCREEN_WIDTH = 1920
+SCREEN_HEIGHT = 1080
+PAUSE_FEATURES = 5
+RATE_FEATURES = 3
+FEATURE_DIM = (SPEED_BINS.size - 1) + CLICK_GRID * CLICK_GRID + PAUSE_FEATURES + RATE_FEATURES
+
+def feature_vector(columns: Dict[str, Any], pause_threshold: float = PAUSE_THRESHOLD) -> np.ndarray:
+    """
+    计算会话的定长特征向量
+
+    各部分:
+        速度直方图(16): 相邻移动事件速度的分布（占比）
+        点击直方图(64): 点击位置在 8x8 网格中的分布（占比）
+        停顿统计(5): 每分钟停顿数、停顿时间占比、停顿时长 log(1+均值/中位数/p90)
+        速率(3): log(1+每分钟点击数/滚动数/移动距离千像素数)
+
+    Args:
+        columns: record_loader.to_columns 返回的列式数据
+        pause_threshold: 停顿判定阈值(秒)
+
+    Returns:
+        (FEATURE_DIM,) float32 数组
+    """
+    keep = columns['code'] != IDLE
+    t, x, y, code = columns['t'][keep], columns['x'][keep], columns['y'][keep], columns['code'][keep]
+    vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+    if not t.size:
+        return vector
+    minutes = max(float(t[-1] - t[0]) / 60, 1 / 60)
+
+    # 速度直方图
+    moves = np.flatnonzero(code == MOVE)
+    dt = np.diff(t[moves])
+    dist = np.hypot(np.diff(x[moves]), np.diff(y[moves]))
+    valid = dt >= MIN_DT
+    speed_counts, _ = np.histogram(dist[valid] / dt[valid], bins=SPEED_BINS)
+    offset = SPEED_BINS.size - 1
+    if speed_counts.sum():
+        vector[:offset] = speed_counts / speed_counts.sum()
+
+    # 点击位置直方图
+    presses = code == PRESS
+    if presses.any():
+        ix = np.clip((x[presses] * CLICK_GRID // SCREEN_WIDTH).astype(np.int64), 0, CLICK_GRID - 1)
+        iy = np.clip((y[presses] * CLICK_GRID // SCREEN_HEIGHT).astype(np.int64), 0, CLICK_GRID - 1)
+        clicks = np.bincount(iy * CLICK_GRID + ix, minlength=CLICK_GRID * CLICK_GRID)
+        vector[offset:offset + clicks.size] = clicks / clicks.sum()
+    offset += CLICK_GRID * CLICK_GRID
+
+    # 停顿统计（空闲标记已被剔除，标记前后的间隔本身就是停顿）
+    gaps = np.diff(t)
+    pauses = gaps[gaps >= pause_threshold]
+    if pauses.size:
+        p50, p90 = np.percentile(pauses, [50, 90])
+        vector[offset:offset + PAUSE_FEATURES] = (
+            np.log1p(pauses.size / minutes),
+            pauses.sum() / (minutes * 60),
+            np.log1p(pauses.mean()),
+            np.log1p(p50),
+            np.log1p(p90)
+        )
+    offset += PAUSE_FEATURES
+
+    # 速率
+    scrolls = np.count_nonzero((code == SCROLL_UP) | (code == SCROLL_DOWN))
+    path_length = float(np.hypot(np.diff(x), np.diff(y)).sum())
+    vector[offset:offset + RATE_FEATURES] = np.log1p((
+        np.count_nonzero(presses) / minutes, scrolls / minutes, path_length / 1000 / minutes
+    ))
+    return vector
+
+def _entry(path: str, username: Optional[str], columns: Dict[str, Any]) -> Dict[str, Any]:
+    """索引条目（与向量行一一对应）"""
+    base_time = columns.get('base_time')
+    return {
+        'id': os.path.basename(path),
+        'path': path,
+        'username': username,
+        'start_time': datetime.fromtimestamp(base_time).isoformat(timespec='seconds') if base_time else None,
+        'duration': round(float(columns['t'][-1]), 3) if columns['t'].size else 0.0
+    }
+
+class SessionIndex:
+    """
+    会话特征索引
+    vectors.f32 为按行追加的 float32 矩阵，ids.jsonl 每行对应一条向量的条目；
+    写入时先追加向量再追加条目，两者行数不一致时（例如写入中断）以较小者为准
+    """
+    def __init__(self, root: str = INDEX_DIR):
+        self.root = root
+        self.vectors_path = os.path.join(root, 'vectors.f32')
+        self.ids_path = os.path.join(root, 'ids.jsonl')
+        self.meta_path = os.path.join(root, 'index.json')
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # 内存映射的向量矩阵
+        self._norms: Optional[np.ndarray] = None  # 各行的平方范数
+        self._reset_entries()
+
+    def _reset_entries(self) -> None:
+        self._entries: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}  # id -> 行号（同一 id 以最后一次写入为准）
+        self._users: Dict[Optional[str], int] = {}  # 用户名 -> 编号
+        self._owners: List[int] = []  # 每行的用户编号
+        self._active: List[bool] = []  # 每行是否为该 id 的最新一行
+        self._masks: Optional[Tuple[np.ndarray, np.ndarray]] = None  # (用户编号, 有效行) 数组缓存
+        self._ids_size = 0  # 已读取的 ids.jsonl 字节数
+
+    def _check_meta(self) -> bool:
+        """检查索引格式，不存在时创建，不匹配时返回 False"""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'dim': FEATURE_DIM}, f)
+            return True
+        return meta.get('version') == INDEX_VERSION and meta.get('dim') == FEATURE_DIM
+
+    def add(self, path: str, username: Optional[str], columns: Dict[str, Any]) -> None:
+        """
+        追加一个会话
+
+        Args:
+            path: 记录文件路径
+            username: 用户名
+            columns: record_loader.to_columns 返回的列式数据
+        """
+        vector = feature_vector(columns)
+        entry = _entry(path, username, columns)
+        with self._lock:
+            if not self._check_meta():
+                logger.warning(f"会话索引格式已变更，请先重建索引: {self.root}")
+                return
+            self._truncate_partial()
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vector.tobytes())
+            with open(self.ids_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        logger.info(f"已加入会话索引: {entry['id']}")
+
+    def _truncate_partial(self) -> None:
+        """去掉写入中断留下的不完整条目行、不完整向量行和多余向量行"""
+        entries = 0
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, 'rb') as f:
+                data = f.read()
+            complete = data.rfind(b'\n') + 1
+            if complete != len(data):
+                with open(self.ids_path, 'r+b') as f:
+                    f.truncate(complete)
+            entries = data.count(b'\n')
+        if not os.path.exists(self.vectors_path):
+            return
+        keep = min(os.path.getsize(self.vectors_path) // (FEATURE_DIM * 4), entries) * FEATURE_DIM * 4
+        if os.path.getsize(self.vectors_path) != keep:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(keep)
+
+    def _refresh(self) -> int:
+        """同步磁盘上新追加的条目和向量，返回可用行数"""
+        try:
+            ids_size = os.path.getsize(self.ids_path)
+        except OSError:
+            return 0
+        if ids_size != self._ids_size:
+            if ids_size < self._ids_size:
+                self._reset_entries()
+            with open(self.ids_path, 'rb') as f:
+                f.seek(self._ids_size)
+                data = f.read(ids_size - self._ids_size)
+            complete = data.rfind(b'\n') + 1
+            for line in data[:complete].splitlines():
+                entry = json.loads(line)
+                previous_row = self._positions.get(entry['id'])
+                if previous_row is not None:
+                    self._active[previous_row] = False
+                self._positions[entry['id']] = len(self._entries)
+                self._entries.append(entry)
+                self._owners.append(self._users.setdefault(entry['username'], len(self._users)))
+                self._active.append(True)
+            self._ids_size += complete
+            self._masks = None
+
+        rows = min(len(self._entries), os.path.getsize(self.vectors_path) // (FEATURE_DIM * 4))
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            if not rows:
+                return 0
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, FEATURE_DIM))
+            previous = 0 if self._norms is None or self._norms.size > rows else self._norms.size
+            added = np.einsum('ij,ij->i', self._matrix[previous:], self._matrix[previous:])
+            self._norms = added if previous == 0 else np.concatenate((self._norms, added))
+        return rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._refresh()
+
+    def vector(self, session_id: str) -> Optional[np.ndarray]:
+        """按 id（记录文件名）获取已索引的向量"""
+        with self._lock:
+            rows = self._refresh()
+            row = self._positions.get(os.path.basename(session_id))
+            if row is None or row >= rows:
+                return None
+            return np.array(self._matrix[row])
+
+    def query(
+        self,
+        vector: np.ndarray,
+        k: int = 10,
+        users: Optional[Iterable[str]] = None,
+        exclude: Optional[Iterable[str]] = None
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        最近邻查询（欧氏距离）
+        距离按 |a|^2 - 2 a·b + |b|^2 计算，只需一次矩阵向量乘；行范数在追加时增量维护
+
+        Args:
+            vector: 查询向量（feature_vector 的结果）
+            k: 返回数量
+            users: 只在这些用户的会话中查找
+            exclude: 排除的 id
+
+        Returns:
+            [(距离, 条目)]，按距离升序
+        """
+        with self._lock:
+            rows = self._refresh()
+            if not rows:
+                return []
+            query = np.asarray(vector, dtype=np.float32)
+            distances = self._norms - 2 * (self._matrix @ query) + float(query @ query)
+            if self._masks is None:
+                self._masks = (np.asarray(self._owners, dtype=np.int32), np.asarray(self._active, dtype=bool))
+            owners, active = self._masks
+            # 同一 id 重复写入时只保留最后一行
+            latest = active[:rows].copy()
+            if users is not None:
+                codes = [self._users[user] for user in users if user in self._users]
+                latest &= np.isin(owners[:rows], codes)
+            for session_id in (exclude or ()):
+                row = self._positions.get(os.path.basename(session_id))
+                if row is not None and row < rows:
+                    latest[row] = False
+            distances = np.where(latest, distances, np.inf)
+            count = min(k, int(latest.sum()))
+            if not count:
+                return []
+            nearest = np.argpartition(distances, count - 1)[:count]
+            nearest = nearest[np.argsort(distances[nearest])]
+            return [
+                (float(np.sqrt(max(distances[row], 0.0))), self._entries[row])
+                for row in nearest.tolist()
+            ]
+
+    def similar_to(self, session_id: str, k: int = 10, users: Optional[Iterable[str]] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """查找与已索引会话最相似的其他会话"""
+        vector = self.vector(session_id)
+        if vector is None:
+            raise KeyError(f"会话未建立索引: {session_id}")
+        return self.query(vector, k, users, exclude=[session_id])
+
+    def remove(self, session_ids: Iterable[str]) -> int:
+        """
+        删除会话（重写向量矩阵和条目文件）
+
+        Args:
+            session_ids: 记录文件名或路径
+
+        Returns:
+            删除的行数
+        """
+        targets = {os.path.basename(session_id) for session_id in session_ids}
+        with self._lock:
+            rows = self._refresh()
+            keep = [row for row, entry in enumerate(self._entries[:rows]) if entry['id'] not in targets]
+            if len(keep) == rows:
+                return 0
+            vectors = np.array(self._matrix[keep])
+            entries = [self._entries[row] for row in keep]
+            self._matrix = self._norms = None  # 释放内存映射后才能替换文件
+            with open(self.vectors_path + '.tmp', 'wb') as f:
+                f.write(vectors.tobytes())
+            with open(self.ids_path + '.tmp', 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(self.vectors_path + '.tmp', self.vectors_path)
+            os.replace(self.ids_path + '.tmp', self.ids_path)
+            self._reset_entries()
+        logger.info(f"已从会话索引删除 {rows - len(keep)} 个会话")
+        return rows - len(keep)
+
+    def rebuild(self, roots: Iterable[str], workers: Optional[int] = None) -> int:
+        """
+        使用进程池从原始记录重建索引（写入临时文件后替换）
+
+        Returns:
+            索引的会话数
+        """
+        paths = [p for root in roots for p in iter_recording_files(root) if os.path.basename(p).startswith('record_')]
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(index_file, path) for path in paths]
+            for future in as_completed(futures):
+                result = future.result()
+                if result is not None:
+                    results.append(result)
+        results.sort(key=lambda item: item[0]['start_time'] or '')
+
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.vectors_path + '.tmp', 'wb') as f:
+                for _, vector in results:
+                    f.write(vector.tobytes())
+            with open(self.ids_path + '.tmp', 'w', encoding='utf-8') as f:
+                for entry, _ in results:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'dim': FEATURE_DIM}, f)
+            self._matrix = self._norms = None
+            os.replace(self.vectors_path + '.tmp', self.vectors_path)
+            os.replace(self.ids_path + '.tmp', self.ids_path)
+            self._reset_entries()
+        logger.info(f"已重建会话索引: {len(results)}/{len(paths)} 个会话")
+        return len(results)
+
+def index_file(path: str) -> Optional[Tuple[Dict[str, Any], np.ndarray]]:
+    """
+    计算单个记录文件的条目和向量（在工作进程中执行）
+
+    Returns:
+        (条目, 向量)，失败返回 None
+    """
+    try:
+        columns = load_columns(path)
+        return _entry(path, columns.get('username'), columns), feature_vector(columns)
+    except Exception as e:
+        logger.error(f"索引文件 {path} 时发生错误: {str(e)}")
+        return None
+
+# 创建全局会话索引实例
+session_index = SessionIndex()
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='相似会话检索')
+    parser.add_argument('--rebuild', nargs='+', metavar='DIR', help='从记录目录重建索引')
+    parser.add_argument('--query', metavar='FILE', help='查找与该记录最相似的会话')
+    parser.add_argument('-k', type=int, default=10, help='返回数量')
+    parser.add_argument('--user', action='append', default=None, help='只在指定用户的会话中查找')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数')
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"已索引 {session_index.rebuild(args.rebuild, args.workers)} 个会话")
+    if args.query:
+        if session_index.vector(args.query) is not None:
+            results = session_index.similar_to(args.query, args.k, args.user)
+        elif os.path.exists(args.query):
+            results = session_index.query(feature_vector(load_columns(args.query)), args.k, args.user, [args.query])
+        else:
+            print(f"记录文件不存在: {args.query}")
+            sys.exit(1)
+        for distance, entry in results:
+            print(f"{distance:>8.3f}  {entry['start_time'] or '-':<20} {entry['username'] or '-':<12} {entry['path']}")
@@ -3,9 +3,9 @@ import subprocess
 import win32api
 import win32con
 import win32security
-import time
 from mouse_recorder import update_recording_info
 from mouse_controller import mouse_controller
+from readiness import wait_until
 
 def get_current_username():
     """获取当前登录用户名"""
@@ -42,9 +42,5 @@ def start_session():
     # 初始状态禁用鼠标
     mouse_controller.disable()
     
-    # 等待用户登录
-    while True:
-        username = handle_login()
-        if username:
-            break
-        time.sleep(1) 
\ No newline at end of file
+    # 等待用户登录，登录成功后立即返回
+    return wait_until(handle_login, timeout=None, max_interval=1.0, description="用户登录") 
\ No newline at end of file
@@ -0,0 +1,320 @@
+"""
+轨迹相似度模块
+把记录或镜像中的轨迹重采样到统一频率，使用 Sakoe-Chiba 带约束的 DTW 比较两条轨迹，
+DTW 按反对角线向量化计算；一对多比较时先用 LB_Keogh 下界剪枝，再在进程池中计算剩余候选
+"""
+
+import os
+import sys
+import csv
+import heapq
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from record_loader import load_columns, iter_recording_files, IDLE
+from aead_container import Decryptor
+from log_config import get_logger, setup_logging
+
+logger = get_logger('similarity')
+
+DEFAULT_RATE = 10.0  # 重采样频率(Hz)
+MAX_POINTS = 400  # 单条轨迹的最大点数，超过时按时间均匀压缩
+MAX_GAP = 1.0  # 重采样前把超过该秒数的停顿压缩为该值，避免空闲时段主导比较
+DEFAULT_WINDOW = 0.1  # Sakoe-Chiba 带宽占较长序列长度的比例
+CHUNK_SIZE = 32  # 每个工作进程任务包含的参考文件数
+
+def resample(columns: Dict[str, Any], rate: float = DEFAULT_RATE, max_points: int = MAX_POINTS,
+             max_gap: float = MAX_GAP) -> np.ndarray:
+    """
+    把列式数据重采样为等时间间隔的轨迹
+
+    Args:
+        columns: record_loader.to_columns 返回的列式数据
+        rate: 重采样频率(Hz)
+        max_points: 最大点数
+        max_gap: 停顿压缩阈值(秒)
+
+    Returns:
+        (n, 2) float64 坐标数组
+    """
+    keep = columns['code'] != IDLE
+    t, x, y = columns['t'][keep], columns['x'][keep], columns['y'][keep]
+    if not t.size:
+        return np.empty((0, 2))
+    # 压缩长停顿并保证时间单调
+    dt = np.minimum(np.maximum(np.diff(t), 0.0), max_gap)
+    t = np.concatenate(([0.0], np.cumsum(dt)))
+    count = int(min(max(np.floor(t[-1] * rate) + 1, 1), max_points))
+    grid = np.linspace(0.0, t[-1], count)
+    return np.column_stack((np.interp(grid, t, x), np.interp(grid, t, y)))
+
+def load_trajectory(path: str, password: Optional[str] = None, rate: float = DEFAULT_RATE,
+                    max_points: int = MAX_POINTS) -> np.ndarray:
+    """
+    加载记录或镜像文件并重采样
+
+    Args:
+        path: 记录文件或镜像文件（.enc.gz 需要密码）
+        password: 加密镜像的密码
+        rate: 重采样频率(Hz)
+        max_points: 最大点数
+    """
+    decrypt = Decryptor(password) if password else None
+    return resample(load_columns(path, decrypt), rate, max_points)
+
+def _band(n: int, m: int, window: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    计算带约束：第 i 行允许的列区间为 [center[i] - radius, center[i] + radius]（裁剪到有效范围）
+    中心沿对角线按长度比例缩放，半径至少覆盖斜率，保证存在连续路径
+
+    Returns:
+        (center, lo, hi, radius)
+    """
+    slope = (m - 1) / (n - 1) if n > 1 else 0.0
+    radius = max(int(np.ceil(window * max(n, m))), int(np.ceil(slope)), 1)
+    if n == 1:
+        radius = m
+    center = np.rint(np.arange(n) * slope).astype(np.int64)
+    lo = np.maximum(center - radius, 0)
+    hi = np.minimum(center + radius, m - 1)
+    return center, lo, hi, radius
+
+def lower_bound(query: np.ndarray, reference: np.ndarray, window: float = DEFAULT_WINDOW) -> float:
+    """
+    LB_Keogh 下界：查询轨迹每个点到参考轨迹带内包络框的距离之和
+    带约束下每个查询点至少匹配一个带内参考点，因此不大于 DTW 距离
+
+    Returns:
+        按 (n + m) 归一化的下界
+    """
+    n, m = len(query), len(reference)
+    if not n or not m:
+        return np.inf
+    center, _, _, radius = _band(n, m, window)
+    width = 2 * radius + 1
+    windows = []
+    for axis in range(2):
+        column = reference[:, axis]
+        low = np.pad(column, radius, constant_values=np.inf)
+        high = np.pad(column, radius, constant_values=-np.inf)
+        view_low = np.lib.stride_tricks.sliding_window_view(low, width)[center]
+        view_high = np.lib.stride_tricks.sliding_window_view(high, width)[center]
+        windows.append((view_low.min(axis=1), view_high.max(axis=1)))
+    (x_low, x_high), (y_low, y_high) = windows
+    dx = np.maximum(np.maximum(x_low - query[:, 0], query[:, 0] - x_high), 0.0)
+    dy = np.maximum(np.maximum(y_low - query[:, 1], query[:, 1] - y_high), 0.0)
+    return float(np.hypot(dx, dy).sum() / (n + m))
+
+def dtw_distance(query: np.ndarray, reference: np.ndarray, window: float = DEFAULT_WINDOW,
+                 max_distance: float = np.inf) -> float:
+    """
+    带约束 DTW 距离（局部代价为欧氏距离）
+    按反对角线 k = i + j 推进，每条反对角线上的格子只依赖前两条，整条一次向量化计算；
+    相邻两条反对角线的最小值都超过阈值时提前放弃（任何路径必经其中之一）
+
+    Args:
+        query: (n, 2) 查询轨迹
+        reference: (m, 2) 参考轨迹
+        window: 带宽比例
+        max_distance: 归一化距离阈值，超过时返回 inf
+
+    Returns:
+        按 (n + m) 归一化的 DTW 距离
+    """
+    n, m = len(query), len(reference)
+    if not n or not m:
+        return np.inf
+    _, lo, hi, _ = _band(n, m, window)
+    rows = np.arange(n)
+    # 反对角线 k 上的有效行区间 [first[k], last[k]]（lo/hi 单调，区间连续）
+    diagonals = np.arange(n + m - 1)
+    first = np.searchsorted(rows + hi, diagonals, side='left')
+    last = np.searchsorted(rows + lo, diagonals, side='right') - 1
+    limit = max_distance * (n + m)
+    qx, qy = query[:, 0], query[:, 1]
+    rx, ry = reference[:, 0], reference[:, 1]
+
+    # 缓冲区下标为 行号 + 1，下标 0 恒为 inf，表示不存在的上一行
+    previous2 = np.full(n + 1, np.inf)
+    previous = np.full(n + 1, np.inf)
+    previous[1] = np.hypot(qx[0] - rx[0], qy[0] - ry[0])
+    previous_min = previous[1]
+    for k in range(1, n + m - 1):
+        i0, i1 = int(first[k]), int(last[k])
+        current = np.full(n + 1, np.inf)
+        if i0 <= i1:
+            # j = k - i 在该区间内连续递减
+            j = slice(k - i1, k - i0 + 1)
+            cost = np.hypot(qx[i0:i1 + 1] - rx[j][::-1], qy[i0:i1 + 1] - ry[j][::-1])
+            best = np.minimum(previous[i0:i1 + 1], previous[i0 + 1:i1 + 2])
+            np.minimum(best, previous2[i0:i1 + 1], out=best)
+            np.add(cost, best, out=current[i0 + 1:i1 + 2])
+            current_min = float(current[i0 + 1:i1 + 2].min())
+        else:
+            current_min = np.inf
+        if current_min > limit and previous_min > limit:
+            return np.inf
+        previous2, previous, previous_min = previous, current, current_min
+    total = previous[n]
+    return float(total / (n + m)) if total <= limit else np.inf
+
+def compare(query: np.ndarray, reference: np.ndarray, window: float = DEFAULT_WINDOW) -> Dict[str, float]:
+    """比较两条轨迹，返回下界和 DTW 距离"""
+    return {
+        'lower_bound': lower_bound(query, reference, window),
+        'distance': dtw_distance(query, reference, window)
+    }
+
+def compare_chunk(query: np.ndarray, paths: List[str], options: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    在工作进程中比较一组参考文件
+    先计算全部下界，按下界从小到大计算 DTW；需要前 top 个结果时，以当前第 top 小的距离作为剪枝阈值
+
+    Args:
+        query: 已重采样的查询轨迹
+        paths: 参考文件列表
+        options: rate / max_points / window / password / top / max_distance
+
+    Returns:
+        结果行列表
+    """
+    window = options['window']
+    top = options.get('top')
+    threshold = options.get('max_distance') or np.inf
+    rows = []
+    candidates = []
+    for path in paths:
+        row = {'file': path, 'points': 0, 'lower_bound': None, 'distance': None, 'pruned': False}
+        rows.append(row)
+        try:
+            reference = load_trajectory(path, options.get('password'), options['rate'], options['max_points'])
+            row['points'] = len(reference)
+            row['lower_bound'] = lower_bound(query, reference, window)
+            candidates.append((row, reference))
+        except Exception as e:
+            logger.error(f"加载参考文件 {path} 时发生错误: {str(e)}")
+
+    best: List[float] = []  # 最大堆（取负），保存当前最小的 top 个距离
+    candidates.sort(key=lambda item: item[0]['lower_bound'])
+    for row, reference in candidates:
+        if row['lower_bound'] > threshold:
+            row['pruned'] = True
+            continue
+        distance = dtw_distance(query, reference, window, threshold)
+        if np.isinf(distance):
+            row['pruned'] = True
+            continue
+        row['distance'] = distance
+        if top:
+            heapq.heappush(best, -distance)
+            if len(best) > top:
+                heapq.heappop(best)
+            if len(best) == top:
+                threshold = min(threshold, -best[0])
+    return rows
+
+def compare_many(
+    query_path: str,
+    reference_paths: Iterable[str],
+    top: Optional[int] = None,
+    window: float = DEFAULT_WINDOW,
+    rate: float = DEFAULT_RATE,
+    max_points: int = MAX_POINTS,
+    max_distance: Optional[float] = None,
+    password: Optional[str] = None,
+    workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    一对多比较：查询文件与每个参考文件的 DTW 距离
+
+    Args:
+        query_path: 查询文件（例如操作员的记录）
+        reference_paths: 参考文件（例如标准流程镜像）
+        top: 只需要最相似的前 top 个时传入，用于剪枝
+        window: 带宽比例
+        rate: 重采样频率(Hz)
+        max_points: 单条轨迹最大点数
+        max_distance: 归一化距离阈值，超过的参考只给出下界
+        password: 加密镜像的密码
+        workers: 工作进程数，默认为CPU核数
+
+    Returns:
+        结果行列表，按距离升序（被剪枝的排在最后）
+    """
+    query = load_trajectory(query_path, password, rate, max_points)
+    if not len(query):
+        raise ValueError(f"查询文件没有可比较的轨迹: {query_path}")
+    paths = list(reference_paths)
+    options = {
+        'window': window, 'rate': rate, 'max_points': max_points,
+        'top': top, 'max_distance': max_distance, 'password': password
+    }
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(compare_chunk, query, paths[start:start + CHUNK_SIZE], options)
+            for start in range(0, len(paths), CHUNK_SIZE)
+        ]
+        for future in as_completed(futures):
+            rows.extend(future.result())
+
+    rows.sort(key=lambda row: (
+        row['distance'] is None, row['distance'] if row['distance'] is not None else 0.0,
+        row['lower_bound'] if row['lower_bound'] is not None else np.inf
+    ))
+    if top:
+        for row in rows[top:]:
+            if row['distance'] is not None:
+                row['distance'] = None
+                row['pruned'] = True
+    pruned = sum(1 for row in rows if row['pruned'])
+    logger.info(f"已比较 {query_path} 与 {len(paths)} 个参考文件，剪枝 {pruned} 个")
+    return rows
+
+def collect_paths(targets: Iterable[str]) -> List[str]:
+    """展开文件和目录参数"""
+    paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            paths.extend(iter_recording_files(target))
+        else:
+            paths.append(target)
+    return paths
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='轨迹相似度比较（带约束 DTW）')
+    parser.add_argument('query', help='查询文件（记录或镜像）')
+    parser.add_argument('references', nargs='+', help='参考文件或目录')
+    parser.add_argument('--top', type=int, default=None, help='只输出最相似的前 N 个')
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW, help='Sakoe-Chiba 带宽比例')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='重采样频率(Hz)')
+    parser.add_argument('--max-points', type=int, default=MAX_POINTS, help='单条轨迹最大点数')
+    parser.add_argument('--max-distance', type=float, default=None, help='归一化距离阈值(像素)')
+    parser.add_argument('--password', default=None, help='加密镜像的密码')
+    parser.add_argument('-o', '--output', default=None, help='输出CSV文件')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.query):
+        print(f"查询文件不存在: {args.query}")
+        sys.exit(1)
+    references = [path for path in collect_paths(args.references) if path != args.query]
+    results = compare_many(
+        args.query, references, args.top, args.window, args.rate,
+        args.max_points, args.max_distance, args.password, args.workers
+    )
+
+    shown = results[:args.top] if args.top else results
+    for row in shown:
+        distance = f"{row['distance']:.1f}" if row['distance'] is not None else '-'
+        bound = f"{row['lower_bound']:.1f}" if row['lower_bound'] is not None else '-'
+        print(f"{distance:>10} {bound:>10}  {row['file']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['file', 'points', 'lower_bound', 'distance', 'pruned'],
+                                    extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(results)
+        print(f"已写出 {len(results)} 行结果到: {args.output}")
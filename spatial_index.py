@@ -0,0 +1,332 @@
+"""
+时空索引模块
+保存记录时按 用户/日期/小时 分区，把事件按屏幕瓦片和时间排序后追加到分区的事件文件，
+同时追加瓦片目录（瓦片坐标、起始行、行数、时间范围、来源）。查询矩形区域和时间窗口时
+只读取相交分区的瓦片目录，再以内存映射方式读取命中瓦片对应的事件行，无需解码原始记录，
+代价与结果规模成正比而不是与归档大小成正比
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import threading
+import numpy as np
+from datetime import date, datetime, time, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from record_loader import load_columns, iter_recording_files, EVENT_CODES, IDLE, PRESS
+from log_config import get_logger, setup_logging
+
+logger = get_logger('spatial_index')
+
+SPATIAL_DIR = 'mouse_spatial'
+TILE_SIZE = 64  # 瓦片边长(像素)
+
+EVENT_DTYPE = np.dtype([('t', '<f8'), ('x', '<i4'), ('y', '<i4'), ('code', 'i1')])
+TILE_DTYPE = np.dtype([
+    ('tx', '<i4'), ('ty', '<i4'), ('start', '<i8'), ('count', '<i4'),
+    ('t0', '<f8'), ('t1', '<f8'), ('source', '<i4')
+])
+
+Rect = Tuple[int, int, int, int]
+
+class SpatialIndex:
+    """
+    按 用户/日期/小时 分区的瓦片索引
+    <用户>/<YYYY-MM-DD>/<HH>.events  事件行（每次追加的一批按瓦片、时间排序）
+    <用户>/<YYYY-MM-DD>/<HH>.tiles   瓦片目录，指向事件文件中的行区间
+    <用户>/sources.txt               来源列表，瓦片目录中的 source 为行号
+    先写事件再写目录，写入中断时目录中不会出现指向不存在事件的条目
+    """
+    def __init__(self, root: str = SPATIAL_DIR, tile_size: int = TILE_SIZE):
+        self.root = root
+        self.tile_size = tile_size
+        self._lock = threading.Lock()
+        self._sources: Dict[str, List[str]] = {}  # 用户 -> 来源列表缓存
+
+    def _partition(self, username: str, hour: datetime) -> str:
+        return os.path.join(self.root, username, hour.date().isoformat(), f'{hour.hour:02d}')
+
+    def _load_sources(self, username: str) -> List[str]:
+        sources = self._sources.get(username)
+        if sources is None:
+            try:
+                with open(os.path.join(self.root, username, 'sources.txt'), 'r', encoding='utf-8') as f:
+                    sources = f.read().splitlines()
+            except FileNotFoundError:
+                sources = []
+            self._sources[username] = sources
+        return sources
+
+    def _add_source(self, username: str, source: str) -> Optional[int]:
+        """登记来源，已登记过时返回 None"""
+        sources = self._load_sources(username)
+        if source in sources:
+            return None
+        os.makedirs(os.path.join(self.root, username), exist_ok=True)
+        with open(os.path.join(self.root, username, 'sources.txt'), 'a', encoding='utf-8') as f:
+            f.write(source + '\n')
+        sources.append(source)
+        return len(sources) - 1
+
+    def add(self, username: Optional[str], columns: Dict[str, Any], source: str) -> int:
+        """
+        把一次会话的事件加入索引（同一来源只加入一次）
+
+        Args:
+            username: 用户名
+            columns: record_loader.to_columns 返回的列式数据（需要 base_time）
+            source: 来源标识（记录或镜像文件名）
+
+        Returns:
+            加入的事件数
+        """
+        base_time = columns.get('base_time')
+        keep = columns['code'] != IDLE
+        if base_time is None or not keep.any():
+            return 0
+        username = username or 'unknown'
+        t = base_time + columns['t'][keep]
+        x = np.rint(columns['x'][keep]).astype(np.int32)
+        y = np.rint(columns['y'][keep]).astype(np.int32)
+        code = columns['code'][keep]
+
+        # 按本地时间的小时分区（与热力图相同，按首个事件所在日期的零点推算）
+        first_day = datetime.fromtimestamp(base_time).date()
+        midnight = datetime(first_day.year, first_day.month, first_day.day)
+        hour_index = ((t - midnight.timestamp()) // 3600).astype(np.int64)
+
+        with self._lock:
+            source_id = self._add_source(username, source)
+            if source_id is None:
+                logger.info(f"来源已在时空索引中: {source}")
+                return 0
+            for hour in np.unique(hour_index).tolist():
+                in_hour = hour_index == hour
+                self._append(
+                    self._partition(username, midnight + timedelta(hours=hour)),
+                    t[in_hour], x[in_hour], y[in_hour], code[in_hour], source_id
+                )
+        logger.info(f"已加入时空索引: {source}，{int(keep.sum())} 个事件")
+        return int(keep.sum())
+
+    def _append(self, partition: str, t, x, y, code, source_id: int) -> None:
+        """向分区追加一批事件及其瓦片目录"""
+        tx = np.floor_divide(x, self.tile_size)
+        ty = np.floor_divide(y, self.tile_size)
+        order = np.lexsort((t, ty, tx))
+        events = np.empty(order.size, dtype=EVENT_DTYPE)
+        events['t'], events['x'], events['y'], events['code'] = t[order], x[order], y[order], code[order]
+        tx, ty = tx[order], ty[order]
+
+        os.makedirs(os.path.dirname(partition), exist_ok=True)
+        events_path = partition + '.events'
+        first_row = self._rows(events_path, EVENT_DTYPE)
+        with open(events_path, 'r+b' if os.path.exists(events_path) else 'wb') as f:
+            f.truncate(first_row * EVENT_DTYPE.itemsize)  # 丢弃中断写入留下的半行
+            f.seek(0, os.SEEK_END)
+            f.write(events.tobytes())
+
+        starts = np.flatnonzero(np.concatenate(([True], (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1]))))
+        ends = np.append(starts[1:], order.size)
+        tiles = np.empty(starts.size, dtype=TILE_DTYPE)
+        tiles['tx'], tiles['ty'] = tx[starts], ty[starts]
+        tiles['start'] = first_row + starts
+        tiles['count'] = ends - starts
+        tiles['t0'] = np.minimum.reduceat(events['t'], starts)
+        tiles['t1'] = np.maximum.reduceat(events['t'], starts)
+        tiles['source'] = source_id
+        tiles_path = partition + '.tiles'
+        tile_rows = self._rows(tiles_path, TILE_DTYPE)
+        with open(tiles_path, 'r+b' if os.path.exists(tiles_path) else 'wb') as f:
+            f.truncate(tile_rows * TILE_DTYPE.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(tiles.tobytes())
+
+    @staticmethod
+    def _rows(path: str, dtype: np.dtype) -> int:
+        try:
+            return os.path.getsize(path) // dtype.itemsize
+        except OSError:
+            return 0
+
+    def remove_day(self, username: str, day: date) -> bool:
+        """删除某用户某天的全部分区（数据过期清理时调用）"""
+        day_dir = os.path.join(self.root, username, day.isoformat())
+        if not os.path.isdir(day_dir):
+            return False
+        with self._lock:
+            shutil.rmtree(day_dir, ignore_errors=True)
+        logger.info(f"已删除时空索引分区: {day_dir}")
+        return True
+
+    def users(self) -> List[str]:
+        """列出有索引数据的用户"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def query(
+        self,
+        rect: Optional[Rect] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        users: Optional[Iterable[str]] = None,
+        codes: Optional[Iterable[int]] = None,
+        daily: Optional[Tuple[time, time]] = None
+    ) -> Dict[str, Any]:
+        """
+        查询矩形区域和时间窗口内的事件
+
+        Args:
+            rect: 屏幕区域 (left, top, right, bottom)，单位像素，含边界；None 表示全屏
+            start: 开始时间(含)，None 表示不限（需遍历该用户的全部日期目录）
+            end: 结束时间(不含)，None 表示当前时间
+            users: 用户列表，默认全部用户
+            codes: 事件类型编码（record_loader 中的 MOVE/PRESS/...），默认全部
+            daily: 每天的时间段 (开始, 结束)，例如 (time(8), time(12))
+
+        Returns:
+            {'t': Unix 时间, 'x', 'y', 'code', 'user': 用户名, 'source': 来源}，按时间排序
+        """
+        end = end or datetime.now()
+        start_ts, end_ts = (start.timestamp() if start else -np.inf), end.timestamp()
+        codes = np.asarray(list(codes), dtype=np.int8) if codes is not None else None
+        if daily is not None:
+            low = daily[0].hour * 3600 + daily[0].minute * 60 + daily[0].second
+            high = daily[1].hour * 3600 + daily[1].minute * 60 + daily[1].second
+        parts = []
+        for username in (users or self.users()):
+            self._sources.pop(username, None)  # 来源列表可能被其他进程追加，每次查询重新读取
+            sources = np.asarray(self._load_sources(username) + [None], dtype=object)
+            for hour, partition in self._partitions(username, start, end, daily):
+                tiles = np.fromfile(partition + '.tiles', dtype=TILE_DTYPE)
+                hit = (tiles['t1'] >= start_ts) & (tiles['t0'] < end_ts)
+                if rect is not None:
+                    left, top, right, bottom = rect
+                    hit &= (
+                        (tiles['tx'] >= left // self.tile_size) & (tiles['tx'] <= right // self.tile_size)
+                        & (tiles['ty'] >= top // self.tile_size) & (tiles['ty'] <= bottom // self.tile_size)
+                    )
+                tiles = tiles[hit]
+                if not tiles.size:
+                    continue
+
+                # 把命中瓦片的行区间展开为行号，一次读取
+                counts = tiles['count'].astype(np.int64)
+                firsts = tiles['start'] - np.cumsum(counts) + counts
+                row_index = np.repeat(firsts, counts) + np.arange(int(counts.sum()))
+                events = np.memmap(partition + '.events', dtype=EVENT_DTYPE, mode='r')
+                rows = np.array(events[row_index])
+                del events
+                source_ids = np.minimum(np.repeat(tiles['source'], counts), len(sources) - 1)
+
+                mask = (rows['t'] >= start_ts) & (rows['t'] < end_ts)
+                if rect is not None:
+                    mask &= (rows['x'] >= left) & (rows['x'] <= right) & (rows['y'] >= top) & (rows['y'] <= bottom)
+                if codes is not None:
+                    mask &= np.isin(rows['code'], codes)
+                if daily is not None:
+                    midnight = hour.replace(hour=0).timestamp()
+                    seconds = rows['t'] - midnight
+                    mask &= (seconds >= low) & (seconds < high)
+                if mask.any():
+                    parts.append((rows[mask], username, sources[source_ids[mask]]))
+
+        if not parts:
+            return {
+                't': np.empty(0), 'x': np.empty(0, np.int32), 'y': np.empty(0, np.int32),
+                'code': np.empty(0, np.int8), 'user': np.empty(0, object), 'source': np.empty(0, object)
+            }
+        rows = np.concatenate([rows for rows, _, _ in parts])
+        user = np.concatenate([np.full(r.size, u, dtype=object) for r, u, _ in parts])
+        source = np.concatenate([s for _, _, s in parts])
+        order = np.argsort(rows['t'], kind='stable')
+        rows = rows[order]
+        return {
+            't': rows['t'], 'x': rows['x'], 'y': rows['y'], 'code': rows['code'],
+            'user': user[order], 'source': source[order]
+        }
+
+    def _partitions(self, username: str, start: Optional[datetime], end: datetime,
+                    daily: Optional[Tuple[time, time]]) -> Iterable[str]:
+        """列出与时间窗口相交的分区（跳过不在每日时间段内的小时）"""
+        user_dir = os.path.join(self.root, username)
+        if start is None:
+            try:
+                days = sorted(date.fromisoformat(name) for name in os.listdir(user_dir) if len(name) == 10)
+            except (OSError, ValueError):
+                return
+            if not days:
+                return
+            hour = datetime(days[0].year, days[0].month, days[0].day)
+        else:
+            hour = start.replace(minute=0, second=0, microsecond=0)
+        while hour < end:
+            if daily is None or daily[0].hour <= hour.hour <= daily[1].hour:
+                partition = self._partition(username, hour)
+                if os.path.exists(partition + '.tiles'):
+                    yield hour, partition
+            hour += timedelta(hours=1)
+
+# 创建全局时空索引实例
+spatial_index = SpatialIndex()
+
+def _load_for_index(path: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """读取文件的列式数据（在工作进程中执行）"""
+    try:
+        return path, load_columns(path)
+    except Exception as e:
+        logger.error(f"读取文件 {path} 时发生错误: {str(e)}")
+        return None
+
+def build(roots: Iterable[str], index: SpatialIndex = spatial_index, workers: Optional[int] = None) -> int:
+    """
+    为已有记录补建索引（进程池解码，主进程写入；加密镜像跳过，已登记的来源跳过）
+
+    Returns:
+        加入的事件数
+    """
+    paths = [p for root in roots for p in iter_recording_files(root) if not p.endswith('.enc.gz')]
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(_load_for_index, paths):
+            if result is not None:
+                path, columns = result
+                total += index.add(columns.get('username'), columns, os.path.basename(path))
+    return total
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description='按屏幕区域和时间窗口查询事件')
+    parser.add_argument('--build', nargs='+', metavar='DIR', help='为已有记录目录补建索引')
+    parser.add_argument('--rect', default=None, help='屏幕区域 left,top,right,bottom')
+    parser.add_argument('--since', type=_parse_time, default=None, help='开始时间，例如 2024-05-06T08:00')
+    parser.add_argument('--until', type=_parse_time, default=None, help='结束时间')
+    parser.add_argument('--daily', default=None, help='每天的时间段，例如 08:00-12:00')
+    parser.add_argument('--user', action='append', default=None, help='用户名，可重复')
+    parser.add_argument('--type', action='append', default=None, choices=sorted(EVENT_CODES), help='事件类型，可重复')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数')
+    args = parser.parse_args()
+
+    if args.build:
+        print(f"已加入 {build(args.build, workers=args.workers)} 个事件")
+    if args.rect or args.since or args.until or args.daily or args.type:
+        rect = tuple(int(value) for value in args.rect.split(',')) if args.rect else None
+        if rect is not None and len(rect) != 4:
+            print("区域格式应为 left,top,right,bottom")
+            sys.exit(1)
+        daily = None
+        if args.daily:
+            low, high = args.daily.split('-')
+            daily = (time.fromisoformat(low), time.fromisoformat(high))
+        codes = [EVENT_CODES[name] for name in args.type] if args.type else [PRESS]
+        result = spatial_index.query(rect, args.since, args.until, args.user, codes, daily)
+        for t, x, y, user, source in zip(result['t'].tolist(), result['x'].tolist(), result['y'].tolist(),
+                                         result['user'].tolist(), result['source'].tolist()):
+            print(f"{datetime.fromtimestamp(t).isoformat(timespec='milliseconds')}  ({x},{y})  {user}  {source}")
+        print(f"共 {result['t'].size} 个事件")
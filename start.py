@@ -3,6 +3,10 @@
 处理管理员权限提升并启动主程序
 """
 
+import time
+_IMPORT_START = time.perf_counter()
+
+from startup_profiler import startup_profiler
 import sys
 import os
 import win32api
@@ -10,11 +14,16 @@ import win32con
 import win32security
 import win32event
 import winerror
-import logging
-from datetime import datetime
 import ctypes
 from notice import find_easyfas_shell
 from typing import Optional
+from log_config import setup_logging as init_logging, get_logger
+from profiler import install_triggers
+
+logger = get_logger('startup')
+
+# 记录模块导入耗时
+startup_profiler.record_phase('imports', time.perf_counter() - _IMPORT_START, _IMPORT_START)
 
 # 定义互斥体名称（使用唯一的名称）
 MUTEX_NAME = "Global\\MouseRecorderSingleInstance"
@@ -25,15 +34,7 @@ class SingleInstanceException(Exception):
 
 def setup_logging():
     """配置日志系统"""
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-    
-    log_file = os.path.join('logs', f'startup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.INFO,
-        format='%(asctime)s: %(message)s'
-    )
+    init_logging()
 
 def ensure_single_instance():
     """
@@ -50,7 +51,7 @@ def ensure_single_instance():
             raise SingleInstanceException("程序已经在运行中")
         return handle
     except Exception as e:
-        logging.error(f"检查程序实例时发生错误: {str(e)}")
+        logger.error(f"检查程序实例时发生错误: {str(e)}")
         raise
 
 def cleanup_mutex(handle):
@@ -59,7 +60,7 @@ def cleanup_mutex(handle):
         if handle:
             win32api.CloseHandle(handle)
     except Exception as e:
-        logging.error(f"清理互斥体时发生错误: {str(e)}")
+        logger.error(f"清理互斥体时发生错误: {str(e)}")
 
 def is_admin():
     """
@@ -89,7 +90,7 @@ def is_admin():
         return False
         
     except Exception as e:
-        logging.error(f"权限检查时发生错误: {str(e)}")
+        logger.error(f"权限检查时发生错误: {str(e)}")
         return False
 
 def request_admin_privileges():
@@ -98,7 +99,7 @@ def request_admin_privileges():
     返回是否成功获取权限
     """
     try:
-        logging.info("正在请求管理员权限...")
+        logger.info("正在请求管理员权限...")
         
         # 获取当前脚本的完整路径
         script = os.path.abspath(sys.argv[0])
@@ -120,7 +121,7 @@ def request_admin_privileges():
         return True
         
     except Exception as e:
-        logging.error(f"请求管理员权限时发生错误: {str(e)}")
+        logger.error(f"请求管理员权限时发生错误: {str(e)}")
         print(f"错误: {str(e)}")
         return False
 
@@ -131,18 +132,18 @@ def ensure_admin_privileges():
     """
     # 首先检查当前权限
     if is_admin():
-        logging.info("当前已具有管理员权限")
+        logger.info("当前已具有管理员权限")
         return True
     
-    logging.info("当前不具有管理员权限，尝试提升...")
+    logger.info("当前不具有管理员权限，尝试提升...")
     print("需要管理员权限才能运行此程序...")
     
     # 请求提升权限
     if request_admin_privileges():
-        logging.info("权限提升请求已发送")
+        logger.info("权限提升请求已发送")
         return False  # 返回 False 表示当前实例应该退出
     else:
-        logging.error("无法获取管理员权限")
+        logger.error("无法获取管理员权限")
         print("错误：无法获取管理员权限，程序将退出")
         return False
 
@@ -153,19 +154,22 @@ def start_application() -> bool:
     """
     try:
         # 第一步：启动智造协同平台
-        logging.info("第一步：正在启动智造协同平台...")
-        if not find_easyfas_shell():
-            logging.error("智造协同平台启动失败，程序终止")
+        logger.info("第一步：正在启动智造协同平台...")
+        with startup_profiler.phase('find_easyfas_shell'):
+            launched = find_easyfas_shell()
+        if not launched:
+            logger.error("智造协同平台启动失败，程序终止")
             return False
         
-        # 第二步：启动主程序
-        logging.info("第二步：正在启动主程序...")
-        from main import main
+        # 第二步：启动主程序（main 内部记录等待与监听器启动阶段）
+        logger.info("第二步：正在启动主程序...")
+        with startup_profiler.phase('import_main'):
+            from main import main
         main()
         return True
         
     except Exception as e:
-        logging.error(f"启动程序时发生错误: {str(e)}")
+        logger.error(f"启动程序时发生错误: {str(e)}")
         print(f"启动失败: {str(e)}")
         return False
 
@@ -174,36 +178,45 @@ def main():
     mutex_handle = None
     try:
         # 设置日志
-        setup_logging()
-        logging.info("程序启动...")
+        with startup_profiler.phase('setup_logging'):
+            setup_logging()
+        logger.info("程序启动...")
+        
+        # 安装采样分析的信号与标志文件触发
+        install_triggers()
         
         # 确保单实例运行
         try:
-            mutex_handle = ensure_single_instance()
-            logging.info("单实例检查通过")
+            with startup_profiler.phase('mutex_check'):
+                mutex_handle = ensure_single_instance()
+            logger.info("单实例检查通过")
         except SingleInstanceException as e:
-            logging.warning(f"程序已在运行: {str(e)}")
+            logger.warning(f"程序已在运行: {str(e)}")
             print("错误：程序已经在运行中")
             sys.exit(0)
         
         # 检查并确保管理员权限
-        if not ensure_admin_privileges():
-            logging.info("等待权限提升或程序退出...")
+        with startup_profiler.phase('admin_check'):
+            has_admin = ensure_admin_privileges()
+        if not has_admin:
+            logger.info("等待权限提升或程序退出...")
             sys.exit(0)
         
         # 启动应用程序（按顺序执行）
         if not start_application():
-            logging.error("程序启动失败")
+            logger.error("程序启动失败")
             sys.exit(1)
         
     except Exception as e:
-        logging.error(f"程序运行时发生错误: {str(e)}")
+        logger.error(f"程序运行时发生错误: {str(e)}")
         print(f"程序错误: {str(e)}")
         sys.exit(1)
     finally:
         # 清理互斥体
         if mutex_handle:
             cleanup_mutex(mutex_handle)
+        # 写出启动报告
+        startup_profiler.write_report()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+启动阶段性能分析模块
+使用单调时钟记录启动流程各阶段耗时，生成结构化启动报告，并支持跨机器汇总分析
+"""
+
+import os
+import sys
+import json
+import glob
+import math
+import time
+import socket
+import threading
+import statistics
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+from log_config import get_logger, setup_logging, is_configured
+
+logger = get_logger('startup')
+
+REPORT_DIR = 'logs'
+REPORT_PATTERN = 'startup_report_*.json'
+
+class StartupProfiler:
+    """启动阶段计时器"""
+    def __init__(self):
+        self.origin = time.perf_counter()  # 计时起点（模块导入时刻）
+        self.started_at = datetime.now()
+        self.phases: List[Dict[str, Any]] = []  # 各阶段耗时
+        self.marks: Dict[str, float] = {}  # 关键时间点（相对起点的秒数）
+        self.report_file: Optional[str] = None
+        self._first_event_seen = False
+        self._pending_logs: List[str] = []  # 日志系统初始化前记录的阶段，初始化后补写
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 首个事件的后台线程和退出时都会写报告
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        记录一个阶段的耗时
+
+        Args:
+            name: 阶段名称
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - start, start)
+
+    def record_phase(self, name: str, duration: float, start: Optional[float] = None) -> None:
+        """
+        直接记录阶段耗时
+
+        Args:
+            name: 阶段名称
+            duration: 耗时(秒)
+            start: 阶段开始的 perf_counter 值
+        """
+        if start is None:
+            start = time.perf_counter() - duration
+        message = f"启动阶段 [{name}] 耗时 {duration:.3f}秒"
+        with self._lock:
+            self.phases.append({
+                'name': name,
+                'offset': round(start - self.origin, 6),
+                'duration': round(duration, 6)
+            })
+            # 日志系统尚未初始化时不写日志，以免在入口配置日志前产生处理器
+            if not is_configured():
+                self._pending_logs.append(message)
+                return
+            pending, self._pending_logs = self._pending_logs, []
+        for line in pending + [message]:
+            logger.info(line)
+
+    def mark(self, name: str) -> None:
+        """记录关键时间点，同名时间点只记录第一次"""
+        with self._lock:
+            if name not in self.marks:
+                self.marks[name] = round(time.perf_counter() - self.origin, 6)
+
+    def mark_first_event(self) -> None:
+        """记录首个鼠标事件到达时间，并在后台线程写出报告"""
+        if self._first_event_seen:
+            return
+        self._first_event_seen = True
+        self.mark('first_event')
+        threading.Thread(target=self.write_report, daemon=True).start()
+
+    def build_report(self) -> Dict[str, Any]:
+        """生成启动报告"""
+        with self._lock:
+            return {
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'python': sys.version.split()[0],
+                'started_at': self.started_at.isoformat(),
+                'elapsed': round(time.perf_counter() - self.origin, 6),
+                'phases': list(self.phases),
+                'marks': dict(self.marks),
+                'time_to_first_event': self.marks.get('first_event')
+            }
+
+    def write_report(self) -> Optional[str]:
+        """写出启动报告，多次调用覆盖同一文件（串行执行，后写入的报告包含更多阶段）"""
+        try:
+            with self._write_lock:
+                os.makedirs(REPORT_DIR, exist_ok=True)
+                if not self.report_file:
+                    stamp = self.started_at.strftime('%Y%m%d_%H%M%S')
+                    self.report_file = os.path.join(REPORT_DIR, f'startup_report_{stamp}_{os.getpid()}.json')
+
+                tmp_file = self.report_file + '.tmp'
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.build_report(), f, ensure_ascii=False, indent=2)
+                os.replace(tmp_file, self.report_file)
+                return self.report_file
+        except Exception as e:
+            logger.error(f"写出启动报告时发生错误: {str(e)}")
+            return None
+
+def _percentile(values: List[float], pct: float) -> float:
+    """计算百分位数（最近秩）"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize_reports(paths: List[str]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    汇总多份启动报告
+
+    Args:
+        paths: 报告文件路径列表（可来自多台机器）
+
+    Returns:
+        {主机名: {阶段名: {count, mean, p50, p90, max}}}
+    """
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        except Exception as e:
+            logger.warning(f"跳过无法读取的报告 {path}: {str(e)}")
+            continue
+
+        host_samples = samples.setdefault(report.get('host', 'unknown'), {})
+        for phase in report.get('phases', []):
+            host_samples.setdefault(phase['name'], []).append(phase['duration'])
+        if report.get('time_to_first_event') is not None:
+            host_samples.setdefault('time_to_first_event', []).append(report['time_to_first_event'])
+
+    summary = {}
+    for host, phases in samples.items():
+        summary[host] = {
+            name: {
+                'count': len(values),
+                'mean': round(statistics.fmean(values), 6),
+                'p50': round(_percentile(values, 50), 6),
+                'p90': round(_percentile(values, 90), 6),
+                'max': round(max(values), 6)
+            }
+            for name, values in phases.items()
+        }
+    return summary
+
+def print_summary(summary: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    """以表格形式打印汇总结果"""
+    for host in sorted(summary):
+        print(f"\n主机: {host}")
+        print(f"{'阶段':<24}{'次数':>6}{'平均':>10}{'P50':>10}{'P90':>10}{'最大':>10}")
+        for name, stats in sorted(summary[host].items(), key=lambda item: -item[1]['mean']):
+            print(
+                f"{name:<24}{stats['count']:>6}{stats['mean']:>10.3f}"
+                f"{stats['p50']:>10.3f}{stats['p90']:>10.3f}{stats['max']:>10.3f}"
+            )
+
+# 创建全局启动计时器实例
+startup_profiler = StartupProfiler()
+
+if __name__ == "__main__":
+    setup_logging()
+    # 用法: python startup_profiler.py [报告文件或目录...]
+    targets = sys.argv[1:] or [REPORT_DIR]
+    report_paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            report_paths.extend(glob.glob(os.path.join(target, '**', REPORT_PATTERN), recursive=True))
+        else:
+            report_paths.extend(glob.glob(target))
+
+    if not report_paths:
+        print("未找到启动报告")
+        sys.exit(1)
+
+    print_summary(summarize_reports(report_paths))
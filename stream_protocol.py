@@ -0,0 +1,115 @@
+"""
+事件流传输协议模块
+定义客户端与采集服务之间的帧格式，TCP 和 WebSocket 使用相同的帧编码
+
+帧格式: [头部长度 4字节][负载长度 4字节][JSON头部][负载]
+消息类型(头部 type 字段):
+    hello   客户端 -> 服务端  {client_id, username}
+    welcome 服务端 -> 客户端  {last_seq}  服务端已确认的最后批次号，用于断线续传
+    batch   客户端 -> 服务端  {seq, count}  负载为 gzip 压缩的 JSON 事件列表
+    upload  客户端 -> 服务端  {seq, filename, username, sha256}  负载为文件内容
+    ack     服务端 -> 客户端  {seq, status}
+"""
+
+import json
+import gzip
+import socket
+import struct
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+FRAME_HEADER = struct.Struct('>II')
+MAX_HEADER_SIZE = 64 * 1024  # 头部最大长度
+MAX_PAYLOAD_SIZE = 64 * 1024 * 1024  # 负载最大长度（单个镜像文件或事件批次）
+
+class ProtocolError(Exception):
+    """协议错误"""
+    pass
+
+def encode_frame(header: Dict[str, Any], payload: bytes = b'') -> bytes:
+    """编码一帧"""
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return FRAME_HEADER.pack(len(header_bytes), len(payload)) + header_bytes + payload
+
+def decode_frame(data: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """解码完整的一帧（WebSocket 消息）"""
+    if len(data) < FRAME_HEADER.size:
+        raise ProtocolError("帧长度不足")
+    header_size, payload_size = FRAME_HEADER.unpack_from(data)
+    _check_sizes(header_size, payload_size)
+    body = data[FRAME_HEADER.size:]
+    if len(body) != header_size + payload_size:
+        raise ProtocolError("帧长度不匹配")
+    return json.loads(body[:header_size].decode('utf-8')), body[header_size:]
+
+def _check_sizes(header_size: int, payload_size: int) -> None:
+    if header_size > MAX_HEADER_SIZE or payload_size > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"帧过大: 头部 {header_size} 字节, 负载 {payload_size} 字节")
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    """从套接字读取指定字节数"""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+def read_frame(sock: socket.socket) -> Tuple[Dict[str, Any], bytes]:
+    """从阻塞套接字读取一帧"""
+    header_size, payload_size = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    _check_sizes(header_size, payload_size)
+    header = json.loads(_recv_exact(sock, header_size).decode('utf-8'))
+    payload = _recv_exact(sock, payload_size) if payload_size else b''
+    return header, payload
+
+async def read_header_async(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], int]:
+    """
+    从 asyncio 流读取一帧的头部，负载留在流中
+
+    Returns:
+        (头部, 负载长度)，调用方随后读取 负载长度 字节
+    """
+    header_size, payload_size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    _check_sizes(header_size, payload_size)
+    header = json.loads((await reader.readexactly(header_size)).decode('utf-8'))
+    return header, payload_size
+
+async def read_frame_async(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+    """从 asyncio 流读取一帧"""
+    header, payload_size = await read_header_async(reader)
+    payload = await reader.readexactly(payload_size) if payload_size else b''
+    return header, payload
+
+def encode_batch(events: List[Dict[str, Any]], level: int = 6) -> bytes:
+    """压缩事件批次"""
+    return gzip.compress(
+        json.dumps(events, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        compresslevel=level
+    )
+
+def decode_batch(payload: bytes) -> List[Dict[str, Any]]:
+    """解压事件批次"""
+    return json.loads(gzip.decompress(payload).decode('utf-8'))
+
+def parse_endpoint(endpoint: str) -> Tuple[str, str, int, Optional[str]]:
+    """
+    解析端点地址
+
+    Args:
+        endpoint: tcp://host:port 或 ws(s)://host:port/path
+
+    Returns:
+        (协议, 主机, 端口, WebSocket 地址)
+    """
+    scheme, sep, rest = endpoint.partition('://')
+    if not sep or scheme not in ('tcp', 'ws', 'wss'):
+        raise ValueError(f"不支持的端点地址: {endpoint}")
+    hostport = rest.split('/', 1)[0]
+    host, _, port = hostport.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"端点地址缺少主机或端口: {endpoint}")
+    return scheme, host, int(port), endpoint if scheme != 'tcp' else None
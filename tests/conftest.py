@@ -0,0 +1,9 @@
+"""
+测试公共配置
+模块均位于仓库根目录，测试时把根目录加入导入路径
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
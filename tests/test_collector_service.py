@@ -0,0 +1,74 @@
+"""
+采集服务测试
+在本地端口上启动服务，验证路径片段清理、分区存储和镜像上传
+"""
+
+import os
+import gzip
+import json
+import asyncio
+import pytest
+from collector_service import CollectorService, _safe
+from event_streamer import upload_files
+from stream_protocol import encode_batch, encode_frame, read_frame_async
+
+def _files(root):
+    return sorted(
+        os.path.relpath(os.path.join(dirpath, name), root)
+        for dirpath, _, names in os.walk(root) for name in names
+    )
+
+async def _with_service(root, client):
+    service = CollectorService(str(root), workers=1)
+    server = await service.start('127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        return await client(port)
+    finally:
+        server.close()
+        await server.wait_closed()
+        service.close()
+
+async def _send_batch(port, client_id, username):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(encode_frame({'type': 'hello', 'client_id': client_id, 'username': username}))
+        await writer.drain()
+        await read_frame_async(reader)
+        events = [{'type': 'move', 'position': [1, 2], 'timestamp': 1700000000.0, 'params': {}}]
+        writer.write(encode_frame({'type': 'batch', 'seq': 1, 'count': 1, 'username': username}, encode_batch(events)))
+        await writer.drain()
+        ack, _ = await read_frame_async(reader)
+        return ack['status']
+    finally:
+        writer.close()
+
+@pytest.mark.parametrize('name', ['..', '.', '.hidden', '', None])
+def test_safe_rejects_dot_segments(name):
+    cleaned = _safe(name)
+    assert cleaned and not cleaned.startswith('.')
+    assert os.sep not in cleaned
+
+@pytest.mark.parametrize('client_id, username', [('c1', '..'), ('..', 'alice'), ('../../x', '../..')])
+def test_dot_dot_names_stay_inside_root(tmp_path, client_id, username):
+    root = tmp_path / 'data'
+    status = asyncio.run(_with_service(root, lambda port: _send_batch(port, client_id, username)))
+    assert status == 'ok'
+    assert set(os.listdir(tmp_path)) == {'data'}
+    stream_files = [path for path in _files(root) if path.endswith('.jsonl')]
+    assert len(stream_files) == 1
+    assert not any(part in ('.', '..') for part in stream_files[0].split(os.sep))
+
+def test_mirror_upload_is_partitioned_by_user_and_day(tmp_path):
+    mirror = tmp_path / 'mirror_alice_20260101_120000.gz'
+    mirror.write_bytes(gzip.compress(json.dumps({'username': 'alice', 'events': []}).encode('utf-8')))
+    root = tmp_path / 'data'
+
+    async def client(port):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, upload_files, f'tcp://127.0.0.1:{port}', [str(mirror)], 'alice', 'uploader'
+        )
+
+    assert asyncio.run(_with_service(root, client)) == [str(mirror)]
+    assert os.path.join('alice', '2026-01-01', mirror.name) in _files(root)
@@ -0,0 +1,34 @@
+import json
+
+from decode_pipeline import iter_json_events
+
+DOCUMENT = {
+    'username': 'alice',
+    'duration': 12.5,
+    'scale': -1.25e-3,
+    'events': [12.5, 2, {'type': 'move', 'position': [100, -20], 'timestamp': 0.125}, True, None],
+    'count': 1024
+}
+
+def _parse(chunks):
+    meta = {}
+    events = list(iter_json_events(chunks, meta))
+    return events, meta
+
+def test_every_chunk_boundary_parses_identically():
+    text = json.dumps(DOCUMENT)
+    expected_meta = {key: value for key, value in DOCUMENT.items() if key != 'events'}
+    for split in range(1, len(text)):
+        events, meta = _parse([text[:split], text[split:]])
+        assert events == json.loads(json.dumps(DOCUMENT['events'])), split
+        assert meta == expected_meta, split
+
+def test_number_split_after_decimal_point():
+    events, _ = _parse(['{"events": [12.', '5, 2]}'])
+    assert events == [12.5, 2]
+
+def test_single_character_chunks():
+    text = json.dumps(DOCUMENT)
+    events, meta = _parse(list(text))
+    assert meta['duration'] == 12.5
+    assert len(events) == 5
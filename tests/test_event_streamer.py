@@ -0,0 +1,88 @@
+"""
+事件流测试
+通过本地回环采集端验证批次确认、断线续传、去重和服务端处理失败后的重发
+"""
+
+import time
+import pytest
+from event_bus import CaptureEvent
+from event_streamer import EventStreamer, LoopbackCollector
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+def _publish(streamer, count, start=0):
+    for index in range(start, start + count):
+        streamer.accept(CaptureEvent('click_press', index, 0, 1000.0 + index, {'button': 'left'}))
+
+@pytest.fixture
+def collector():
+    collector = LoopbackCollector().start()
+    yield collector
+    collector.stop()
+
+def _streamer(collector, client_id='test-client'):
+    return EventStreamer(collector.endpoint, client_id=client_id, batch_size=10, flush_interval=0.05, timeout=2.0)
+
+def _positions(collector):
+    return [event['position'][0] for event in collector.events]
+
+def test_batches_delivered_in_order(collector):
+    streamer = _streamer(collector).start()
+    _publish(streamer, 35)
+    assert _wait_for(lambda: len(collector.events) == 35)
+    streamer.stop()
+    assert _positions(collector) == list(range(35))
+    assert streamer.stats['sent_events'] == 35
+    assert streamer.stats['reconnects'] == 0
+
+def test_resume_after_unacked_batch_is_not_duplicated(collector):
+    # 服务端收下第 2 批后断开且不确认，客户端重连后根据 last_seq 丢弃该批次而不是重发
+    collector.drop_after = 2
+    streamer = _streamer(collector).start()
+    _publish(streamer, 40)
+    assert _wait_for(lambda: len(collector.events) == 40)
+    streamer.stop()
+    assert _positions(collector) == list(range(40))
+    assert streamer.stats['reconnects'] == 1
+
+def test_restarted_client_continues_after_server_sequence(collector):
+    # 同一客户端 ID 重启后序号从服务端已确认的位置继续，新批次不会被当作重复丢弃
+    first = _streamer(collector).start()
+    _publish(first, 20)
+    assert _wait_for(lambda: len(collector.events) == 20)
+    first.stop()
+
+    second = _streamer(collector).start()
+    _publish(second, 20, start=20)
+    assert _wait_for(lambda: len(collector.events) == 40)
+    second.stop()
+    assert _positions(collector) == list(range(40))
+    assert collector.last_seq['test-client'] == 4
+
+def test_rejected_batch_is_retried(collector):
+    # 服务端返回 error 时不推进序号，客户端保留批次并在退避后重发
+    collector.fail_next = 1
+    streamer = _streamer(collector).start()
+    _publish(streamer, 30)
+    assert _wait_for(lambda: len(collector.events) == 30)
+    streamer.stop()
+    assert _positions(collector) == list(range(30))
+    assert streamer.stats['rejected_batches'] == 1
+    assert streamer.stats['sent_events'] == 30
+
+def test_backpressure_evicts_oldest_move_and_keeps_order(collector):
+    streamer = EventStreamer(collector.endpoint, client_id='test-client', capacity=4, batch_size=10, flush_interval=0.05, timeout=2.0)
+    for index, kind in enumerate(['move', 'click_press', 'move', 'move', 'click_press', 'move', 'click_press']):
+        streamer.accept(CaptureEvent(kind, index, 0, 1000.0 + index, {}))
+    assert streamer.buffered == 4
+    assert streamer.stats['dropped_moves'] == 3
+    streamer.start()
+    assert _wait_for(lambda: len(collector.events) == 4)
+    streamer.stop()
+    assert _positions(collector) == [1, 3, 4, 6]
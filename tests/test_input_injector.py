@@ -0,0 +1,68 @@
+import time
+
+from input_injector import (
+    BUTTON_DOWN, BUTTON_UP, MOVE, WHEEL, HWHEEL, FakeInjectionBackend, InputInjector
+)
+from replay_plan import compile_plan
+
+def _event(event_type, t, x=0, y=0, **params):
+    return {'type': event_type, 'position': (x, y), 'timestamp': t, 'params': params}
+
+def test_events_in_one_slot_are_injected_as_one_batch():
+    backend = FakeInjectionBackend()
+    injector = InputInjector(backend, slot=0.02)
+    events = [
+        _event('move', 0.0, 1, 1), _event('move', 0.001, 2, 2), _event('move', 0.002, 3, 3),
+        _event('move', 0.15, 4, 4), _event('move', 0.151, 5, 5)
+    ]
+    assert injector.play(events, time_origin=0.0) == 5
+    assert [len(batch) for batch in backend.batches] == [3, 2]
+    assert injector.stats.batches == 2
+    assert injector.stats.inputs == 5
+
+def test_event_types_map_to_actions():
+    backend = FakeInjectionBackend()
+    injector = InputInjector(backend)
+    injector.play([
+        _event('click_press', 0.0, 10, 20, button='right'),
+        _event('click_release', 0.0, 10, 20, button='right'),
+        _event('scroll_up', 0.0, 10, 20, dx=1, dy=2),
+        _event('idle', 0.0, 10, 20, duration=5.0),
+        _event('move', 0.0, 11, 21)
+    ], time_origin=0.0)
+    assert backend.actions == [
+        (BUTTON_DOWN, 10, 20, 'right'),
+        (BUTTON_UP, 10, 20, 'right'),
+        (WHEEL, 10, 20, 2),
+        (HWHEEL, 10, 20, 1),
+        (MOVE, 11, 21, None)
+    ]
+
+def test_playback_follows_timestamps():
+    backend = FakeInjectionBackend()
+    injector = InputInjector(backend, slot=0.002)
+    events = [_event('move', i * 0.05, i, i) for i in range(5)]
+    start = time.perf_counter()
+    injector.play(events, time_origin=0.0)
+    elapsed = time.perf_counter() - start
+    assert elapsed >= 0.2
+    assert len(backend.batches) == 5
+    assert injector.stats.max_lateness < 0.05
+
+def test_batch_cost_is_measured():
+    backend = FakeInjectionBackend(cost_per_input=0.002)
+    injector = InputInjector(backend, slot=0.01)
+    injector.play([_event('move', 0.0, i, i) for i in range(5)], time_origin=0.0)
+    snapshot = injector.stats.snapshot()
+    assert snapshot['batches'] == 1
+    assert snapshot['avg_batch_inputs'] == 5
+    assert snapshot['max_batch_us'] >= 10000
+
+def test_plan_batches_replayed_per_loop():
+    events = [_event('move', i * 0.01, i, i) for i in range(10)]
+    plan = compile_plan(events, slot=0.025, time_origin=0.0)
+    backend = FakeInjectionBackend()
+    injector = InputInjector(backend)
+    assert injector.play_plan(plan, loops=2) == 20
+    assert len(backend.batches) == 2 * plan.batch_count
+    assert backend.actions == plan.actions() * 2
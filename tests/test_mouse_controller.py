@@ -0,0 +1,53 @@
+import threading
+import time
+
+import pytest
+
+from mouse_controller import FakeHookBackend, MouseController
+
+ORIGIN = (10, 20)
+
+@pytest.fixture
+def controller():
+    backend = FakeHookBackend()
+    backend.cursor_pos = ORIGIN
+    controller = MouseController(backend=backend)
+    yield controller
+    controller.enable()
+
+def test_hook_runs_on_its_own_thread(controller):
+    backend = controller.backend
+    controller.disable()
+    assert backend.installed
+    assert backend.install_thread is not threading.current_thread()
+    controller.enable()
+    assert not backend.installed
+
+def test_events_blocked_only_while_disabled(controller):
+    backend = controller.backend
+    assert backend.emit(2) == [False, False]
+    controller.disable()
+    assert backend.emit(3) == [True, True, True]
+    controller.enable()
+    assert backend.emit(1) == [False]
+    assert controller.get_hook_stats()['blocked'] == 3
+
+def test_pin_is_throttled(controller):
+    backend = controller.backend
+    controller.pin_interval = 60.0
+    controller.disable()
+    backend.emit(100)
+    assert backend.cursor_moves == [ORIGIN]
+    stats = controller.get_hook_stats()
+    assert stats['pins'] == 1
+    assert stats['blocked'] == 100
+    assert stats['count'] == 100
+
+def test_pin_repeats_after_interval(controller):
+    backend = controller.backend
+    controller.pin_interval = 0.02
+    controller.disable()
+    backend.emit(5)
+    time.sleep(0.05)
+    backend.emit(5)
+    assert backend.cursor_moves == [ORIGIN, ORIGIN]
@@ -5,7 +5,7 @@
 
 import json
 import os
-import logging
+from log_config import get_logger
 from typing import Dict, Any
 from dataclasses import dataclass, asdict
 
@@ -42,8 +42,7 @@ class ThemeManager:
     
     def _setup_logging(self):
         """配置日志"""
-        self.logger = logging.getLogger('theme')
-        self.logger.setLevel(logging.INFO)
+        self.logger = get_logger('theme')
     
     def _load_config(self):
         """加载主题配置"""